@@ -1,28 +1,431 @@
+import math
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Iterable, List, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
 # Database URL - defaults to SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./carbon_tracker.db")
 
+# Serve requests through SQLAlchemy's asyncio extension instead of the sync Session
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# asyncio drivers used when DATABASE_ASYNC is on
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Rewrite a sync database URL to use its asyncio driver"""
+    scheme, separator, rest = url.partition("://")
+    if scheme in ASYNC_DRIVERS.values():
+        return url
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for database '{dialect}'")
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+# Connection pool - ignored for in-memory SQLite and aiosqlite, which do not use a queue pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which connections are replaced; -1 keeps them forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING")
+
+# SQLite tuning: WAL lets readers run alongside the single writer
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB, so this is a 64 MiB page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+}
+
+def uses_queue_pool(url: str) -> bool:
+    if url.startswith("sqlite+aiosqlite"):
+        return False
+    return not url.startswith("sqlite") or not (":memory:" in url or url.rstrip("/").endswith(":"))
+
+def engine_options(url: str) -> dict:
+    """create_engine keyword arguments for the pool settings above"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if uses_queue_pool(url):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Apply SQLITE_PRAGMAS to a new DBAPI connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if name == "journal_mode" and not value:
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def effective_sqlite_pragmas(connection) -> dict:
+    """Read the tuned pragmas back from a live connection"""
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS}
+
+def make_engine(url: str):
+    """Sync engine with the pool settings, plus the pragmas on SQLite"""
+    if url.startswith("sqlite"):
+        sync_engine = create_engine(url, connect_args={"check_same_thread": False}, **engine_options(url))
+        event.listen(sync_engine, "connect", apply_sqlite_pragmas)
+        return sync_engine
+    return create_engine(url, **engine_options(url))
+
+def make_async_engine(url: str):
+    """Async engine with the pool settings, plus the pragmas on SQLite"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(url, **engine_options(url))
+    if url.startswith("sqlite"):
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine
+
 # Create engine
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+engine = make_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine - only created when async mode is enabled
+async_engine = None
+AsyncSessionLocal = None
+
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", get_async_database_url(DATABASE_URL))
+    async_engine = make_async_engine(ASYNC_DATABASE_URL)
+    # Objects stay loaded after commit so responses never trigger lazy IO
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# Create missing tables on startup; turn off when a deploy step (create_tables.py) owns the schema
+DB_SCHEMA_CHECK = _env_flag("DB_SCHEMA_CHECK", "true")
+
+def init_db() -> List[str]:
+    """Create any missing tables, and indexes missing on existing tables; return their names"""
+    # Importing the models registers their tables on Base
+    from .models import database as models  # noqa: F401
+
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    missing = [table for table in Base.metadata.sorted_tables if table.name not in existing]
+    if missing:
+        # checkfirst covers another worker creating the same tables meanwhile
+        Base.metadata.create_all(bind=engine, tables=missing, checkfirst=True)
+    created = [table.name for table in missing]
+
+    # create_all() skips tables that exist, so indexes added to a model later are created here
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        indexed = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in indexed:
+                index.create(bind=engine, checkfirst=True)
+                created.append(index.name)
+    return created
+
+def describe_database() -> str:
+    """One-line summary of the effective engine, pool and SQLite settings"""
+    pool = engine.pool
+    parts = [f"dialect={engine.dialect.name}", f"pool={type(pool).__name__}"]
+    if isinstance(pool, QueuePool):
+        parts += [f"size={pool.size()}", f"max_overflow={pool._max_overflow}", f"timeout={pool._timeout}s"]
+    parts += [f"pre_ping={DB_POOL_PRE_PING}", f"recycle={DB_POOL_RECYCLE}"]
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            parts += [f"{name}={value}" for name, value in effective_sqlite_pragmas(connection).items()]
+    parts.append(f"async={'on' if DATABASE_ASYNC else 'off'}")
+    parts.append(f"replica={'on' if DATABASE_REPLICA_URL else 'off'}")
+    return " ".join(parts)
+
+def dialect_insert(bind, table):
+    """INSERT construct for the bound dialect, with its ON CONFLICT support"""
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    if bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT is not supported on '{bind.dialect.name}'")
+
+class SyncSessionAdapter:
+    """Expose a sync Session through the awaitable subset of AsyncSession.
+
+    Lets the routers keep one code path for both modes. Calls still run
+    synchronously on the event loop, which is the behaviour async mode is
+    measured against.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return self.sync_session.execute(statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return self.sync_session.scalar(statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return self.sync_session.scalars(statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def flush(self):
+        self.sync_session.flush()
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        self.sync_session.close()
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an AsyncSession (requires DATABASE_ASYNC)
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database mode is disabled; set DATABASE_ASYNC=true")
+    async with AsyncSessionLocal() as session:
+        yield session
+
+@asynccontextmanager
+async def open_session(session_factory=None, async_session_factory=None):
+    """AsyncSession or the sync adapter, per DATABASE_ASYNC (primary database by default)"""
+    if DATABASE_ASYNC:
+        async with (async_session_factory or AsyncSessionLocal)() as session:
+            yield session
+    else:
+        db = (session_factory or SessionLocal)()
+        try:
+            yield SyncSessionAdapter(db)
+        finally:
+            db.close()
+
+# Dependency used by the routers - AsyncSession or the sync adapter, per DATABASE_ASYNC
+async def get_session():
+    async with open_session() as session:
+        yield session
+
+# Optional read replica for read-only endpoints; writes always go to DATABASE_URL
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# After writing, a user's reads go to the primary for this long
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+# How often the replica's health (and on Postgres, its lag) is re-checked
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+
+# Set on write responses so the client's next reads hit the primary, whichever worker serves them
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Replay lag of a Postgres standby; 0 when it has replayed everything it received
+POSTGRES_REPLICA_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+class ReadReplica:
+    """Routes read-only sessions to a replica while it is healthy and fresh.
+
+    Reads fall back to the primary when no replica is configured, when
+    the last health check failed or found it lagging, after a replica
+    query fails, and for users who wrote within `sticky_seconds` (their
+    email is remembered per worker, and a cookie carries the deadline
+    across workers).
+    """
+
+    def __init__(self, sticky_seconds: float = 10, health_interval: float = 5, max_lag_seconds: float = 5):
+        self.sticky_seconds = sticky_seconds
+        self.health_interval = health_interval
+        self.max_lag_seconds = max_lag_seconds
+        self.engine = None
+        self.async_engine = None
+        self.session_factory = None
+        self.async_session_factory = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.checked_at = -math.inf
+        self.reads = {"replica": 0, "primary": 0}
+        self.failures = 0
+        # email -> monotonic deadline, oldest first
+        self._recent_writes: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def configure(self, url: Optional[str]) -> None:
+        """Point at a replica URL, or at none to read from the primary only"""
+        for old in (self.engine, self.async_engine and self.async_engine.sync_engine):
+            if old is not None:
+                old.dispose()
+        self.engine = self.async_engine = self.session_factory = self.async_session_factory = None
+        self.healthy, self.lag, self.checked_at = False, None, -math.inf
+        if not url:
+            return
+        self.engine = make_engine(url)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        if DATABASE_ASYNC:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+
+            async_url = os.getenv("ASYNC_DATABASE_REPLICA_URL", get_async_database_url(url))
+            self.async_engine = make_async_engine(async_url)
+            self.async_session_factory = async_sessionmaker(
+                self.async_engine, autoflush=False, expire_on_commit=False
+            )
+
+    def note_write(self, emails: Iterable[str]) -> None:
+        """Send these users' reads to the primary for the next `sticky_seconds`"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        deadline = now + self.sticky_seconds
+        with self._lock:
+            for email in emails:
+                self._recent_writes[email] = deadline
+                self._recent_writes.move_to_end(email)
+            while self._recent_writes and next(iter(self._recent_writes.values())) <= now:
+                self._recent_writes.popitem(last=False)
+
+    def wrote_recently(self, email: Optional[str]) -> bool:
+        if not email:
+            return False
+        with self._lock:
+            deadline = self._recent_writes.get(email)
+        return deadline is not None and deadline > time.monotonic()
+
+    def _record_health(self, lag: Optional[float]) -> None:
+        self.lag = lag
+        self.healthy = lag is None or lag <= self.max_lag_seconds
+        if not self.healthy:
+            print(f"Read replica is {lag:.1f}s behind; reading from the primary")
+
+    def mark_failed(self, error: Exception) -> None:
+        """Stop using the replica until the next health check succeeds"""
+        if self.healthy:
+            print(f"Read replica failed; reading from the primary: {error}")
+        self.healthy = False
+        self.failures += 1
+
+    def probe(self) -> bool:
+        """Check that the replica answers and is not too far behind"""
+        try:
+            with self.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = connection.execute(POSTGRES_REPLICA_LAG).scalar()
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag = None
+            self._record_health(float(lag) if lag is not None else None)
+        except DBAPIError as e:
+            self.mark_failed(e)
+        return self.healthy
+
+    async def probe_async(self) -> bool:
+        try:
+            async with self.async_engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = (await connection.execute(POSTGRES_REPLICA_LAG)).scalar()
+                else:
+                    await connection.execute(text("SELECT 1"))
+                    lag = None
+            self._record_health(float(lag) if lag is not None else None)
+        except DBAPIError as e:
+            self.mark_failed(e)
+        return self.healthy
+
+    async def available(self) -> bool:
+        """Whether the replica may serve a read, re-checking its health when due"""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if now - self.checked_at < self.health_interval:
+            return self.healthy
+        # Claim the check first so concurrent requests do not all probe
+        self.checked_at = now
+        if DATABASE_ASYNC:
+            return await self.probe_async()
+        return await run_in_threadpool(self.probe)
+
+    def read_primary_requested(self, request: Request) -> bool:
+        """Whether this request must see the primary for read-your-writes"""
+        email = request.path_params.get("email") or request.query_params.get("user_email")
+        if self.wrote_recently(email):
+            return True
+        try:
+            return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+# Global instance
+read_replica = ReadReplica(REPLICA_STICKY_SECONDS, REPLICA_HEALTH_INTERVAL, REPLICA_MAX_LAG_SECONDS)
+read_replica.configure(DATABASE_REPLICA_URL)
+
+def read_primary_cookie_value() -> str:
+    """Cookie value asking for primary reads until the sticky window ends"""
+    return f"{time.time() + REPLICA_STICKY_SECONDS:.3f}"
+
+# Dependency for read-only endpoints - a replica session when one is usable, else the primary
+async def get_read_session(request: Request):
+    if read_replica.read_primary_requested(request) or not await read_replica.available():
+        read_replica.reads["primary"] += 1
+        async with open_session() as session:
+            yield session
+        return
+
+    read_replica.reads["replica"] += 1
+    try:
+        async with open_session(read_replica.session_factory, read_replica.async_session_factory) as session:
+            yield session
+    except DBAPIError as e:
+        # This request fails; the following ones read from the primary
+        read_replica.mark_failed(e)
+        raise
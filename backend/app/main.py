@@ -1,17 +1,51 @@
+import time
+
+# Measured from the first import, to report how long a worker takes to boot
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
-from dotenv import load_dotenv
 
-from .database import engine, Base
-from .routers import emissions, users
+# Importing app.database loads the .env file
+from .database import DB_SCHEMA_CHECK, engine, async_engine, describe_database, init_db, read_replica
+from .routers import analytics, emissions, users
+from .services.analytics_service import activity_analytics
+from .services.emission_service import emission_service
+from .services.live_service import live_updates
+from .services.metrics_service import METRICS_ENABLED, MetricsMiddleware, instrument_engine, registry
+from .services.ranking_service import user_ranking
+from .services.write_buffer import activity_buffer
 
-# Load environment variables
-load_dotenv()
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_started = time.perf_counter()
+    # Schema check runs once per worker at startup, never at import time
+    if DB_SCHEMA_CHECK:
+        created = init_db()
+        if created:
+            print(f"Created database tables and indexes: {', '.join(created)}")
+    print(f"Database settings: {describe_database()}")
+    emission_service.load()
+    # Start background workers, and drain them on shutdown
+    await activity_buffer.start()
+    emission_service.start_watching()
+    await user_ranking.start()
+    await activity_analytics.start()
+    await live_updates.start()
+    print(
+        f"Startup complete: import {IMPORT_SECONDS * 1000:.0f} ms, "
+        f"startup {(time.perf_counter() - startup_started) * 1000:.0f} ms"
+    )
+    yield
+    emission_service.stop_watching()
+    await activity_buffer.stop()
+    await user_ranking.stop()
+    await activity_analytics.stop()
+    await live_updates.stop()
 
 # Create FastAPI app
 app = FastAPI(
@@ -19,7 +53,8 @@ app = FastAPI(
     description="API for calculating and tracking carbon emissions",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -31,11 +66,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Instrumentation - added last so it wraps every other middleware
+if METRICS_ENABLED:
+    instrument_engine(engine, "sync")
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine, "async")
+    if read_replica.engine is not None:
+        instrument_engine(read_replica.engine, "replica")
+    if read_replica.async_engine is not None:
+        instrument_engine(read_replica.async_engine.sync_engine, "replica_async")
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(emissions.router)
 app.include_router(users.router)
+app.include_router(analytics.router)
 
 @app.get("/")
 async def root():
@@ -55,6 +103,12 @@ async def health_check():
         "message": "API is running successfully"
     }
 
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus metrics"""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     return JSONResponse(
@@ -67,4 +121,6 @@ async def internal_server_error_handler(request, exc):
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
-    )
\ No newline at end of file
+    )
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
@@ -1,8 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Index, Text
 from sqlalchemy.sql import func
 
-Base = declarative_base()
+from ..database import Base
 
 class User(Base):
     __tablename__ = "users"
@@ -20,4 +19,55 @@ class Activity(Base):
     activity_type = Column(String(100), index=True)
     quantity = Column(Float)
     co2_emissions = Column(Float)  # kg of CO2
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        # Serves keyset-paginated history: WHERE user_email = ? ORDER BY created_at, id
+        Index("ix_activities_user_email_created_at_id", "user_email", "created_at", "id"),
+    )
+
+class EmissionRollup(Base):
+    """Per-user CO2 totals by period bucket and category, kept up to date on write"""
+    __tablename__ = "emission_rollups"
+    
+    user_email = Column(String(255), primary_key=True)
+    period = Column(String(10), primary_key=True)  # day | week | month
+    period_start = Column(Date, primary_key=True)
+    category = Column(String(100), primary_key=True)
+    total_co2 = Column(Float, nullable=False, default=0.0)  # kg of CO2
+    activity_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Serves period-wide scans such as the ranking rebuild
+        Index("ix_emission_rollups_period_start", "period", "period_start"),
+    )
+
+class ArchivedUser(Base):
+    """Users with activities in the Parquet archive, and how far their archived rows reach"""
+    __tablename__ = "archived_users"
+    
+    user_email = Column(String(255), primary_key=True)
+    activity_count = Column(Integer, nullable=False, default=0)
+    max_created_at = Column(DateTime(timezone=True), nullable=False)  # newest archived activity
+
+class JobCheckpoint(Base):
+    """Progress of a resumable background job run, keyed by job name and run"""
+    __tablename__ = "job_checkpoints"
+    
+    job_name = Column(String(100), primary_key=True)
+    run_key = Column(String(100), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)  # highest id fully processed
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default="running")  # running | completed | failed
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RankingSnapshot(Base):
+    """Persisted bucket counts of the monthly user-ranking sketch"""
+    __tablename__ = "ranking_snapshots"
+    
+    period_start = Column(Date, primary_key=True)
+    relative_accuracy = Column(Float, nullable=False)
+    users = Column(Integer, nullable=False, default=0)
+    buckets = Column(Text, nullable=False)  # JSON {bucket index: count}
+    updated_at = Column(DateTime(timezone=True), nullable=False)
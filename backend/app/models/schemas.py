@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+MAX_BATCH_SIZE = 1000
 
 class EmissionCalculationRequest(BaseModel):
     activity_type: str
@@ -12,6 +14,38 @@ class EmissionCalculationResponse(BaseModel):
     quantity: float
     co2_emissions: float
     unit: str
+    factor_version: Optional[str] = None
+
+class EmissionBatchRequest(BaseModel):
+    items: List[EmissionCalculationRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class EmissionBatchItemResult(BaseModel):
+    index: int
+    activity_type: str
+    quantity: float
+    co2_emissions: Optional[float] = None
+    unit: Optional[str] = None
+    error: Optional[str] = None
+
+class EmissionBatchResponse(BaseModel):
+    results: List[EmissionBatchItemResult]
+    succeeded: int
+    failed: int
+    total_co2_emissions: float
+    saved: int
+    factor_version: Optional[str] = None
+
+class FactorTableInfo(BaseModel):
+    version: str
+    loaded_at: datetime
+    activities: int
+    reloads: int
+    reload_errors: int
+    watching: bool
+
+class FactorReloadResponse(BaseModel):
+    changed: bool
+    factors: FactorTableInfo
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -38,4 +72,101 @@ class ActivityResponse(BaseModel):
         from_attributes = True
 
 class WeeklyTipRequest(BaseModel):
-    email: EmailStr
\ No newline at end of file
+    email: EmailStr
+
+class RollupBucket(BaseModel):
+    period_start: date
+    total_co2: float
+    activity_count: int
+    categories: Dict[str, float]
+
+class EmissionSummaryResponse(BaseModel):
+    user_email: str
+    period: str
+    total_co2: float
+    activity_count: int
+    buckets: List[RollupBucket]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    accepted: int
+    rejected: int
+    total_co2_emissions: float
+    errors: List[ImportRowError]
+
+class UserRankResponse(BaseModel):
+    user_email: str
+    period_start: date
+    total_co2: float
+    users: int
+    percentile: float
+    emits_less_than_percent: Optional[float] = None
+    max_error_percent: float
+    relative_accuracy: float
+    as_of: Optional[datetime] = None
+    live: bool
+
+class AnalyticsRow(BaseModel):
+    category: Optional[str] = None
+    activity_type: Optional[str] = None
+    period_start: Optional[date] = None
+    total_co2: float
+    activity_count: int
+
+class AnalyticsResponse(BaseModel):
+    group_by: List[str]
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    rows: List[AnalyticsRow]
+    total_co2: float
+    activity_count: int
+    rows_loaded: int
+    source: str
+    as_of: Optional[datetime] = None
+    elapsed_ms: float
+
+class ScenarioRule(BaseModel):
+    from_activity: str
+    # None drops the quantity instead of moving it
+    to_activity: Optional[str] = None
+    adoption: float = Field(..., ge=0, le=1)
+    adoption_sd: float = Field(0.05, ge=0, le=0.5)
+    shift: float = Field(1.0, ge=0, le=1)
+    conversion: float = Field(1.0, gt=0)
+
+class ScenarioRequest(BaseModel):
+    rules: List[ScenarioRule] = Field(..., min_length=1, max_length=20)
+    samples: int = Field(10000, ge=100, le=100000)
+    factor_uncertainty: float = Field(0.1, ge=0, le=1)
+    lookback_days: int = Field(365, ge=7, le=3650)
+    seed: Optional[int] = None
+
+class DistributionSummary(BaseModel):
+    mean: float
+    std: float
+    p5: float
+    p50: float
+    p95: float
+
+class ScenarioRuleResult(BaseModel):
+    from_activity: str
+    to_activity: Optional[str] = None
+    affected_users: int
+    baseline_quantity: float
+    reduction_co2: DistributionSummary
+
+class ScenarioResponse(BaseModel):
+    users: int
+    samples: int
+    lookback_days: int
+    factor_version: str
+    baseline_co2: DistributionSummary
+    scenario_co2: DistributionSummary
+    reduction_co2: DistributionSummary
+    reduction_percent: DistributionSummary
+    rules: List[ScenarioRuleResult]
+    elapsed_ms: float
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
+
+from ..models.schemas import AnalyticsResponse
+from ..services.analytics_service import activity_analytics
+from ..services.pagination import to_utc
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+@router.get("/emissions", response_model=AnalyticsResponse, response_model_exclude_none=True)
+async def get_emission_breakdown(
+    group_by: List[Literal["category", "activity_type", "day", "week", "month"]] = Query(["category"]),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    activity_type: Optional[str] = None,
+    category: Optional[str] = None,
+    user_email: Optional[str] = None
+):
+    """Org-wide CO2 totals grouped by category, activity type and/or a time bucket.
+
+    Answered from the in-memory columnar copy of all activities (archived
+    ones included), so it never queries the activities table. The copy
+    trails writes by up to ANALYTICS_REFRESH_SECONDS; `as_of` says when
+    it was last refreshed.
+    """
+    if not activity_analytics.enabled:
+        raise HTTPException(status_code=503, detail="Analytics are disabled")
+    try:
+        return await run_in_threadpool(
+            activity_analytics.query, group_by, to_utc(start), to_utc(end), activity_type, category, user_email
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
@@ -1,34 +1,167 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+import math
+import os
+from datetime import date, datetime
 
-from ..database import get_db
-from ..models.database import Activity, User
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, File, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import EmailStr
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+
+from ..database import (
+    READ_PRIMARY_COOKIE,
+    REPLICA_STICKY_SECONDS,
+    engine,
+    get_read_session,
+    get_session,
+    read_primary_cookie_value,
+    read_replica
+)
+from ..models.database import Activity, EmissionRollup
 from ..models.schemas import (
     EmissionCalculationRequest, 
     EmissionCalculationResponse,
-    UserCreate,
-    UserResponse,
-    ActivityResponse
+    EmissionBatchRequest,
+    EmissionBatchItemResult,
+    EmissionBatchResponse,
+    ActivityResponse,
+    RollupBucket,
+    EmissionSummaryResponse,
+    ImportReport,
+    FactorTableInfo,
+    FactorReloadResponse,
+    UserRankResponse,
+    ScenarioRequest,
+    ScenarioResponse
+)
+from ..services.activity_service import activity_row, save_activities
+from ..services.archive_service import activity_archive, archived_until, merge_newest_first
+from ..services.checkpoint_service import RunInProgressError
+from ..services.emission_service import SerializedBody, emission_service
+from ..services.export_service import iter_activity_chunks, stream_csv, stream_ndjson
+from ..services.import_service import import_activities
+from ..services.live_service import live_updates
+from ..services.metrics_service import timed_task
+from ..services.pagination import (
+    InvalidCursorError,
+    decode_timestamp_cursor,
+    encode_cursor,
+    newest_first_after,
+    to_utc
+)
+from ..services.ranking_service import RankingNotReadyError, user_ranking
+from ..services.recalculation_service import (
+    claim_recalculation_run,
+    default_run_key,
+    get_recalculation_progress,
+    run_recalculation
 )
-from ..services.emission_service import emission_service
+from ..services.scenario_service import scenario_engine
+from ..services.serialization import rows_response
+from ..services.write_buffer import activity_buffer
 
 router = APIRouter(prefix="/api/emissions", tags=["emissions"])
 
+# Catalog responses may be cached this long by browsers and CDNs, then revalidated by ETag
+CATALOG_CACHE_CONTROL = f"public, max-age={int(os.getenv('CATALOG_CACHE_MAX_AGE', '300'))}"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def cached_json_response(request: Request, serialized: SerializedBody) -> Response:
+    """Serve pre-encoded JSON, or 304 when the client already holds this version"""
+    headers = {"ETag": serialized.etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), serialized.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(serialized.body, media_type="application/json", headers=headers)
+
+def read_primary_after_write(response: Response) -> None:
+    """Let the client's next reads see its write, whichever worker serves them"""
+    if read_replica.enabled:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, read_primary_cookie_value(),
+            max_age=math.ceil(REPLICA_STICKY_SECONDS), httponly=True, samesite="lax"
+        )
+
 @router.get("/activities")
-async def get_all_activities():
+async def get_all_activities(request: Request):
     """Get all available activities organized by category"""
-    return emission_service.get_all_activities()
+    return cached_json_response(request, emission_service.table.activities_body)
 
 @router.get("/categories")
-async def get_activity_categories():
+async def get_activity_categories(request: Request):
     """Get list of all activity categories"""
-    return {"categories": emission_service.get_activity_categories()}
+    return cached_json_response(request, emission_service.table.categories_body)
+
+@router.get("/factors", response_model=FactorTableInfo)
+async def get_factor_table_info():
+    """Get the version of the emission factor table in use"""
+    return emission_service.info()
+
+@router.post("/factors/reload", response_model=FactorReloadResponse)
+async def reload_factor_table():
+    """Re-read emission_factors.json and swap it in if it changed.
+
+    The file is parsed and validated in the threadpool; an invalid file
+    is rejected and the current table keeps serving. Each worker process
+    holds its own table, so multi-worker deployments should enable
+    EMISSION_FACTORS_WATCH instead.
+    """
+    try:
+        changed = await run_in_threadpool(emission_service.reload)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Emission factors not reloaded: {e}")
+    return FactorReloadResponse(changed=changed, factors=emission_service.info())
+
+@router.post("/factors/recalculate")
+async def recalculate_stored_emissions(
+    background_tasks: BackgroundTasks,
+    run_key: Optional[str] = None,
+    activity_type: List[str] = Query([])
+):
+    """Re-price stored activities against the current factor table (admin).
+
+    Runs in the background in small throttled chunks and resumes an
+    unfinished run with the same key. The default key is the factor
+    table version, so repeating it after a completed run is a no-op.
+    """
+    table = emission_service.table
+    unknown = [key for key in activity_type if key not in table.index]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown activity types: {', '.join(unknown)}")
+
+    run_key = run_key or default_run_key(activity_type, table)
+    try:
+        progress = await run_in_threadpool(claim_recalculation_run, run_key)
+    except RunInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if progress["status"] == "completed":
+        return {"message": "Recalculation already completed", "run_key": run_key}
+    background_tasks.add_task(
+        timed_task("recalculate_emissions", run_recalculation), run_key, activity_type or None, claimed=True
+    )
+
+    return {"message": "Recalculation started", "run_key": run_key}
+
+@router.get("/factors/recalculate/{run_key}")
+async def get_recalculation_status(run_key: str):
+    """Get the progress of a recalculation run"""
+    progress = await run_in_threadpool(get_recalculation_progress, run_key)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Recalculation run not found")
+    return progress
 
 @router.post("/calculate", response_model=EmissionCalculationResponse)
 async def calculate_emissions(
     request: EmissionCalculationRequest,
-    db: Session = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_session)
 ):
     """Calculate CO2 emissions for a given activity"""
     
@@ -43,32 +176,294 @@ async def calculate_emissions(
     
     # Save activity to database if user email is provided
     if request.user_email:
-        # Check if user exists, create if not
-        user = db.query(User).filter(User.email == request.user_email).first()
-        if not user:
-            user = User(email=request.user_email)
-            db.add(user)
-            db.commit()
-        
-        # Save activity
-        activity = Activity(
-            user_email=request.user_email,
-            activity_type=request.activity_type,
-            quantity=request.quantity,
-            co2_emissions=result["co2_emissions"]
+        row = activity_row(
+            request.user_email,
+            request.activity_type,
+            request.quantity,
+            result["co2_emissions"]
         )
-        db.add(activity)
-        db.commit()
+        # Hand off to the write-behind buffer when it is running, else write now
+        if not await activity_buffer.enqueue(row):
+            await db.run_sync(save_activities, [row])
+        read_primary_after_write(response)
     
     return EmissionCalculationResponse(
         activity_type=result["activity_type"],
         quantity=result["quantity"],
         co2_emissions=result["co2_emissions"],
-        unit=result["unit"]
+        unit=result["unit"],
+        factor_version=result["factor_version"]
+    )
+
+@router.post("/calculate/batch", response_model=EmissionBatchResponse)
+async def calculate_emissions_batch(
+    request: EmissionBatchRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_session)
+):
+    """Calculate CO2 emissions for many activities in a single request"""
+    
+    items = request.items
+    # Price the whole batch against one factor table, even if a reload lands meanwhile
+    table = emission_service.table
+    emissions = emission_service.calculate_emissions_batch(
+        [item.activity_type for item in items],
+        [item.quantity for item in items],
+        table=table
     )
+    units = {
+        activity_type: table.index[activity_type].unit
+        for activity_type in {item.activity_type for item in items}
+        if activity_type in table.index
+    }
+    
+    results = []
+    activity_rows = []
+    for index, (item, co2) in enumerate(zip(items, emissions.tolist())):
+        if math.isnan(co2):
+            results.append(EmissionBatchItemResult(
+                index=index,
+                activity_type=item.activity_type,
+                quantity=item.quantity,
+                error=f"Activity type '{item.activity_type}' not found"
+            ))
+            continue
+        
+        results.append(EmissionBatchItemResult(
+            index=index,
+            activity_type=item.activity_type,
+            quantity=item.quantity,
+            co2_emissions=co2,
+            unit=units[item.activity_type]
+        ))
+        if item.user_email:
+            activity_rows.append(activity_row(item.user_email, item.activity_type, item.quantity, co2))
+    
+    # Save all activities in one transaction: missing users first, then one bulk insert
+    if activity_rows:
+        await db.run_sync(save_activities, activity_rows)
+        read_primary_after_write(response)
+    
+    succeeded = [result for result in results if result.error is None]
+    return EmissionBatchResponse(
+        results=results,
+        succeeded=len(succeeded),
+        failed=len(results) - len(succeeded),
+        total_co2_emissions=round(sum(result.co2_emissions for result in succeeded), 3),
+        saved=len(activity_rows),
+        factor_version=table.version
+    )
+
+@router.get("/write-buffer")
+async def get_write_buffer_stats():
+    """Get counters for the activity write-behind buffer"""
+    return activity_buffer.stats()
+
+@router.get("/live/{email}")
+async def stream_user_updates(email: str):
+    """Server-Sent Events stream of a user's new activities and running CO2 total.
+
+    Starts with a `total` event, then sends an `activity` event for each
+    activity saved for the user and a fresh `total` after them. A
+    `dropped` event means activities were skipped (the client fell behind)
+    and the history should be re-read. Idle streams get a comment line
+    every LIVE_UPDATES_KEEPALIVE_SECONDS. Holds no database connection.
+    """
+    if not live_updates.enabled:
+        raise HTTPException(status_code=503, detail="Live updates are disabled")
+    subscription = live_updates.subscribe(email)
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many open live-update streams")
+    return StreamingResponse(
+        live_updates.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/live-stats")
+async def get_live_update_stats():
+    """Get counters for the live-update streams on this worker"""
+    return live_updates.stats()
+
+HISTORY_COLUMNS = tuple(ActivityResponse.model_fields)
 
 @router.get("/history/{email}", response_model=List[ActivityResponse])
-async def get_user_history(email: str, db: Session = Depends(get_db)):
-    """Get emission calculation history for a user"""
-    activities = db.query(Activity).filter(Activity.user_email == email).order_by(Activity.created_at.desc()).limit(50).all()
-    return activities
\ No newline at end of file
+async def get_user_history(
+    email: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    activity_type: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """Get emission calculation history for a user, newest first.
+
+    Pages are keyed on (created_at, id) and served from the
+    (user_email, created_at, id) index. When more rows exist, the
+    X-Next-Cursor header holds the cursor for the next page.
+    """
+    query = select(*(getattr(Activity, column) for column in HISTORY_COLUMNS)).where(Activity.user_email == email)
+    if activity_type:
+        query = query.where(Activity.activity_type == activity_type)
+    if start:
+        query = query.where(Activity.created_at >= to_utc(start))
+    if end:
+        query = query.where(Activity.created_at < to_utc(end))
+    if cursor:
+        try:
+            last_created_at, last_id = decode_timestamp_cursor(cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            newest_first_after(Activity.created_at, Activity.id, last_created_at, last_id, engine.dialect.name)
+        )
+    
+    # Fetch one extra row to know whether there is a next page
+    result = await db.execute(
+        query.order_by(Activity.created_at.desc(), Activity.id.desc()).limit(limit + 1)
+    )
+    rows = result.all()
+    # Only users with archived rows pay for reading the archive
+    archived = await db.run_sync(archived_until, email)
+    if archived is not None:
+        # A full page that ends after the user's newest archived row cannot include archived rows
+        if len(rows) <= limit or rows[-1].created_at <= archived:
+            cold = await run_in_threadpool(
+                activity_archive.history_page, email, limit + 1, to_utc(start), to_utc(end), activity_type,
+                (last_created_at, last_id) if cursor else None
+            )
+            rows = merge_newest_first(rows, cold, limit + 1)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    # Column tuples straight to JSON bytes; response_model only documents the shape
+    return rows_response(HISTORY_COLUMNS, rows, headers)
+
+@router.get("/summary/{email}", response_model=EmissionSummaryResponse)
+async def get_user_summary(
+    email: str,
+    period: Literal["day", "week", "month"] = "month",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """Get a user's CO2 totals per day, week or month, broken down by category.
+
+    Served from the incrementally maintained rollups, so the cost depends on
+    the number of buckets rather than the number of activities.
+    """
+    query = select(EmissionRollup).where(
+        EmissionRollup.user_email == email,
+        EmissionRollup.period == period
+    )
+    if start:
+        query = query.where(EmissionRollup.period_start >= start)
+    if end:
+        query = query.where(EmissionRollup.period_start < end)
+    result = await db.execute(query.order_by(EmissionRollup.period_start))
+    
+    buckets = {}
+    for rollup in result.scalars():
+        bucket = buckets.setdefault(rollup.period_start, RollupBucket(
+            period_start=rollup.period_start,
+            total_co2=0.0,
+            activity_count=0,
+            categories={}
+        ))
+        bucket.total_co2 += rollup.total_co2
+        bucket.activity_count += rollup.activity_count
+        bucket.categories[rollup.category] = round(rollup.total_co2, 3)
+    
+    for bucket in buckets.values():
+        bucket.total_co2 = round(bucket.total_co2, 3)
+    
+    return EmissionSummaryResponse(
+        user_email=email,
+        period=period,
+        total_co2=round(sum(bucket.total_co2 for bucket in buckets.values()), 3),
+        activity_count=sum(bucket.activity_count for bucket in buckets.values()),
+        buckets=list(buckets.values())
+    )
+
+@router.get("/rank/{email}", response_model=UserRankResponse)
+async def get_user_rank(email: str, db: AsyncSession = Depends(get_session)):
+    """Rank a user's CO2 total for the current month against all active users.
+
+    Answered from an in-memory sketch of every user's monthly total, so the
+    cost does not grow with the number of users. `max_error_percent` bounds
+    the percentile error: only users whose totals are within
+    `relative_accuracy` of this user's can be ranked on the wrong side.
+    """
+    if not user_ranking.enabled:
+        raise HTTPException(status_code=503, detail="User ranking is disabled")
+    try:
+        return await db.run_sync(user_ranking.rank, email)
+    except RankingNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+@router.post("/scenarios/simulate", response_model=ScenarioResponse)
+async def simulate_scenario(request: ScenarioRequest):
+    """Project the annual CO2 change of moving users between activities.
+
+    Runs `samples` Monte Carlo draws of emission factors and adoption rates
+    over all users' activity in the last `lookback_days`, annualized, and
+    returns mean, spread and 5th/50th/95th percentiles of the outcome.
+    """
+    try:
+        return await run_in_threadpool(
+            scenario_engine.simulate,
+            [rule.model_dump() for rule in request.rules],
+            request.samples,
+            request.factor_uncertainty,
+            request.lookback_days,
+            request.seed
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/export/{email}")
+async def export_user_history(
+    email: str,
+    format: Literal["csv", "ndjson"] = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Stream a user's complete activity history as CSV or NDJSON"""
+    chunks = iter_activity_chunks(email, to_utc(start), to_utc(end))
+    if format == "ndjson":
+        body, media_type, extension = stream_ndjson(chunks), "application/x-ndjson", "ndjson"
+    else:
+        body, media_type, extension = stream_csv(chunks), "text/csv", "csv"
+    
+    # Sync generators are iterated in the threadpool, off the event loop
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="activities.{extension}"'}
+    )
+
+@router.post("/import", response_model=ImportReport)
+async def import_user_activities(
+    response: Response,
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    user_email: Optional[EmailStr] = None
+):
+    """Bulk import activities from a CSV or NDJSON upload.
+
+    Each record needs activity_type and quantity, plus user_email unless
+    one is given for the whole file; created_at is optional. Rows are
+    priced against the factor table in vectorized chunks and written with
+    bulk inserts. Invalid rows are counted and reported, not fatal.
+    """
+    if format is None:
+        format = "ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv"
+    
+    # Parsing and bulk writes are blocking, so run them off the event loop
+    report = await run_in_threadpool(import_activities, file.file, format, user_email)
+    if report["accepted"]:
+        read_primary_after_write(response)
+    return ImportReport(**report)
\ No newline at end of file
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
 
-from ..database import get_db
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+
+from ..database import get_read_session, get_session
 from ..models.database import User
 from ..models.schemas import UserCreate, UserResponse, WeeklyTipRequest
+from ..services.checkpoint_service import RunInProgressError
+from ..services.digest_service import claim_digest_run, current_run_key, get_digest_progress, run_weekly_digest
 from ..services.email_service import email_service
+from ..services.export_service import USER_EXPORT_COLUMNS, iter_user_chunks, stream_ndjson
+from ..services.metrics_service import timed_task
+from ..services.pagination import InvalidCursorError, decode_cursor, encode_cursor, to_utc
+from ..services.serialization import rows_response
+from ..services.user_service import insert_users_if_missing, known_users
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -13,46 +25,43 @@ router = APIRouter(prefix="/api/users", tags=["users"])
 async def subscribe_user(
     user: UserCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_session)
 ):
     """Subscribe a user for weekly carbon reduction tips"""
     
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
-    if existing_user:
-        if existing_user.is_subscribed:
-            raise HTTPException(
-                status_code=400,
-                detail="User is already subscribed"
-            )
-        else:
-            # Re-subscribe existing user
-            existing_user.is_subscribed = True
-            db.commit()
-            db.refresh(existing_user)
-            return existing_user
-    
-    # Create new user
-    db_user = User(email=user.email, is_subscribed=user.is_subscribed)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    # Send welcome email in background
-    background_tasks.add_task(email_service.send_welcome_email, user.email)
+    # Create the user unless it exists; ON CONFLICT DO NOTHING avoids signup races
+    created = await db.run_sync(insert_users_if_missing, [user.email], user.is_subscribed)
+    await db.commit()
+    known_users.add_many([user.email])
+    
+    db_user = await db.scalar(select(User).where(User.email == user.email).limit(1))
+    if created:
+        # Send welcome email in background
+        background_tasks.add_task(timed_task("welcome_email", email_service.send_welcome_email), user.email)
+        return db_user
+    
+    if db_user.is_subscribed:
+        raise HTTPException(
+            status_code=400,
+            detail="User is already subscribed"
+        )
     
+    # Re-subscribe existing user
+    db_user.is_subscribed = True
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/unsubscribe")
-async def unsubscribe_user(email: str, db: Session = Depends(get_db)):
+async def unsubscribe_user(email: str, db: AsyncSession = Depends(get_session)):
     """Unsubscribe a user from weekly tips"""
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email).limit(1))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_subscribed = False
-    db.commit()
+    await db.commit()
     
     return {"message": "Successfully unsubscribed"}
 
@@ -60,11 +69,11 @@ async def unsubscribe_user(email: str, db: Session = Depends(get_db)):
 async def send_weekly_tip(
     request: WeeklyTipRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_session)
 ):
     """Send a weekly tip to a user (for testing purposes)"""
     
-    user = db.query(User).filter(User.email == request.email).first()
+    user = await db.scalar(select(User).where(User.email == request.email).limit(1))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -72,12 +81,112 @@ async def send_weekly_tip(
         raise HTTPException(status_code=400, detail="User is not subscribed")
     
     # Send tip in background
-    background_tasks.add_task(email_service.send_weekly_tip, request.email)
+    background_tasks.add_task(timed_task("weekly_tip", email_service.send_weekly_tip), request.email)
     
     return {"message": "Weekly tip will be sent shortly"}
 
+@router.post("/send-digest")
+async def send_weekly_digest(
+    background_tasks: BackgroundTasks,
+    run_key: Optional[str] = None
+):
+    """Send the weekly tip to every subscribed user (resumes an unfinished run)"""
+    
+    if not email_service.smtp_host:
+        raise HTTPException(status_code=503, detail="SMTP is not configured")
+    
+    run_key = run_key or current_run_key()
+    # Claimed here so a second request for a live run gets a 409 instead of mailing everyone twice
+    try:
+        progress = await run_in_threadpool(claim_digest_run, run_key)
+    except RunInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if progress["status"] == "completed":
+        return {"message": "Weekly digest already sent", "run_key": run_key}
+    background_tasks.add_task(timed_task("weekly_digest", run_weekly_digest), run_key, True)
+    
+    return {"message": "Weekly digest started", "run_key": run_key}
+
+@router.get("/digest/{run_key}")
+async def get_weekly_digest_progress(run_key: str):
+    """Get the progress of a weekly digest run"""
+    progress = await run_in_threadpool(get_digest_progress, run_key)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Digest run not found")
+    return progress
+
+@router.get("/cache-stats")
+async def get_user_cache_stats():
+    """Get hit/miss counters for the known-user cache"""
+    return known_users.stats()
+
+def user_filters(
+    is_subscribed: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> list:
+    """Shared query filters for the admin user listing endpoints"""
+    conditions = []
+    if is_subscribed is not None:
+        conditions.append(User.is_subscribed.is_(is_subscribed))
+    if created_after:
+        conditions.append(User.created_at >= to_utc(created_after))
+    if created_before:
+        conditions.append(User.created_at < to_utc(created_before))
+    return conditions
+
+@router.get("/count")
+async def count_users(
+    estimate: bool = False,
+    conditions: list = Depends(user_filters),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """Count users matching the filters (for admin purposes).
+
+    With estimate=true and no filters, Postgres answers from planner
+    statistics instead of scanning the table.
+    """
+    if estimate and not conditions and db.sync_session.get_bind().dialect.name == "postgresql":
+        count = await db.scalar(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'users'"))
+        return {"count": max(count or 0, 0), "estimated": True}
+    
+    count = await db.scalar(select(func.count()).select_from(User).where(*conditions))
+    return {"count": count, "estimated": False}
+
+@router.get("/export")
+async def export_users(conditions: list = Depends(user_filters)):
+    """Stream every user matching the filters as NDJSON (for admin purposes)"""
+    return StreamingResponse(
+        stream_ndjson(iter_user_chunks(conditions), USER_EXPORT_COLUMNS),
+        media_type="application/x-ndjson"
+    )
+
+USER_COLUMNS = tuple(UserResponse.model_fields)
+
 @router.get("/", response_model=List[UserResponse])
-async def get_all_users(db: Session = Depends(get_db)):
-    """Get all users (for admin purposes)"""
-    users = db.query(User).all()
-    return users
\ No newline at end of file
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    conditions: list = Depends(user_filters),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """Get users in id order, one keyset page at a time (for admin purposes).
+
+    When more users exist, the X-Next-Cursor header holds the cursor for
+    the next page.
+    """
+    query = select(*(getattr(User, column) for column in USER_COLUMNS)).where(*conditions)
+    if cursor:
+        try:
+            (last_id,) = decode_cursor(cursor)
+            query = query.where(User.id > int(last_id))
+        except (InvalidCursorError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    result = await db.execute(query.order_by(User.id).limit(limit + 1))
+    rows = result.all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    return rows_response(USER_COLUMNS, rows, headers)
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from ..database import read_replica
+from ..models.database import Activity
+from .live_service import live_updates
+from .ranking_service import user_ranking
+from .rollup_service import aggregate_rollups, apply_rollup_deltas
+from .user_service import ensure_users, known_users
+
+def activity_row(user_email: str, activity_type: str, quantity: float, co2_emissions: float) -> Dict:
+    """Build an Activity insert row stamped with the time it was recorded"""
+    return {
+        "user_email": user_email,
+        "activity_type": activity_type,
+        "quantity": quantity,
+        "co2_emissions": co2_emissions,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+def save_activities(session: Session, rows: List[Dict]) -> None:
+    """Persist activity rows in one transaction, creating missing users first.
+
+    The per-user rollups are updated in the same transaction; the user
+    ranking and open live-update streams hear about the rows once it
+    commits. Those notifications are best effort: once the rows are
+    committed this never raises, so callers can retry on an exception
+    without inserting rows twice. Users already in the known-user cache
+    cost no user-table round trip. Written against the sync Session so
+    the same code serves scripts, threadpool flushes and AsyncSession
+    callers (through run_sync).
+    """
+    if not rows:
+        return
+
+    unknown = ensure_users(session, (row["user_email"] for row in rows))
+    session.execute(insert(Activity), rows)
+    deltas = aggregate_rollups(rows)
+    apply_rollup_deltas(session, deltas)
+    session.commit()
+    try:
+        known_users.add_many(unknown)
+        user_ranking.record(deltas)
+        read_replica.note_write({row["user_email"] for row in rows})
+        live_updates.publish(rows)
+    except Exception as e:
+        print(f"Post-commit notification for {len(rows)} activities failed: {e}")
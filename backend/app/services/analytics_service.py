@@ -0,0 +1,474 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import database
+from ..models.database import Activity
+from .archive_service import activity_archive
+from .rollup_service import category_for
+
+DIMENSIONS = ("category", "activity_type", "day", "week", "month")
+TIME_DIMENSIONS = ("day", "week", "month")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROS_PER_DAY = 86_400_000_000
+# Missing timestamps load as NaT, which is the smallest int64
+NAT = np.iinfo(np.int64).min
+
+# Grouping keys up to this many combinations are counted with bincount, larger ones are sorted
+DENSE_KEY_LIMIT = 1 << 24
+
+def to_micros(value: datetime) -> int:
+    """Microseconds since the epoch of a timestamp; naive values are taken as UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def _timestamps(values: Sequence[Optional[datetime]]) -> np.ndarray:
+    # numpy only takes naive datetimes; SQLite already returns naive UTC, Postgres aware ones
+    if values[0] is not None and values[0].tzinfo is not None:
+        values = [
+            value.astimezone(timezone.utc).replace(tzinfo=None) if value is not None else None
+            for value in values
+        ]
+    return np.array(values, dtype="datetime64[us]").astype(np.int64)
+
+def _time_buckets(dimension: str, days: np.ndarray):
+    """Dense bucket codes and their start dates for days since the epoch"""
+    if len(days) == 0:
+        return days, []
+    first_day, last_day = int(days.min()), int(days.max())
+    if dimension == "day":
+        return days - first_day, [EPOCH.date() + timedelta(days=day) for day in range(first_day, last_day + 1)]
+    if dimension == "week":
+        # 1970-01-01 was a Thursday; weeks start on Monday like the rollups
+        weeks = (days + 3) // 7
+        first, last = int(weeks.min()), int(weeks.max())
+        return weeks - first, [EPOCH.date() + timedelta(days=week * 7 - 3) for week in range(first, last + 1)]
+    # Month of every day in range via a small lookup table instead of per-row datetime math
+    months = np.arange(first_day, last_day + 1).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    first, last = int(months[0]), int(months[-1])
+    labels = [date(1970 + month // 12, month % 12 + 1, 1) for month in range(first, last + 1)]
+    return (months - first)[days - first_day], labels
+
+class Dictionary:
+    """Append-only string dictionary; columns store int32 codes into `values`"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        return np.fromiter((self.code(value) for value in values), dtype=np.int32, count=len(values))
+
+    def encode_arrow(self, column) -> np.ndarray:
+        """Re-code an Arrow dictionary column without touching each row in Python"""
+        column = column.combine_chunks()
+        lookup = np.array([self.code(value) for value in column.dictionary.to_pylist()], dtype=np.int32)
+        return lookup[column.indices.to_numpy(zero_copy_only=False)]
+
+class DailyCube:
+    """CO2 totals and activity counts per (UTC day, activity type code).
+
+    A few thousand days times a few dozen types is small enough to copy,
+    so every addition builds a new cube and readers never see half of one.
+    """
+
+    def __init__(self, day0: int = 0, co2: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None):
+        self.day0 = day0
+        self.co2 = co2 if co2 is not None else np.zeros((0, 0))
+        self.counts = counts if counts is not None else np.zeros((0, 0), dtype=np.int64)
+
+    def add(self, timestamps: np.ndarray, type_codes: np.ndarray, co2: np.ndarray, type_count: int) -> "DailyCube":
+        valid = timestamps != NAT
+        days = timestamps[valid] // MICROS_PER_DAY
+        if len(days) == 0:
+            return self
+        day_count, width = self.co2.shape
+        first = int(days.min()) if day_count == 0 else min(int(days.min()), self.day0)
+        last = int(days.max()) if day_count == 0 else max(int(days.max()), self.day0 + day_count - 1)
+        width = max(width, type_count)
+
+        shape = (last - first + 1, width)
+        totals, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        offset = self.day0 - first
+        totals[offset:offset + day_count, :self.co2.shape[1]] = self.co2
+        counts[offset:offset + day_count, :self.co2.shape[1]] = self.counts
+        cells = (days - first) * width + type_codes[valid]
+        totals += np.bincount(cells, weights=co2[valid], minlength=totals.size).reshape(shape)
+        counts += np.bincount(cells, minlength=counts.size).reshape(shape)
+        return DailyCube(first, totals, counts)
+
+class ActivityColumns:
+    """Growable column arrays of (id, created_at, co2, activity type, email).
+
+    Rows are only ever appended. Writers fill the spare capacity first and
+    publish the new `size` last, so readers that slice to the size they
+    read never see a partially written row; growing swaps in new arrays.
+    About 28 bytes per row, plus the daily cube.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.co2 = np.empty(capacity, dtype=np.float64)
+        self.type_codes = np.empty(capacity, dtype=np.int32)
+        self.email_codes = np.empty(capacity, dtype=np.int32)
+        self.activity_types = Dictionary()
+        self.emails = Dictionary()
+        self.cube = DailyCube()
+        # Highest activity id loaded from the database
+        self.watermark = 0
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.timestamps, self.co2, self.type_codes, self.email_codes)
+        return sum(array[:self.size].nbytes for array in arrays)
+
+    def _reserve(self, extra: int) -> None:
+        capacity = len(self.ids)
+        if self.size + extra <= capacity:
+            return
+        while capacity < self.size + extra:
+            capacity *= 2
+        for name in ("ids", "timestamps", "co2", "type_codes", "email_codes"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, ids, timestamps, co2, type_codes, email_codes) -> None:
+        count = len(ids)
+        self._reserve(count)
+        end = self.size + count
+        self.ids[self.size:end] = ids
+        self.timestamps[self.size:end] = timestamps
+        self.co2[self.size:end] = co2
+        self.type_codes[self.size:end] = type_codes
+        self.email_codes[self.size:end] = email_codes
+        self.cube = self.cube.add(
+            self.timestamps[self.size:end], self.type_codes[self.size:end], self.co2[self.size:end],
+            len(self.activity_types.values)
+        )
+        self.size = end
+
+    def append_rows(self, rows: Sequence) -> None:
+        """Append (id, user_email, activity_type, co2_emissions, created_at) rows"""
+        if not rows:
+            return
+        ids, emails, activity_types, co2, created_at = zip(*rows)
+        self.append(
+            np.array(ids, dtype=np.int64),
+            _timestamps(created_at),
+            np.array([value or 0.0 for value in co2], dtype=np.float64),
+            self.activity_types.encode(activity_types),
+            self.emails.encode(emails)
+        )
+
+    def append_arrow(self, table) -> None:
+        """Append an archived Arrow table"""
+        self.append(
+            table.column("id").to_numpy(),
+            table.column("created_at").combine_chunks().cast("int64").to_numpy(),
+            table.column("co2_emissions").to_numpy(),
+            self.activity_types.encode_arrow(table.column("activity_type")),
+            self.emails.encode_arrow(table.column("user_email"))
+        )
+
+def _cube_cells(cube: "DailyCube", first_day: Optional[int], end_day: Optional[int]):
+    """Non-empty cube cells in [first_day, end_day) as (days, type codes, co2, counts, from_cube)"""
+    day_count, type_count = cube.co2.shape
+    low = max(first_day - cube.day0, 0) if first_day is not None else 0
+    high = min(max(end_day - cube.day0, 0), day_count) if end_day is not None else day_count
+    counts = cube.counts[low:high].ravel()
+    present = np.flatnonzero(counts)
+    days = cube.day0 + low + present // max(type_count, 1)
+    type_codes = (present % max(type_count, 1)).astype(np.int32)
+    return days, type_codes, cube.co2[low:high].ravel()[present], counts[present], True
+
+def _scan(columns: "ActivityColumns", start: Optional[int], end: Optional[int], email_code: Optional[int] = None):
+    """Rows in [start, end) microseconds, optionally of one user, in the same shape as cube cells"""
+    # Snapshot: rows past this size may still be being written
+    size = columns.size
+    timestamps = columns.timestamps[:size]
+    mask = timestamps != NAT
+    if email_code is not None:
+        mask &= columns.email_codes[:size] == email_code
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps < end
+    rows = np.flatnonzero(mask)
+    return (
+        timestamps[rows] // MICROS_PER_DAY, columns.type_codes[rows], columns.co2[rows],
+        np.ones(len(rows), dtype=np.int64), False
+    )
+
+class ActivityAnalytics:
+    """In-memory columnar copy of all activities for org-wide breakdowns.
+
+    Built once from the archive and the activities table, then kept
+    current by reading only rows above the id watermark every
+    `refresh_seconds`. Activity types and emails are dictionary-encoded,
+    so group-bys are integer arithmetic over numpy arrays and never touch
+    the OLTP database. Ids are not committed in strict order, so each
+    refresh re-reads the last `overlap` ids and skips rows it already
+    has. Changes to existing rows (recalculated emissions) are only
+    picked up by a full rebuild, every `rebuild_seconds` if set; the
+    default of 0 never rebuilds, since each rebuild scans the whole
+    activities table again.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        refresh_seconds: float = 30,
+        rebuild_seconds: float = 0,
+        chunk_size: int = 50000,
+        overlap: int = 1000
+    ):
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.columns: Optional[ActivityColumns] = None
+        self.as_of: Optional[datetime] = None
+        # Serializes writers; readers never take it
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_rows(self, session: Session, columns: ActivityColumns, after_id: int, skip=None) -> None:
+        last_id = after_id
+        while True:
+            rows = session.execute(
+                select(
+                    Activity.id, Activity.user_email, Activity.activity_type,
+                    Activity.co2_emissions, Activity.created_at
+                )
+                .where(Activity.id > last_id)
+                .order_by(Activity.id)
+                .limit(self.chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            if skip is not None:
+                rows = [row for row in rows if row[0] not in skip]
+            columns.append_rows(rows)
+            columns.watermark = max(columns.watermark, last_id)
+
+    def rebuild(self, session: Session) -> int:
+        """Load every archived and live activity into fresh columns"""
+        with self._lock:
+            columns = ActivityColumns()
+            for table in activity_archive.iter_tables():
+                columns.append_arrow(table)
+            self._load_rows(session, columns, 0)
+            self.columns = columns
+            self.as_of = datetime.now(timezone.utc)
+            return columns.size
+
+    def refresh(self, session: Session) -> int:
+        """Append activities written since the last load; returns how many"""
+        if self.columns is None:
+            return self.rebuild(session)
+        with self._lock:
+            columns = self.columns
+            before = columns.size
+            low = max(columns.watermark - self.overlap, 0)
+            ids = columns.ids[:columns.size]
+            skip = set(ids[ids > low].tolist())
+            self._load_rows(session, columns, low, skip)
+            self.as_of = datetime.now(timezone.utc)
+            return columns.size - before
+
+    def _ensure_loaded(self) -> ActivityColumns:
+        if self.columns is None:
+            with database.SessionLocal() as session:
+                self.rebuild(session)
+        return self.columns
+
+    def query(
+        self,
+        group_by: Sequence[str] = ("category",),
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        activity_type: Optional[str] = None,
+        category: Optional[str] = None,
+        user_email: Optional[str] = None
+    ) -> Dict:
+        """Total CO2 and activity count per combination of `group_by` dimensions.
+
+        Org-wide queries read whole UTC days from the daily cube and scan
+        the row columns only for partial days at the range edges; per-user
+        queries scan the rows of that user.
+        """
+        group_by = list(dict.fromkeys(group_by))
+        unknown = [dimension for dimension in group_by if dimension not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+        if sum(dimension in TIME_DIMENSIONS for dimension in group_by) > 1:
+            raise ValueError("Group by at most one of day, week and month")
+
+        started = time.perf_counter()
+        columns = self._ensure_loaded()
+        start_micros = to_micros(start) if start is not None else None
+        end_micros = to_micros(end) if end is not None else None
+
+        if user_email is not None:
+            email_code = columns.emails.codes.get(user_email, -1)
+            parts = [_scan(columns, start_micros, end_micros, email_code)]
+        else:
+            # Whole days come from the cube; only partial days at the edges are scanned
+            first_day = -(-start_micros // MICROS_PER_DAY) if start_micros is not None else None
+            end_day = end_micros // MICROS_PER_DAY if end_micros is not None else None
+            if first_day is not None and end_day is not None and first_day >= end_day:
+                parts = [_scan(columns, start_micros, end_micros)]
+            else:
+                parts = [_cube_cells(columns.cube, first_day, end_day)]
+                if first_day is not None and start_micros != first_day * MICROS_PER_DAY:
+                    parts.append(_scan(columns, start_micros, first_day * MICROS_PER_DAY))
+                if end_day is not None and end_micros != end_day * MICROS_PER_DAY:
+                    parts.append(_scan(columns, end_day * MICROS_PER_DAY, end_micros))
+        source = "+".join(dict.fromkeys("cube" if part[4] else "scan" for part in parts))
+        # Read after the parts so every code in them has a name
+        type_names = columns.activity_types.values[:]
+        days, type_codes, co2, counts = (np.concatenate([part[index] for part in parts]) for index in range(4))
+
+        # Category of every activity type code, from the current factor table
+        type_category_names = [category_for(name) for name in type_names]
+        categories = sorted(set(type_category_names))
+        category_codes = {name: code for code, name in enumerate(categories)}
+        type_categories = np.array([category_codes[name] for name in type_category_names], dtype=np.int64)
+
+        if activity_type is not None or category is not None:
+            mask = np.ones(len(co2), dtype=bool)
+            if activity_type is not None:
+                mask &= type_codes == columns.activity_types.codes.get(activity_type, -1)
+            if category is not None:
+                mask &= type_categories[type_codes] == category_codes.get(category, -1)
+            days, type_codes, co2, counts = days[mask], type_codes[mask], co2[mask], counts[mask]
+
+        # Each dimension becomes dense codes [0, radix); keys combine them in mixed radix
+        keys = np.zeros(len(co2), dtype=np.int64)
+        decoders = []
+        for dimension in group_by:
+            if dimension == "activity_type":
+                codes, labels = type_codes.astype(np.int64), type_names
+            elif dimension == "category":
+                codes, labels = type_categories[type_codes], categories
+            else:
+                codes, labels = _time_buckets(dimension, days)
+            radix = max(len(labels), 1)
+            keys = keys * radix + codes
+            decoders.append((dimension, radix, labels))
+
+        key_space = int(np.prod([radix for _, radix, _ in decoders], dtype=np.float64)) if decoders else 1
+        if key_space <= DENSE_KEY_LIMIT:
+            groups = np.arange(key_space)
+            inverse = keys
+        else:
+            groups, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=co2, minlength=len(groups))
+        group_counts = np.bincount(inverse, weights=counts, minlength=len(groups)).astype(np.int64)
+        present = np.flatnonzero(group_counts)
+        groups, totals, group_counts = groups[present], totals[present], group_counts[present]
+
+        rows = [
+            {"total_co2": round(float(total), 3), "activity_count": int(count)}
+            for total, count in zip(totals, group_counts)
+        ]
+        remaining = groups
+        for dimension, radix, labels in reversed(decoders):
+            remaining, codes = np.divmod(remaining, radix)
+            field = "period_start" if dimension in TIME_DIMENSIONS else dimension
+            for row, code in zip(rows, codes.tolist()):
+                row[field] = labels[code]
+
+        return {
+            "group_by": group_by,
+            "start": start,
+            "end": end,
+            "rows": rows,
+            "total_co2": round(float(co2.sum()), 3),
+            "activity_count": int(counts.sum()),
+            "rows_loaded": columns.size,
+            "source": source,
+            "as_of": self.as_of,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def info(self) -> Dict:
+        columns = self.columns
+        return {
+            "rows": columns.size if columns else 0,
+            "users": len(columns.emails.values) if columns else 0,
+            "activity_types": len(columns.activity_types.values) if columns else 0,
+            "watermark": columns.watermark if columns else 0,
+            "memory_bytes": columns.nbytes if columns else 0,
+            "as_of": self.as_of
+        }
+
+    async def start(self) -> None:
+        """Build the columns in the background, then refresh (and optionally rebuild) periodically"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _with_session(self, fn):
+        with database.SessionLocal() as session:
+            return fn(session)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await run_in_threadpool(self._with_session, self.rebuild)
+            print(f"Analytics columns loaded: {rows} activities")
+        except Exception as e:
+            print(f"Analytics warm-up failed: {e}")
+        last_rebuild = loop.time()
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                if self.rebuild_seconds and loop.time() - last_rebuild >= self.rebuild_seconds:
+                    await run_in_threadpool(self._with_session, self.rebuild)
+                    last_rebuild = loop.time()
+                else:
+                    await run_in_threadpool(self._with_session, self.refresh)
+            except Exception as e:
+                print(f"Analytics refresh failed: {e}")
+
+# Global instance
+activity_analytics = ActivityAnalytics(
+    # Opt-in: every worker that enables it holds its own copy of all activities
+    enabled=os.getenv("ANALYTICS_ENABLED", "false").lower() in ("1", "true", "yes"),
+    refresh_seconds=float(os.getenv("ANALYTICS_REFRESH_SECONDS", "30")),
+    rebuild_seconds=float(os.getenv("ANALYTICS_REBUILD_SECONDS", "0"))
+)
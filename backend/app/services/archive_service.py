@@ -0,0 +1,427 @@
+import heapq
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; without it nothing is archived or read from the archive
+    pa = None
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..database import dialect_insert, engine
+from ..models.database import Activity, ArchivedUser
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(".", "archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+ARCHIVE_COLUMNS = ("id", "user_email", "activity_type", "quantity", "co2_emissions", "created_at")
+
+# Same fields and order as history/export rows, so hot and cold rows mix freely
+ArchivedActivity = namedtuple("ArchivedActivity", ARCHIVE_COLUMNS)
+
+PART_NAME = re.compile(r"part-(\d+)-(\d+)\.parquet(\.tmp)?$")
+
+if pa is not None:
+    ARCHIVE_SCHEMA = pa.schema([
+        ("id", pa.int64()),
+        ("user_email", pa.dictionary(pa.int32(), pa.string())),
+        ("activity_type", pa.dictionary(pa.int32(), pa.string())),
+        ("quantity", pa.float64()),
+        ("co2_emissions", pa.float64()),
+        ("created_at", pa.timestamp("us", tz="UTC"))
+    ])
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+class ActivityArchive:
+    """Activities moved out of the database into monthly Parquet files.
+
+    Files live under `root/activities/month=YYYY-MM/part-<first id>-<last
+    id>.parquet`, zstd-compressed and sorted by (user_email, created_at,
+    id) so per-user reads skip most row groups. `_manifest.json` lists
+    the committed files; readers only see files in it and reload it when
+    its mtime changes.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        self._manifest: Dict = {"files": []}
+        self._manifest_stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "_manifest.json")
+
+    def _stat_manifest(self):
+        try:
+            stat = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def manifest(self) -> Dict:
+        """The committed file list, reloaded when the archive job rewrites it"""
+        stamp = self._stat_manifest()
+        if stamp != self._manifest_stamp:
+            with self._lock:
+                if stamp != self._manifest_stamp:
+                    if stamp is None:
+                        self._manifest = {"files": []}
+                    else:
+                        with open(self.manifest_path) as file:
+                            self._manifest = json.load(file)
+                    self._manifest_stamp = stamp
+        return self._manifest
+
+    def has_data(self) -> bool:
+        return pa is not None and bool(self.manifest()["files"])
+
+    def _files(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+        files = self.manifest()["files"]
+        if start is not None:
+            files = [entry for entry in files if datetime.fromisoformat(entry["max_created_at"]) >= _as_utc(start)]
+        if end is not None:
+            files = [entry for entry in files if datetime.fromisoformat(entry["min_created_at"]) < _as_utc(end)]
+        return files
+
+    def _read(self, files: List[Dict], condition) -> "pa.Table":
+        dataset = ds.dataset(
+            [os.path.join(self.root, entry["path"]) for entry in files], schema=ARCHIVE_SCHEMA, format="parquet"
+        )
+        return dataset.to_table(columns=list(ARCHIVE_COLUMNS), filter=condition)
+
+    def _rows(self, table: "pa.Table") -> List[ArchivedActivity]:
+        # Hot rows come back naive from SQLite; match them so the two sort and render alike
+        naive = engine.dialect.name == "sqlite"
+        columns = [table.column(name).to_pylist() for name in ARCHIVE_COLUMNS]
+        timestamps = [
+            (value.astimezone(timezone.utc).replace(tzinfo=None) if naive else value.astimezone(timezone.utc))
+            for value in columns[-1]
+        ]
+        return [ArchivedActivity(*values) for values in zip(*columns[:-1], timestamps)]
+
+    def _condition(self, user_email: str, start, end, activity_type):
+        condition = ds.field("user_email") == user_email
+        if activity_type:
+            condition &= ds.field("activity_type") == activity_type
+        if start:
+            condition &= ds.field("created_at") >= pa.scalar(_as_utc(start), ARCHIVE_SCHEMA.field("created_at").type)
+        if end:
+            condition &= ds.field("created_at") < pa.scalar(_as_utc(end), ARCHIVE_SCHEMA.field("created_at").type)
+        return condition
+
+    def history_page(
+        self,
+        user_email: str,
+        limit: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        activity_type: Optional[str] = None,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[ArchivedActivity]:
+        """Up to `limit` archived rows newest first, optionally after a (created_at, id) cursor"""
+        if not self.has_data():
+            return []
+        condition = self._condition(user_email, start, end, activity_type)
+        if before is not None:
+            created_at = pa.scalar(_as_utc(before[0]), ARCHIVE_SCHEMA.field("created_at").type)
+            condition &= (ds.field("created_at") < created_at) | (
+                (ds.field("created_at") == created_at) & (ds.field("id") < before[1])
+            )
+            # Prune files by the cursor too; rows at its exact timestamp still qualify by id
+            bound = _as_utc(before[0]) + timedelta(microseconds=1)
+            end = min(_as_utc(end), bound) if end else bound
+
+        # Newest months first; stop once older months cannot reach the page
+        rows: List[ArchivedActivity] = []
+        files = self._files(start, end)
+        for month in sorted({entry["month"] for entry in files}, reverse=True):
+            table = self._read([entry for entry in files if entry["month"] == month], condition)
+            rows.extend(self._rows(table))
+            if len(rows) >= limit:
+                break
+        rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+        return rows[:limit]
+
+    def iter_rows(
+        self,
+        user_email: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Iterator[ArchivedActivity]:
+        """A user's archived rows oldest first, reading one month at a time"""
+        if not self.has_data():
+            return
+        condition = self._condition(user_email, start, end, None)
+        files = self._files(start, end)
+        for month in sorted({entry["month"] for entry in files}):
+            table = self._read([entry for entry in files if entry["month"] == month], condition)
+            yield from sorted(self._rows(table), key=lambda row: (row.created_at, row.id))
+
+    def iter_tables(self) -> Iterator["pa.Table"]:
+        """Every archived file as an Arrow table, for bulk columnar readers"""
+        if not self.has_data():
+            return
+        for entry in self.manifest()["files"]:
+            yield pq.read_table(os.path.join(self.root, entry["path"]), schema=ARCHIVE_SCHEMA)
+
+    def quantity_totals(self, since: datetime) -> List[Tuple[str, str, float]]:
+        """(user_email, activity_type, summed quantity) over archived rows created at or after `since`"""
+        files = self._files(since) if self.has_data() else []
+        if not files:
+            return []
+        condition = ds.field("created_at") >= pa.scalar(_as_utc(since), ARCHIVE_SCHEMA.field("created_at").type)
+        table = self._read(files, condition)
+        table = pa.table({
+            "user_email": table.column("user_email").cast(pa.string()),
+            "activity_type": table.column("activity_type").cast(pa.string()),
+            "quantity": table.column("quantity")
+        })
+        totals = table.group_by(["user_email", "activity_type"]).aggregate([("quantity", "sum")])
+        return list(zip(*(totals.column(name).to_pylist() for name in ("user_email", "activity_type", "quantity_sum"))))
+
+    def user_emails(self) -> set:
+        """Every email with archived activities"""
+        if not self.has_data():
+            return set()
+        emails = set()
+        for entry in self.manifest()["files"]:
+            column = pq.read_table(os.path.join(self.root, entry["path"]), columns=["user_email"]).column(0)
+            emails.update(pc.unique(column.combine_chunks().dictionary_decode()).to_pylist())
+        return emails
+
+    # -- archival job -------------------------------------------------------------
+
+    def _record_users(self, session: Session, users: Dict[str, list]) -> None:
+        """Add {email: [archived rows, newest created_at]} to archived_users. Does not commit."""
+        if not users:
+            return
+        values = [
+            {"user_email": email, "activity_count": count, "max_created_at": newest}
+            for email, (count, newest) in sorted(users.items())
+        ]
+        table = ArchivedUser.__table__
+        bind = session.get_bind()
+        if bind.dialect.name in ("sqlite", "postgresql"):
+            statement = dialect_insert(bind, table)
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=["user_email"],
+                set_={
+                    "activity_count": table.c.activity_count + excluded.activity_count,
+                    "max_created_at": case(
+                        (excluded.max_created_at > table.c.max_created_at, excluded.max_created_at),
+                        else_=table.c.max_created_at
+                    )
+                }
+            )
+            session.execute(statement, values)
+            return
+
+        # Other databases: update in place, insert the users that were not there
+        for value in values:
+            result = session.execute(
+                update(table)
+                .where(table.c.user_email == value["user_email"])
+                .values(
+                    activity_count=table.c.activity_count + value["activity_count"],
+                    max_created_at=case(
+                        (table.c.max_created_at < value["max_created_at"], value["max_created_at"]),
+                        else_=table.c.max_created_at
+                    )
+                )
+            )
+            if result.rowcount == 0:
+                session.execute(insert(table), [value])
+
+    def _backfill_users(self, session: Session) -> None:
+        """Fill archived_users from the files of an archive written before the table existed"""
+        if not self.has_data() or session.scalar(select(ArchivedUser.user_email).limit(1)) is not None:
+            return
+        users: Dict[str, list] = {}
+        for entry in self.manifest()["files"]:
+            table = pq.read_table(os.path.join(self.root, entry["path"]), columns=["user_email", "created_at"])
+            table = pa.table({
+                "user_email": table.column("user_email").cast(pa.string()),
+                "created_at": table.column("created_at")
+            })
+            totals = table.group_by("user_email").aggregate([("created_at", "count"), ("created_at", "max")])
+            for email, count, newest in zip(*(
+                totals.column(name).to_pylist() for name in ("user_email", "created_at_count", "created_at_max")
+            )):
+                _add_user(users, email, count, newest)
+        self._record_users(session, users)
+        session.commit()
+
+    def _write_manifest(self, files: List[Dict]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({"files": sorted(files, key=lambda entry: (entry["month"], entry["min_id"]))}, file, indent=1)
+        os.replace(temporary, self.manifest_path)
+
+    def _write_part(self, month: str, rows: List[tuple]) -> Dict:
+        """Write one month's rows to a temporary part file and describe it"""
+        rows.sort(key=lambda row: (row[1], row[5], row[0]))
+        ids = [row[0] for row in rows]
+        timestamps = [_as_utc(row[5]) for row in rows]
+        table = pa.Table.from_arrays(
+            [
+                pa.array(ids, pa.int64()),
+                pa.array([row[1] for row in rows]).dictionary_encode(),
+                pa.array([row[2] for row in rows]).dictionary_encode(),
+                pa.array([row[3] for row in rows], pa.float64()),
+                pa.array([row[4] for row in rows], pa.float64()),
+                pa.array(timestamps, ARCHIVE_SCHEMA.field("created_at").type)
+            ],
+            schema=ARCHIVE_SCHEMA
+        )
+        path = os.path.join("activities", f"month={month}", f"part-{min(ids)}-{max(ids)}.parquet")
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        pq.write_table(table, full_path + ".tmp", compression="zstd", row_group_size=64 * 1024)
+        return {
+            "path": path,
+            "month": month,
+            "rows": len(rows),
+            "min_id": min(ids),
+            "max_id": max(ids),
+            "min_created_at": min(timestamps).isoformat(),
+            "max_created_at": max(timestamps).isoformat()
+        }
+
+    def recover(self, session: Session) -> None:
+        """Settle part files left behind by an interrupted run.
+
+        A temporary file whose first row is still in the database belongs to
+        a batch that never committed and is discarded; otherwise the delete
+        committed and the file is published.
+        """
+        files = list(self.manifest()["files"])
+        known = {entry["path"] for entry in files}
+        changed = False
+        for directory, _, names in os.walk(os.path.join(self.root, "activities")):
+            for name in names:
+                match = PART_NAME.match(name)
+                if not match or not match.group(3):
+                    continue
+                temporary = os.path.join(directory, name)
+                if session.get(Activity, int(match.group(1))) is not None:
+                    os.remove(temporary)
+                    continue
+                final = temporary[:-len(".tmp")]
+                os.replace(temporary, final)
+                path = os.path.relpath(final, self.root)
+                if path not in known:
+                    table = pq.read_table(final, columns=["id", "created_at"])
+                    timestamps = table.column("created_at")
+                    files.append({
+                        "path": path,
+                        "month": os.path.basename(directory).split("=", 1)[1],
+                        "rows": table.num_rows,
+                        "min_id": pc.min(table.column("id")).as_py(),
+                        "max_id": pc.max(table.column("id")).as_py(),
+                        "min_created_at": _as_utc(pc.min(timestamps).as_py()).isoformat(),
+                        "max_created_at": _as_utc(pc.max(timestamps).as_py()).isoformat()
+                    })
+                changed = True
+        if changed:
+            self._write_manifest(files)
+        self._backfill_users(session)
+
+    def archive(self, session: Session, cutoff: datetime, chunk_size: int = 100000) -> int:
+        """Move activities created before `cutoff` into the archive.
+
+        Walks the table in id order, `chunk_size` rows per batch. Each batch
+        is written to temporary part files, deleted from the database in
+        one transaction, then published by renaming the files and rewriting
+        the manifest. Returns the number of rows archived.
+        """
+        if pa is None:
+            raise RuntimeError("pyarrow is required to archive activities")
+        self.recover(session)
+        cutoff = _as_utc(cutoff)
+        files = list(self.manifest()["files"])
+        archived = 0
+        last_id = 0
+        columns = [getattr(Activity, column) for column in ARCHIVE_COLUMNS]
+
+        while True:
+            rows = session.execute(
+                select(*columns)
+                .where(Activity.id > last_id, Activity.created_at < cutoff)
+                .order_by(Activity.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            first_id, last_id = rows[0].id, rows[-1].id
+
+            by_month: Dict[str, List[tuple]] = {}
+            for row in rows:
+                by_month.setdefault(_as_utc(row.created_at).strftime("%Y-%m"), []).append(tuple(row))
+            parts = [self._write_part(month, month_rows) for month, month_rows in by_month.items()]
+
+            # Same predicate as the select, so rows inserted meanwhile are untouched
+            session.execute(
+                delete(Activity).where(Activity.id.between(first_id, last_id), Activity.created_at < cutoff)
+            )
+            users: Dict[str, list] = {}
+            for row in rows:
+                _add_user(users, row.user_email, 1, row.created_at)
+            self._record_users(session, users)
+            session.commit()
+
+            for part in parts:
+                full_path = os.path.join(self.root, part["path"])
+                os.replace(full_path + ".tmp", full_path)
+            files.extend(parts)
+            self._write_manifest(files)
+            archived += len(rows)
+            print(f"Archived {archived} activities (up to id {last_id})")
+        return archived
+
+def _add_user(users: Dict[str, list], email: Optional[str], count: int, newest: datetime) -> None:
+    if email is None:
+        return
+    entry = users.get(email)
+    if entry is None:
+        users[email] = [count, newest]
+    else:
+        entry[0] += count
+        entry[1] = max(entry[1], newest)
+
+def archived_until(session: Session, user_email: str) -> Optional[datetime]:
+    """Newest archived created_at of a user, or None when none of their rows are archived"""
+    if not activity_archive.has_data():
+        return None
+    return session.scalar(select(ArchivedUser.max_created_at).where(ArchivedUser.user_email == user_email))
+
+def merge_newest_first(hot: Sequence, cold: Sequence, limit: int) -> list:
+    """Merge two (created_at, id)-descending row lists into the first `limit` rows"""
+    key = lambda row: (row.created_at, row.id)
+    return list(islice(heapq.merge(hot, cold, key=key, reverse=True), limit))
+
+def merge_oldest_first(hot: Iterator, cold: Iterator) -> Iterator:
+    """Merge two (created_at, id)-ascending row streams"""
+    return heapq.merge(hot, cold, key=lambda row: (row.created_at, row.id))
+
+def archive_cutoff(days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    """Activities created before this are eligible for archival"""
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+# Global instance
+activity_archive = ActivityArchive()
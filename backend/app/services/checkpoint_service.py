@@ -0,0 +1,86 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.database import JobCheckpoint
+
+# A running checkpoint not updated for this long belongs to a dead worker and may be taken over
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+class RunInProgressError(RuntimeError):
+    """Raised when another worker holds a live claim on a job run"""
+
+def claim_run(
+    session: Session,
+    job_name: str,
+    run_key: str,
+    lease_seconds: Optional[float] = None,
+    exclusive: bool = False
+) -> JobCheckpoint:
+    """Atomically mark a job run as running for the caller and return its checkpoint.
+
+    The claim is a conditional UPDATE (or the INSERT of a new checkpoint),
+    so of two callers racing for the same run exactly one wins. A
+    completed run is returned unclaimed. Raises RunInProgressError while
+    the run is running and its checkpoint was updated within the lease.
+    With `exclusive`, a live run of the job under another key also
+    refuses the claim (both racing callers may lose, never both win).
+    """
+    lease = JOB_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    stale = datetime.now(timezone.utc) - timedelta(seconds=lease)
+    checkpoint = _claim(session, job_name, run_key, stale)
+    if not exclusive or checkpoint.status == "completed":
+        return checkpoint
+
+    other = session.scalar(
+        select(JobCheckpoint.run_key)
+        .where(
+            JobCheckpoint.job_name == job_name,
+            JobCheckpoint.run_key != run_key,
+            JobCheckpoint.status == "running",
+            JobCheckpoint.updated_at >= stale
+        )
+        .limit(1)
+    )
+    if other is not None:
+        # Hand the claim back; the run can be resumed once the other one ends
+        checkpoint.status = "failed"
+        session.commit()
+        raise RunInProgressError(f"Run '{other}' of {job_name} is already running")
+    return checkpoint
+
+def _claim(session: Session, job_name: str, run_key: str, stale: datetime) -> JobCheckpoint:
+    claimed = session.execute(
+        update(JobCheckpoint)
+        .where(
+            JobCheckpoint.job_name == job_name,
+            JobCheckpoint.run_key == run_key,
+            JobCheckpoint.status != "completed",
+            or_(JobCheckpoint.status != "running", JobCheckpoint.updated_at < stale)
+        )
+        .values(status="running", updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    session.commit()
+
+    checkpoint = session.get(JobCheckpoint, (job_name, run_key), populate_existing=True)
+    if claimed or (checkpoint is not None and checkpoint.status == "completed"):
+        return checkpoint
+    if checkpoint is not None:
+        raise RunInProgressError(f"Run '{run_key}' of {job_name} is already running")
+
+    checkpoint = JobCheckpoint(
+        job_name=job_name, run_key=run_key, last_id=0, processed=0, failed=0, status="running"
+    )
+    session.add(checkpoint)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another caller created the run first
+        session.rollback()
+        raise RunInProgressError(f"Run '{run_key}' of {job_name} is already running")
+    return checkpoint
@@ -0,0 +1,269 @@
+import copy
+import email.policy
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select
+
+from ..database import SessionLocal
+from ..models.database import JobCheckpoint, User
+from .checkpoint_service import claim_run
+from .email_service import email_service
+
+JOB_NAME = "weekly_digest"
+
+class SMTPConnectionPool:
+    """Thread-safe pool of persistent, authenticated SMTP connections"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 587,
+        size: int = 4,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = False,
+        timeout: float = 30
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.opened = 0
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        self.opened += 1
+        return smtp
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, opening one only when no idle one is left"""
+        with self._slots:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                smtp = self._connect()
+            try:
+                yield smtp
+            except Exception as e:
+                # Protocol-level errors leave the session usable; socket errors don't
+                if isinstance(e, smtplib.SMTPServerDisconnected) or not isinstance(e, smtplib.SMTPException):
+                    self._discard(smtp)
+                    smtp = None
+                raise
+            finally:
+                if smtp is not None:
+                    self._idle.put(smtp)
+
+    def _discard(self, smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+    def close_all(self) -> None:
+        """Politely close every idle connection"""
+        while True:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                smtp.quit()
+            except Exception:
+                self._discard(smtp)
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `rate_per_second` go through"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    # Disconnects, timeouts and other socket errors
+    return not isinstance(error, smtplib.SMTPException) or isinstance(error, smtplib.SMTPServerDisconnected)
+
+class WeeklyDigestJob:
+    """Send the weekly tip to every subscribed user, resumably.
+
+    Users are streamed in id order, `batch_size` at a time, and fanned out
+    to a worker pool that shares persistent SMTP connections. After each
+    batch the highest processed user id is checkpointed, so a restarted
+    run with the same run key picks up where it stopped. Delivery is
+    at-least-once for the batch that was in flight when a run died.
+    """
+
+    def __init__(
+        self,
+        pool: SMTPConnectionPool,
+        session_factory: Callable = SessionLocal,
+        workers: int = 8,
+        rate_per_second: float = 50,
+        batch_size: int = 500,
+        max_retries: int = 3,
+        backoff_seconds: float = 1.0
+    ):
+        self.pool = pool
+        self.session_factory = session_factory
+        self.workers = workers
+        self.limiter = RateLimiter(rate_per_second)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._templates: List[EmailMessage] = []
+
+    def run(self, run_key: str, claimed: bool = False) -> Dict:
+        """Run (or resume) the digest for `run_key` and return its progress.
+
+        Claims the run first unless the caller already did (`claimed`);
+        raises RunInProgressError while another worker is sending it.
+        """
+        # Each tip is rendered once; recipients only add a To header
+        self._templates = [email_service.render_weekly_tip(tip) for tip in email_service.weekly_tips]
+
+        with self.session_factory() as session:
+            if claimed:
+                checkpoint = session.get(JobCheckpoint, (JOB_NAME, run_key))
+            else:
+                checkpoint = claim_run(session, JOB_NAME, run_key)
+            if checkpoint.status == "completed":
+                return checkpoint_progress(checkpoint)
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    while True:
+                        users = session.execute(
+                            select(User.id, User.email)
+                            .where(User.is_subscribed.is_(True), User.id > checkpoint.last_id)
+                            .order_by(User.id)
+                            .limit(self.batch_size)
+                        ).all()
+                        if not users:
+                            break
+
+                        results = list(executor.map(self._send, users))
+                        sent = sum(results)
+                        checkpoint.last_id = users[-1].id
+                        checkpoint.processed += sent
+                        checkpoint.failed += len(results) - sent
+                        session.commit()
+
+                checkpoint.status = "completed"
+            except Exception:
+                session.rollback()
+                checkpoint.status = "failed"
+                raise
+            finally:
+                session.commit()
+                self.pool.close_all()
+
+            return checkpoint_progress(checkpoint)
+
+    def _send(self, user) -> bool:
+        message = copy.deepcopy(self._templates[user.id % len(self._templates)])
+        try:
+            # The header API rejects CR/LF and other values that would break the header block
+            message["To"] = user.email
+        except ValueError as e:
+            print(f"Failed to send weekly digest to {user.email!r}: {e}")
+            return False
+        # CRLF line endings, as SMTP expects
+        data = message.as_bytes(policy=email.policy.SMTP)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                with self.pool.connection() as smtp:
+                    smtp.sendmail(email_service.from_email, [user.email], data)
+                return True
+            except Exception as e:
+                if not _is_transient(e) or attempt == self.max_retries:
+                    print(f"Failed to send weekly digest to {user.email}: {e}")
+                    return False
+            time.sleep(self.backoff_seconds * 2 ** attempt)
+        return False
+
+def checkpoint_progress(checkpoint: JobCheckpoint) -> Dict:
+    """Public view of a digest run's checkpoint"""
+    return {
+        "run_key": checkpoint.run_key,
+        "status": checkpoint.status,
+        "last_user_id": checkpoint.last_id,
+        "sent": checkpoint.processed,
+        "failed": checkpoint.failed
+    }
+
+def current_run_key() -> str:
+    """Default run key: the current ISO week, e.g. 2024-W07"""
+    year, week, _ = datetime.now(timezone.utc).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def claim_digest_run(run_key: str) -> Dict:
+    """Claim a digest run for a later run_weekly_digest(run_key, claimed=True).
+
+    Returns the run's progress; a completed run is left as it is.
+    Raises RunInProgressError while the run is being sent.
+    """
+    with SessionLocal() as session:
+        return checkpoint_progress(claim_run(session, JOB_NAME, run_key))
+
+def run_weekly_digest(run_key: Optional[str] = None, claimed: bool = False) -> Dict:
+    """Run the digest with the SMTP and concurrency settings from the environment"""
+    if not email_service.smtp_host:
+        raise RuntimeError("SMTP_HOST is not configured")
+
+    pool = SMTPConnectionPool(
+        host=email_service.smtp_host,
+        port=email_service.smtp_port,
+        size=int(os.getenv("DIGEST_SMTP_CONNECTIONS", "4")),
+        username=email_service.smtp_user,
+        password=email_service.smtp_password,
+        starttls=email_service.smtp_starttls
+    )
+    job = WeeklyDigestJob(
+        pool,
+        workers=int(os.getenv("DIGEST_WORKERS", "8")),
+        rate_per_second=float(os.getenv("DIGEST_RATE_PER_SECOND", "50")),
+        batch_size=int(os.getenv("DIGEST_BATCH_SIZE", "500")),
+        max_retries=int(os.getenv("DIGEST_MAX_RETRIES", "3"))
+    )
+    return job.run(run_key or current_run_key(), claimed)
+
+def get_digest_progress(run_key: str) -> Optional[Dict]:
+    """Progress of a digest run, or None if it never started"""
+    with SessionLocal() as session:
+        checkpoint = session.get(JobCheckpoint, (JOB_NAME, run_key))
+        return checkpoint_progress(checkpoint) if checkpoint is not None else None
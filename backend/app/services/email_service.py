@@ -1,7 +1,6 @@
 import os
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage
 from typing import List
 import random
 
@@ -10,6 +9,13 @@ class EmailService:
         self.sendgrid_api_key = os.getenv("SENDGRID_API_KEY")
         self.from_email = os.getenv("FROM_EMAIL", "noreply@carbontracker.com")
         
+        # SMTP server used for bulk sends such as the weekly digest
+        self.smtp_host = os.getenv("SMTP_HOST")
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        self.smtp_user = os.getenv("SMTP_USER")
+        self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_starttls = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+        
         # Weekly carbon reduction tips
         self.weekly_tips = [
             "🚗 Try carpooling or using public transport once this week to reduce your transport emissions by up to 45%.",
@@ -28,6 +34,19 @@ class EmailService:
         """Get a random carbon reduction tip"""
         return random.choice(self.weekly_tips)
     
+    def render_weekly_tip(self, tip: str) -> EmailMessage:
+        """Build a weekly tip email once, without the recipient header.
+
+        Copy it and set "To" per recipient to get the full message.
+        """
+        message = EmailMessage()
+        message["From"] = self.from_email
+        message["Subject"] = "Your weekly carbon reduction tip 🌍"
+        message.set_content(
+            f"{tip}\n\nEvery small action counts towards a healthier planet!\n\nThe Carbon Tracker Team"
+        )
+        return message
+    
     def send_weekly_tip(self, email: str) -> bool:
         """Send a weekly carbon reduction tip email"""
         try:
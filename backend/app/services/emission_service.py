@@ -1,55 +1,290 @@
+import hashlib
 import json
+import math
 import os
-from typing import Dict, Optional
+import threading
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence
 
-class EmissionService:
-    def __init__(self):
-        self.emission_factors = self._load_emission_factors()
-    
-    def _load_emission_factors(self) -> Dict:
-        """Load emission factors from JSON file"""
-        current_dir = os.path.dirname(__file__)
-        json_path = os.path.join(current_dir, "..", "emission_factors.json")
-        
-        with open(json_path, 'r') as file:
-            return json.load(file)
-    
-    def calculate_emissions(self, activity_type: str, quantity: float) -> Optional[Dict]:
-        """Calculate CO2 emissions for a given activity and quantity"""
-        # Find the activity in the nested structure
-        for category, activities in self.emission_factors.items():
-            if activity_type in activities:
-                factor_data = activities[activity_type]
-                factor = factor_data["factor"]
-                emissions = factor * quantity
-                
-                return {
-                    "activity_type": activity_type,
-                    "quantity": quantity,
-                    "co2_emissions": round(emissions, 3),
-                    "unit": factor_data["unit"],
-                    "name": factor_data["name"],
-                    "description": factor_data["description"]
-                }
-        
-        return None
-    
-    def get_all_activities(self) -> Dict:
-        """Get all available activities organized by category"""
-        result = {}
-        for category, activities in self.emission_factors.items():
-            result[category] = {}
-            for key, data in activities.items():
-                result[category][key] = {
+import numpy as np
+
+class EmissionFactor(NamedTuple):
+    """A single compiled entry of the emission factor table"""
+    key: str
+    factor: float
+    unit: str
+    category: str
+    name: str
+    description: str
+
+DEFAULT_FACTORS_PATH = os.path.join(os.path.dirname(__file__), "..", "emission_factors.json")
+
+def _validate_entry(category: str, key: str, data) -> None:
+    if not isinstance(data, dict):
+        raise ValueError(f"Factor '{category}.{key}' must be an object")
+    for field in ("name", "unit", "description"):
+        if not isinstance(data.get(field), str):
+            raise ValueError(f"Factor '{category}.{key}' is missing string field '{field}'")
+    factor = data.get("factor")
+    if isinstance(factor, bool) or not isinstance(factor, (int, float)) or not math.isfinite(factor):
+        raise ValueError(f"Factor '{category}.{key}' must have a finite numeric 'factor'")
+
+class SerializedBody(NamedTuple):
+    """A JSON response body encoded once, with its content-hash ETag"""
+    body: bytes
+    etag: str
+
+def serialize_body(content) -> SerializedBody:
+    """Encode content the way JSONResponse does and tag it with a hash of the bytes"""
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return SerializedBody(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+
+class FactorTable:
+    """Immutable lookup structures compiled once from the factor file.
+
+    A table is never modified after construction; reloads build a new one
+    and swap the reference, so a caller holding a table always sees one
+    consistent version.
+    """
+
+    __slots__ = (
+        "raw", "version", "loaded_at", "index", "factor_values", "activities", "categories",
+        "activities_body", "categories_body"
+    )
+
+    def __init__(self, raw: Dict, version: Optional[str] = None):
+        if not isinstance(raw, dict) or not raw:
+            raise ValueError("Factor file must be a non-empty object of categories")
+
+        index = {}
+        activities = {}
+        for category, entries in raw.items():
+            if not isinstance(entries, dict):
+                raise ValueError(f"Category '{category}' must be an object of activities")
+            activities[category] = {}
+            for key, data in entries.items():
+                _validate_entry(category, key, data)
+                activities[category][key] = {
                     "name": data["name"],
                     "unit": data["unit"],
                     "description": data["description"]
                 }
-        return result
-    
-    def get_activity_categories(self) -> list:
+                # The first category that defines a key wins, as in the nested scan
+                index.setdefault(key, EmissionFactor(
+                    key=key,
+                    factor=float(data["factor"]),
+                    unit=data["unit"],
+                    category=category,
+                    name=data["name"],
+                    description=data["description"]
+                ))
+
+        if version is None:
+            version = hashlib.sha256(json.dumps(raw, sort_keys=True).encode()).hexdigest()[:12]
+
+        self.raw: Dict = raw
+        self.version: str = version
+        self.loaded_at: datetime = datetime.now(timezone.utc)
+        self.index: Mapping[str, EmissionFactor] = MappingProxyType(index)
+        self.factor_values: Mapping[str, float] = MappingProxyType(
+            {key: entry.factor for key, entry in index.items()}
+        )
+        self.activities: Mapping[str, Mapping] = MappingProxyType({
+            category: MappingProxyType({key: MappingProxyType(entry) for key, entry in entries.items()})
+            for category, entries in activities.items()
+        })
+        self.categories: tuple = tuple(raw.keys())
+        # Catalog responses, encoded once per table rather than per request
+        self.activities_body: SerializedBody = serialize_body(activities)
+        self.categories_body: SerializedBody = serialize_body({"categories": list(self.categories)})
+
+def load_factor_table(path: str) -> FactorTable:
+    """Parse and validate a factor file; the version is a hash of its bytes"""
+    with open(path, "rb") as file:
+        content = file.read()
+    try:
+        raw = json.loads(content)
+    except ValueError as e:
+        raise ValueError(f"Factor file is not valid JSON: {e}") from e
+    return FactorTable(raw, version=hashlib.sha256(content).hexdigest()[:12])
+
+class EmissionService:
+    def __init__(self, path: Optional[str] = None, watch: bool = False, watch_interval: float = 2.0):
+        self.path = path or DEFAULT_FACTORS_PATH
+        self.watch = watch
+        self.watch_interval = watch_interval
+        # Loaded on first use (or by load() at startup), not at import
+        self._table: Optional[FactorTable] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        # Plain counters for /metrics; unlocked, so concurrent increments may rarely be lost
+        self.lookups = 0
+        self.lookup_misses = 0
+
+        # Serializes reloaders only; lookups never take it
+        self._reload_lock = threading.Lock()
+        self._file_stamp: Optional[tuple] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def table(self) -> FactorTable:
+        """The factor table currently in use"""
+        table = self._table
+        if table is None:
+            table = self.load()
+        return table
+
+    def load(self) -> FactorTable:
+        """Load the factor table if that has not happened yet"""
+        with self._reload_lock:
+            if self._table is None:
+                self._file_stamp = self._stat_file()
+                self._table = load_factor_table(self.path)
+            return self._table
+
+    @property
+    def emission_factors(self) -> Dict:
+        """Raw contents of the factor file currently in use"""
+        return self.table.raw
+
+    def _stat_file(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> bool:
+        """Re-read the factor file and swap in the new table if it changed.
+
+        Raises ValueError when the file does not validate; the current
+        table then stays in place. Returns whether a new version went live.
+        """
+        with self._reload_lock:
+            self._file_stamp = self._stat_file()
+            try:
+                table = load_factor_table(self.path)
+            except (OSError, ValueError):
+                self.reload_errors += 1
+                raise
+            if self._table is not None and table.version == self._table.version:
+                return False
+            # A single reference assignment: readers get the old table or the new one
+            self._table = table
+            self.reloads += 1
+        print(f"Loaded emission factors version {table.version} ({len(table.index)} activities)")
+        return True
+
+    def start_watching(self) -> None:
+        """Poll the factor file in a background thread and reload on change"""
+        if not self.watch or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self.load()
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, name="emission-factor-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Stop the file watcher, if running"""
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def _watch(self) -> None:
+        while not self._stop_watching.wait(self.watch_interval):
+            if self._stat_file() == self._file_stamp:
+                continue
+            try:
+                self.reload()
+            except (OSError, ValueError) as e:
+                # Often a half-written file; the next change triggers another attempt
+                print(f"Ignoring invalid emission factor file: {e}")
+
+    def info(self) -> Dict:
+        """Version and reload counters of the factor table in use"""
+        table = self.table
+        return {
+            "version": table.version,
+            "loaded_at": table.loaded_at,
+            "activities": len(table.index),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "watching": self._watcher is not None and self._watcher.is_alive()
+        }
+
+    def get_factor(self, activity_type: str) -> Optional[EmissionFactor]:
+        """Get the compiled factor entry for an activity type"""
+        return self.table.index.get(activity_type)
+
+    def calculate_emissions(self, activity_type: str, quantity: float) -> Optional[Dict]:
+        """Calculate CO2 emissions for a given activity and quantity"""
+        # Read the table once so the whole result comes from one version
+        table = self.table
+        entry = table.index.get(activity_type)
+        self.lookups += 1
+        if entry is None:
+            self.lookup_misses += 1
+            return None
+
+        return {
+            "activity_type": activity_type,
+            "quantity": quantity,
+            "co2_emissions": round(entry.factor * quantity, 3),
+            "unit": entry.unit,
+            "name": entry.name,
+            "description": entry.description,
+            "factor_version": table.version
+        }
+
+    def calculate_emissions_batch(
+        self,
+        activity_types: Sequence[str],
+        quantities: Sequence[float],
+        table: Optional[FactorTable] = None
+    ) -> np.ndarray:
+        """Calculate CO2 emissions for many activities in one vectorized pass.
+
+        Returns an array aligned with the inputs; entries for unknown
+        activity types are NaN. Pass the `table` read by the caller to
+        price against the same version the caller reports.
+        """
+        factors = (table or self.table).factor_values
+        factor_array = np.fromiter(
+            (factors.get(activity_type, np.nan) for activity_type in activity_types),
+            dtype=np.float64,
+            count=len(activity_types),
+        )
+        self.lookups += len(factor_array)
+        self.lookup_misses += int(np.isnan(factor_array).sum())
+        products = factor_array * np.asarray(quantities, dtype=np.float64)
+        # Builtin round() like calculate_emissions; np.round scales by 1000 first
+        # and can land half-way values on the other side
+        return np.fromiter((round(value, 3) for value in products.tolist()), dtype=np.float64, count=len(products))
+
+    def get_unit(self, activity_type: str) -> Optional[str]:
+        """Get the unit string for an activity type"""
+        entry = self.table.index.get(activity_type)
+        return entry.unit if entry is not None else None
+
+    def get_all_activities(self) -> Mapping[str, Mapping]:
+        """Get all available activities organized by category.
+
+        The catalog is built once at load time and shared between calls,
+        so it is returned as a read-only view.
+        """
+        return self.table.activities
+
+    def get_activity_categories(self) -> List[str]:
         """Get list of all activity categories"""
-        return list(self.emission_factors.keys())
+        return list(self.table.categories)
 
 # Global instance
-emission_service = EmissionService()
\ No newline at end of file
+emission_service = EmissionService(
+    path=os.getenv("EMISSION_FACTORS_PATH"),
+    watch=os.getenv("EMISSION_FACTORS_WATCH", "false").lower() in ("1", "true", "yes"),
+    watch_interval=float(os.getenv("EMISSION_FACTORS_WATCH_INTERVAL", "2"))
+)
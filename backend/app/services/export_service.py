@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import chain, islice
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import select
+
+from ..database import engine
+from ..models.database import Activity, User
+from .archive_service import activity_archive, merge_oldest_first
+
+EXPORT_COLUMNS = ("id", "user_email", "activity_type", "quantity", "co2_emissions", "created_at")
+
+USER_EXPORT_COLUMNS = ("id", "email", "is_subscribed", "created_at")
+
+def iter_activity_chunks(
+    user_email: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 1000
+) -> Iterator[Sequence[tuple]]:
+    """Stream a user's activities oldest first, `chunk_size` rows at a time.
+
+    Uses yield_per (a server-side cursor on Postgres) on its own
+    connection, so memory stays flat however many rows the user has.
+    Archived rows are read a month at a time and merged in.
+    """
+    query = select(*(getattr(Activity, column) for column in EXPORT_COLUMNS)).where(
+        Activity.user_email == user_email
+    )
+    if start:
+        query = query.where(Activity.created_at >= start)
+    if end:
+        query = query.where(Activity.created_at < end)
+    query = query.order_by(Activity.created_at, Activity.id)
+
+    if not activity_archive.has_data():
+        yield from _iter_chunks(query, chunk_size)
+        return
+    rows = merge_oldest_first(
+        activity_archive.iter_rows(user_email, start, end),
+        chain.from_iterable(_iter_chunks(query, chunk_size))
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+def iter_user_chunks(conditions: Sequence = (), chunk_size: int = 1000) -> Iterator[Sequence[tuple]]:
+    """Stream users matching `conditions` in id order, `chunk_size` rows at a time"""
+    query = select(*(getattr(User, column) for column in USER_EXPORT_COLUMNS)).where(*conditions)
+    yield from _iter_chunks(query.order_by(User.id), chunk_size)
+
+def _iter_chunks(query, chunk_size: int) -> Iterator[Sequence[tuple]]:
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def stream_csv(chunks: Iterator[Sequence[tuple]]) -> Iterator[str]:
+    """Render activity chunks as CSV text, one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([[_format_value(value) for value in row] for row in chunk])
+        yield buffer.getvalue()
+
+def stream_ndjson(
+    chunks: Iterator[Sequence[tuple]], columns: Sequence[str] = EXPORT_COLUMNS
+) -> Iterator[str]:
+    """Render row chunks as newline-delimited JSON, one piece per chunk"""
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(columns, (_format_value(value) for value in row)))) + "\n"
+            for row in chunk
+        )
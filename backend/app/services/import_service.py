@@ -0,0 +1,310 @@
+import csv
+import io
+import json
+import math
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pydantic.networks import validate_email
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal, read_replica
+from ..models.database import Activity
+from .emission_service import emission_service
+from .live_service import live_updates
+from .pagination import SQLITE_DATETIME_FORMAT
+from .ranking_service import user_ranking
+from .rollup_service import apply_rollup_deltas, category_for
+from .user_service import ensure_users, known_users
+
+IMPORT_COLUMNS = ("user_email", "activity_type", "quantity", "co2_emissions", "created_at")
+
+# Only the first few rejected rows are reported back individually
+MAX_REPORTED_ERRORS = 100
+
+EPOCH = date(1970, 1, 1)
+
+def _iter_csv(stream: IO[bytes]) -> Iterator[Optional[Dict]]:
+    """Records of a CSV upload; None for a row that is not valid UTF-8"""
+    # Invalid bytes decode to lone surrogates, so one bad row does not abort the upload
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="surrogateescape", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [column.strip() for column in next(reader, [])]
+        for values in reader:
+            line = "".join(values)
+            if not line.isascii():
+                try:
+                    line.encode("utf-8")
+                except UnicodeEncodeError:
+                    yield None
+                    continue
+            yield dict(zip(header, values))
+    finally:
+        text.detach()
+
+def _iter_ndjson(stream: IO[bytes]) -> Iterator[Dict]:
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else {}
+
+def _parse_timestamp(value) -> datetime:
+    timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+class ActivityChunk:
+    """Column lists for one chunk of validated rows"""
+
+    __slots__ = ("emails", "types", "quantities", "timestamps", "co2")
+
+    def __init__(self):
+        self.emails: List[str] = []
+        self.types: List[str] = []
+        self.quantities: List[float] = []
+        self.timestamps: List[datetime] = []
+        self.co2: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def rows(self) -> List[Dict]:
+        return [
+            dict(zip(IMPORT_COLUMNS, values))
+            for values in zip(self.emails, self.types, self.quantities, self.co2, self.timestamps)
+        ]
+
+class ActivityImporter:
+    """Validate, price and bulk-write an uploaded activity file chunk by chunk"""
+
+    def __init__(self, default_user_email: Optional[str] = None, chunk_size: int = 50000):
+        self.default_user_email = default_user_email
+        self.chunk_size = chunk_size
+        self.accepted = 0
+        self.rejected = 0
+        self.total_co2_emissions = 0.0
+        self.errors: List[Dict] = []
+        # Files usually repeat timestamps (daily data), so parse each one once per chunk
+        self._timestamps: Dict[str, datetime] = {}
+        self._emails: Dict[str, Optional[str]] = {}
+
+    def _reject(self, row_number: int, error: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": error})
+
+    def run(self, stream: IO[bytes], format: str = "csv") -> Dict:
+        """Import every record in the stream and return the report"""
+        records = _iter_ndjson(stream) if format == "ndjson" else _iter_csv(stream)
+        with SessionLocal() as session:
+            chunk = []
+            for row_number, record in enumerate(records, start=1):
+                chunk.append((row_number, record))
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(session, chunk)
+                    chunk = []
+            if chunk:
+                self._import_chunk(session, chunk)
+
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "total_co2_emissions": round(self.total_co2_emissions, 3),
+            "errors": self.errors
+        }
+
+    def _timestamp(self, value) -> datetime:
+        key = str(value)
+        timestamp = self._timestamps.get(key)
+        if timestamp is None:
+            timestamp = self._timestamps[key] = _parse_timestamp(key)
+        return timestamp
+
+    def _email(self, value: str) -> Optional[str]:
+        """The address normalized as the API's EmailStr fields do, or None if invalid"""
+        if value not in self._emails:
+            try:
+                _, email = validate_email(value)
+            except ValueError:
+                email = None
+            self._emails[value] = email if email is not None and len(email) <= 255 else None
+        return self._emails[value]
+
+    def _import_chunk(self, session: Session, records: List[Tuple[int, Dict]]) -> None:
+        imported_at = datetime.now(timezone.utc)
+        # Validate and price the chunk against one factor table version
+        table = emission_service.table
+        factors = table.factor_values
+        default_email = self.default_user_email
+
+        # Per-row parsing and validation; pricing and rollups are vectorized
+        # The parse caches only live for one chunk, keeping memory bounded by the chunk size
+        self._timestamps.clear()
+        self._emails.clear()
+        chunk = ActivityChunk()
+        for row_number, record in records:
+            if record is None:
+                self._reject(row_number, "Row is not valid UTF-8")
+                continue
+            activity_type = record.get("activity_type")
+            if not isinstance(activity_type, str):
+                self._reject(row_number, "activity_type must be a string")
+                continue
+            if activity_type not in factors:
+                self._reject(row_number, f"Activity type '{activity_type}' not found")
+                continue
+            email = record.get("user_email") or default_email
+            email = self._email(email) if isinstance(email, str) else None
+            if email is None:
+                self._reject(row_number, "Missing or invalid user_email")
+                continue
+            try:
+                quantity = float(record.get("quantity"))
+            except (TypeError, ValueError):
+                self._reject(row_number, "Quantity must be a number")
+                continue
+            if not math.isfinite(quantity):
+                self._reject(row_number, "Quantity must be a finite number")
+                continue
+            created_at = record.get("created_at")
+            try:
+                timestamp = self._timestamp(created_at) if created_at else imported_at
+            except ValueError:
+                self._reject(row_number, "created_at must be an ISO 8601 timestamp")
+                continue
+            chunk.emails.append(email)
+            chunk.types.append(activity_type)
+            chunk.quantities.append(quantity)
+            chunk.timestamps.append(timestamp)
+
+        if not chunk:
+            return
+
+        emissions = emission_service.calculate_emissions_batch(chunk.types, chunk.quantities, table=table)
+        chunk.co2 = emissions.tolist()
+
+        unknown = ensure_users(session, set(chunk.emails))
+        write_activities(session, chunk)
+        deltas = vectorized_rollups(chunk)
+        apply_rollup_deltas(session, deltas)
+        session.commit()
+        known_users.add_many(unknown)
+        user_ranking.record(deltas)
+        read_replica.note_write(set(chunk.emails))
+        if live_updates.watching(chunk.emails):
+            live_updates.publish(chunk.rows())
+
+        self.accepted += len(chunk)
+        self.total_co2_emissions += float(emissions.sum())
+
+def write_activities(session: Session, chunk: ActivityChunk) -> None:
+    """Bulk-insert a chunk: COPY on Postgres (psycopg2), raw executemany on SQLite"""
+    connection = session.connection()
+    dialect = connection.dialect
+
+    if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(
+            chunk.emails,
+            chunk.types,
+            chunk.quantities,
+            chunk.co2,
+            (timestamp.isoformat() for timestamp in chunk.timestamps)
+        ))
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY activities ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+        return
+
+    if dialect.name == "sqlite":
+        # Skip per-row bind processing; format each distinct timestamp once
+        formatted = {}
+        created_at = [
+            formatted.get(timestamp) or formatted.setdefault(timestamp, timestamp.strftime(SQLITE_DATETIME_FORMAT))
+            for timestamp in chunk.timestamps
+        ]
+        connection.exec_driver_sql(
+            f"INSERT INTO activities ({', '.join(IMPORT_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+            list(zip(chunk.emails, chunk.types, chunk.quantities, chunk.co2, created_at))
+        )
+        return
+
+    session.execute(insert(Activity.__table__), chunk.rows())
+
+def vectorized_rollups(chunk: ActivityChunk) -> Dict[tuple, list]:
+    """Aggregate a chunk into rollup deltas with NumPy group-bys"""
+    email_index: Dict[str, int] = {}
+    email_codes = np.fromiter(
+        (email_index.setdefault(email, len(email_index)) for email in chunk.emails),
+        dtype=np.int64,
+        count=len(chunk)
+    )
+    category_index: Dict[str, int] = {}
+    type_categories: Dict[str, int] = {}
+    for activity_type in set(chunk.types):
+        type_categories[activity_type] = category_index.setdefault(category_for(activity_type), len(category_index))
+    category_codes = np.fromiter(
+        (type_categories[activity_type] for activity_type in chunk.types),
+        dtype=np.int64,
+        count=len(chunk)
+    )
+    day_cache: Dict[datetime, int] = {}
+    days = np.fromiter(
+        (day_cache.get(ts) if ts in day_cache else day_cache.setdefault(ts, (ts.date() - EPOCH).days)
+         for ts in chunk.timestamps),
+        dtype=np.int64,
+        count=len(chunk)
+    )
+    co2 = np.asarray(chunk.co2, dtype=np.float64)
+
+    # 1970-01-01 was a Thursday, so Monday-based weeks start 3 days "earlier"
+    buckets = {
+        "day": days,
+        "week": days - (days + 3) % 7,
+        "month": days.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    }
+
+    emails = list(email_index)
+    categories = list(category_index)
+    n_categories = len(categories)
+    totals: Dict[tuple, list] = defaultdict(lambda: [0.0, 0])
+    for period, starts in buckets.items():
+        # Pack (start, email, category) into one integer key per row
+        start_base = starts.min()
+        keys = ((starts - start_base) * len(emails) + email_codes) * n_categories + category_codes
+        unique_keys, group = np.unique(keys, return_inverse=True)
+        sums = np.bincount(group, weights=co2, minlength=len(unique_keys))
+        counts = np.bincount(group, minlength=len(unique_keys))
+        for key, total, count in zip(unique_keys.tolist(), sums.tolist(), counts.tolist()):
+            rest, category_code = divmod(key, n_categories)
+            start_offset, email_code = divmod(rest, len(emails))
+            start = date.fromordinal(EPOCH.toordinal() + int(start_base) + start_offset)
+            bucket = totals[(emails[email_code], period, start, categories[category_code])]
+            bucket[0] += total
+            bucket[1] += count
+    return totals
+
+def import_activities(
+    stream: IO[bytes],
+    format: str = "csv",
+    default_user_email: Optional[str] = None,
+    chunk_size: int = 50000
+) -> Dict:
+    """Import a CSV or NDJSON activity file and return accepted/rejected counts"""
+    return ActivityImporter(default_user_email, chunk_size).run(stream, format)
@@ -0,0 +1,371 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import database
+from .rollup_service import running_totals
+from .serialization import encode_json
+
+# Totals are read for at most this many users per query
+TOTALS_CHUNK = 500
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+def sse_frame(event: str, data) -> bytes:
+    """One Server-Sent Events message"""
+    return b"event: " + event.encode() + b"\ndata: " + encode_json(data) + b"\n\n"
+
+def _timestamp(value: Optional[datetime]) -> str:
+    # Rows carry aware UTC timestamps, or naive ones meaning UTC
+    value = value or datetime.now(timezone.utc)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+class Subscription:
+    """One client's undelivered updates.
+
+    New activities wait in a deque of at most `backlog` frames; older ones
+    are dropped and counted so the client knows to re-read its history.
+    Only the newest running total is kept, so an idle or slow client holds
+    a bounded amount of memory however many writes it misses.
+    """
+
+    __slots__ = ("email", "activities", "total", "sent_total", "dropped", "wakeup")
+
+    def __init__(self, email: str, backlog: int):
+        self.email = email
+        self.activities = deque(maxlen=backlog)
+        self.total: Optional[bytes] = None
+        self.sent_total: Optional[tuple] = None
+        self.dropped = 0
+        self.wakeup = asyncio.Event()
+
+    def push_activities(self, frames: List[bytes], skipped: int) -> None:
+        overflow = len(self.activities) + len(frames) - self.activities.maxlen
+        self.dropped += skipped + max(overflow, 0)
+        self.activities.extend(frames)
+        self.wakeup.set()
+
+    def push_total(self, total: tuple, frame: bytes) -> None:
+        if total == self.sent_total:
+            return
+        self.sent_total = total
+        self.total = frame
+        self.wakeup.set()
+
+    def drain(self) -> bytes:
+        """Pending frames: a drop notice, then activities oldest first, then the total"""
+        frames = []
+        if self.dropped:
+            frames.append(sse_frame("dropped", {"dropped": self.dropped}))
+            self.dropped = 0
+        frames.extend(self.activities)
+        self.activities.clear()
+        if self.total is not None:
+            frames.append(self.total)
+            self.total = None
+        self.wakeup.clear()
+        return b"".join(frames)
+
+class LiveUpdates:
+    """Pushes users' new activities and running CO2 totals to open streams.
+
+    Writers call `publish` after their transaction commits, from any
+    thread. Messages carry the new activities only; each worker re-reads
+    the running totals (from the month rollups) of the users its clients
+    watch, batching every user that changed since the last read into one
+    query, so totals are never computed for users nobody watches and
+    concurrent writes cannot leave a stale total behind.
+
+    With `redis_url` set, messages go through a Redis pub/sub channel so
+    a write on one worker reaches streams held by every worker; otherwise
+    they are delivered in-process and cost nothing when the written
+    users have no open stream.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        redis_url: Optional[str] = None,
+        channel: str = "carbon_tracker:live",
+        backlog: int = 20,
+        keepalive_seconds: float = 15,
+        max_connections: int = 10000,
+        outbox_size: int = 10000
+    ):
+        self.enabled = enabled
+        self.redis_url = redis_url
+        self.channel = channel
+        self.backlog = backlog
+        self.keepalive_seconds = keepalive_seconds
+        self.max_connections = max_connections
+        self.outbox_size = outbox_size
+
+        self.connections = 0
+        self.published = 0
+        self.dropped_messages = 0
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._dirty: Set[str] = set()
+        self._dirty_event: Optional[asyncio.Event] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sync_redis = None
+        self._closing = False
+
+    @property
+    def full(self) -> bool:
+        return self.connections >= self.max_connections
+
+    def watching(self, emails: Iterable[str]) -> bool:
+        """Whether a write for these users has anyone to reach"""
+        if not self.enabled:
+            return False
+        if self.redis_url:
+            return True
+        if not self._subscribers:
+            return False
+        return any(email in self._subscribers for email in emails)
+
+    def publish(self, rows: Iterable[Dict]) -> None:
+        """Announce committed activity rows. Safe to call from any thread."""
+        if not self.enabled:
+            return
+        grouped: Dict[str, list] = {}
+        for row in rows:
+            email = row["user_email"]
+            if self.redis_url or email in self._subscribers:
+                grouped.setdefault(email, []).append(row)
+        if not grouped:
+            return
+        messages = []
+        for email, user_rows in grouped.items():
+            # Only the newest `backlog` activities could reach a client anyway
+            messages.append({
+                "user_email": email,
+                "activities": [
+                    {
+                        "activity_type": row["activity_type"],
+                        "quantity": row["quantity"],
+                        "co2_emissions": row["co2_emissions"],
+                        "created_at": _timestamp(row.get("created_at"))
+                    }
+                    for row in user_rows[-self.backlog:]
+                ],
+                "skipped": max(len(user_rows) - self.backlog, 0)
+            })
+        self.published += len(messages)
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._route, messages)
+                return
+            except RuntimeError:
+                pass
+        if self.redis_url:
+            # No event loop here (scripts): publish directly
+            self._publish_sync(messages)
+
+    def subscribe(self, email: str) -> Optional[Subscription]:
+        """Open a stream for a user, or None when the worker is at `max_connections`"""
+        if self.full:
+            return None
+        self._ensure_running()
+        subscription = Subscription(email, self.backlog)
+        self._subscribers.setdefault(email, set()).add(subscription)
+        self.connections += 1
+        # The first frame is the current total
+        self._mark_dirty(email)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscribers.get(subscription.email)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscribers[subscription.email]
+        self.connections -= 1
+
+    async def stream(self, subscription: Subscription):
+        """SSE body for one client: pending updates as they arrive, keepalives in between"""
+        try:
+            yield b"retry: 5000\n\n"
+            while not self._closing:
+                if not subscription.wakeup.is_set():
+                    try:
+                        await asyncio.wait_for(subscription.wakeup.wait(), self.keepalive_seconds)
+                    except asyncio.TimeoutError:
+                        yield KEEPALIVE_FRAME
+                        continue
+                body = subscription.drain()
+                if body:
+                    yield body
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if self.redis_url else "memory",
+            "connections": self.connections,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "dropped_messages": self.dropped_messages
+        }
+
+    async def start(self) -> None:
+        if self.enabled:
+            self._ensure_running()
+
+    async def stop(self) -> None:
+        """Stop the background tasks and end every open stream"""
+        self._closing = True
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.wakeup.set()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First use, or a new event loop (the old one's tasks are gone)
+        self._loop = loop
+        self._closing = False
+        self._dirty_event = asyncio.Event()
+        self._tasks = [loop.create_task(self._refresh_totals())]
+        if self.redis_url:
+            self._outbox = asyncio.Queue(self.outbox_size)
+            self._tasks.append(loop.create_task(self._listen()))
+            self._tasks.append(loop.create_task(self._send()))
+        if self._dirty:
+            self._dirty_event.set()
+
+    def _route(self, messages: List[Dict]) -> None:
+        if not self.redis_url:
+            for message in messages:
+                self._deliver(message)
+            return
+        for message in messages:
+            try:
+                self._outbox.put_nowait(encode_json(message))
+            except asyncio.QueueFull:
+                self.dropped_messages += 1
+
+    def _deliver(self, message: Dict) -> None:
+        email = message["user_email"]
+        subscriptions = self._subscribers.get(email)
+        if not subscriptions:
+            return
+        frames = [sse_frame("activity", activity) for activity in message["activities"]]
+        for subscription in subscriptions:
+            subscription.push_activities(frames, message.get("skipped", 0))
+        self._mark_dirty(email)
+
+    def _mark_dirty(self, email: str) -> None:
+        self._dirty.add(email)
+        if self._dirty_event is not None:
+            self._dirty_event.set()
+
+    def _load_totals(self, emails: List[str]) -> Dict:
+        with database.SessionLocal() as session:
+            totals = {}
+            for first in range(0, len(emails), TOTALS_CHUNK):
+                totals.update(running_totals(session, emails[first:first + TOTALS_CHUNK]))
+            return totals
+
+    async def _refresh_totals(self) -> None:
+        while True:
+            await self._dirty_event.wait()
+            self._dirty_event.clear()
+            emails = [email for email in self._dirty if email in self._subscribers]
+            self._dirty.clear()
+            if not emails:
+                continue
+            try:
+                totals = await run_in_threadpool(self._load_totals, emails)
+            except Exception as e:
+                print(f"Live updates: failed to read running totals: {e}")
+                self._dirty.update(emails)
+                await asyncio.sleep(1)
+                self._dirty_event.set()
+                continue
+            for email, (total_co2, activity_count) in totals.items():
+                frame = sse_frame("total", {
+                    "user_email": email,
+                    "total_co2": total_co2,
+                    "activity_count": activity_count
+                })
+                for subscription in self._subscribers.get(email, ()):
+                    subscription.push_total((total_co2, activity_count), frame)
+
+    async def _send(self) -> None:
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(self.redis_url)
+        try:
+            while True:
+                payload = await self._outbox.get()
+                try:
+                    await client.publish(self.channel, payload)
+                except Exception as e:
+                    self.dropped_messages += 1
+                    print(f"Live updates: Redis publish failed: {e}")
+        finally:
+            await client.aclose()
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            client = aioredis.from_url(self.redis_url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Live updates: Redis listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+    def _publish_sync(self, messages: List[Dict]) -> None:
+        try:
+            if self._sync_redis is None:
+                import redis
+
+                self._sync_redis = redis.Redis.from_url(self.redis_url)
+            for message in messages:
+                self._sync_redis.publish(self.channel, encode_json(message))
+        except Exception as e:
+            self.dropped_messages += len(messages)
+            print(f"Live updates: Redis publish failed: {e}")
+
+# Global instance
+live_updates = LiveUpdates(
+    enabled=os.getenv("LIVE_UPDATES_ENABLED", "true").lower() in ("1", "true", "yes"),
+    redis_url=os.getenv("REDIS_URL") if os.getenv("LIVE_UPDATES_BACKEND", "memory") == "redis" else None,
+    backlog=int(os.getenv("LIVE_UPDATES_BACKLOG", "20")),
+    keepalive_seconds=float(os.getenv("LIVE_UPDATES_KEEPALIVE_SECONDS", "15")),
+    max_connections=int(os.getenv("LIVE_UPDATES_MAX_CONNECTIONS", "10000"))
+)
@@ -0,0 +1,356 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds; the +Inf bucket is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0, 3600.0)
+
+# Label used for requests that matched no route, to keep label cardinality bounded
+UNMATCHED_ROUTE = "unmatched"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names: Sequence[str], values: Tuple) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, one series per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labels, key)} {_format_number(value)}" for key, value in values]
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+class Histogram:
+    """Fixed-bucket histogram, one series per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _label_text(self.labels + ("le",), key + (_format_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Register a callback that renders extra lines at scrape time"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+# Global instance
+registry = MetricsRegistry()
+
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the last response byte, per route",
+    labels=("method", "route", "status")
+))
+REQUEST_DB_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    labels=("method", "route"), buckets=QUERY_COUNT_BUCKETS
+))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request",
+    labels=("method", "route")
+))
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of individual SQL statements",
+    labels=("engine",)
+))
+DB_POOL_CHECKOUT = registry.register(Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled connection",
+    labels=("engine",)
+))
+DB_POOL_CHECKOUTS = registry.register(Counter(
+    "db_pool_checkouts_total", "Connections checked out of the pool",
+    labels=("engine",)
+))
+DB_POOL_CONNECTIONS = registry.register(Counter(
+    "db_pool_connections_opened_total", "New database connections opened by the pool",
+    labels=("engine",)
+))
+BACKGROUND_TASK_DURATION = registry.register(Histogram(
+    "background_task_duration_seconds", "Duration of background tasks such as emails",
+    labels=("task", "outcome"), buckets=TASK_BUCKETS
+))
+
+# [statement count, seconds] of the request being served; shared with threadpool work
+_request_db_stats: ContextVar[Optional[list]] = ContextVar("request_db_stats", default=None)
+
+# Engine label -> Engine, read at scrape time for the pool gauges
+_instrumented_engines: Dict[str, object] = {}
+
+def instrument_engine(engine, name: str) -> None:
+    """Time SQL statements and pool checkouts of a (sync) Engine"""
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        DB_QUERY_DURATION.observe(elapsed, name)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Keep the timing stack balanced when a statement fails
+        connection = context.connection
+        if connection is not None and connection.info.get("query_started_at"):
+            connection.info["query_started_at"].pop()
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.inc(name)
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc(name)
+
+    # Pools have no event before a checkout starts, so the wait is timed around
+    # Engine.raw_connection(). It is shadowed on the engine rather than the pool,
+    # and pool events carry over, so both survive dispose()/recreate().
+    raw_connection = engine.raw_connection
+
+    @functools.wraps(raw_connection)
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started, name)
+
+    engine.raw_connection = timed_raw_connection
+    _instrumented_engines[name] = engine
+
+def pool_samples() -> List[str]:
+    """Pool state of every instrumented engine, one series per engine"""
+    lines = []
+    for metric, method, description in (
+        ("db_pool_checked_out", "checkedout", "Connections currently checked out of the pool"),
+        ("db_pool_size", "size", "Configured size of the connection pool")
+    ):
+        # QueuePool reports its state; NullPool/StaticPool (SQLite) have none
+        values = [
+            (name, getattr(engine.pool, method)())
+            for name, engine in list(_instrumented_engines.items())
+            if callable(getattr(engine.pool, method, None))
+        ]
+        if values:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(f'{metric}{{engine="{_escape(name)}"}} {value}' for name, value in values)
+    return lines
+
+registry.add_collector(pool_samples)
+
+def factor_lookup_samples() -> List[str]:
+    """Emission factor lookup counters, read from the service at scrape time"""
+    from .emission_service import emission_service
+
+    return [
+        "# HELP emission_factor_lookups_total Emission factor lookups made to price activities",
+        "# TYPE emission_factor_lookups_total counter",
+        f'emission_factor_lookups_total{{result="hit"}} {emission_service.lookups - emission_service.lookup_misses}',
+        f'emission_factor_lookups_total{{result="miss"}} {emission_service.lookup_misses}',
+        "# HELP emission_factor_version_info Version of the emission factor table in use",
+        "# TYPE emission_factor_version_info gauge",
+        f'emission_factor_version_info{{version="{emission_service.table.version}"}} 1'
+    ]
+
+registry.add_collector(factor_lookup_samples)
+
+def replica_samples() -> List[str]:
+    """Read routing between the replica and the primary"""
+    from ..database import read_replica
+
+    if not read_replica.enabled:
+        return []
+    return [
+        "# HELP db_read_sessions_total Read-only sessions opened, by the database that served them",
+        "# TYPE db_read_sessions_total counter",
+        *(f'db_read_sessions_total{{target="{target}"}} {count}' for target, count in read_replica.reads.items()),
+        "# HELP db_replica_healthy Whether the read replica passed its last health check",
+        "# TYPE db_replica_healthy gauge",
+        f"db_replica_healthy {int(read_replica.healthy)}",
+        "# HELP db_replica_failures_total Replica queries or health checks that failed",
+        "# TYPE db_replica_failures_total counter",
+        f"db_replica_failures_total {read_replica.failures}"
+    ]
+
+registry.add_collector(replica_samples)
+
+def live_update_samples() -> List[str]:
+    """Open live-update streams on this worker"""
+    from .live_service import live_updates
+
+    if not live_updates.enabled:
+        return []
+    return [
+        "# HELP live_update_connections Open live-update streams",
+        "# TYPE live_update_connections gauge",
+        f"live_update_connections {live_updates.connections}",
+        "# HELP live_update_messages_dropped_total Live-update messages dropped before reaching Redis",
+        "# TYPE live_update_messages_dropped_total counter",
+        f"live_update_messages_dropped_total {live_updates.dropped_messages}"
+    ]
+
+registry.add_collector(live_update_samples)
+
+def timed_task(name: str, fn: Callable) -> Callable:
+    """Wrap a background task function so its duration and outcome are recorded"""
+    if not METRICS_ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "failed" if result is False else "ok"
+            return result
+        finally:
+            BACKGROUND_TASK_DURATION.observe(time.perf_counter() - started, name, outcome)
+
+    return wrapper
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and SQL usage.
+
+    Latency is taken when the last body chunk is sent, so background
+    tasks that run after the response do not count towards it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = [0, 0.0]
+        token = _request_db_stats.set(stats)
+        finished = []
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finished.append((time.perf_counter() - started, stats[0], stats[1]))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_db_stats.reset(token)
+            elapsed, queries, db_seconds = finished[0] if finished else (time.perf_counter() - started, stats[0], stats[1])
+            # The router records the matched route in the (shared) scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            REQUEST_DURATION.observe(elapsed, method, route_path, status[0])
+            REQUEST_DB_QUERIES.observe(queries, method, route_path)
+            REQUEST_DB_SECONDS.observe(db_seconds, method, route_path)
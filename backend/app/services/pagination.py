@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+from sqlalchemy import String, and_, or_, type_coerce
+
+# How SQLAlchemy writes DateTime values to SQLite (compared as text there)
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+def encode_cursor(*values: Any) -> str:
+    """Encode keyset values into an opaque, URL-safe cursor"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor produced by encode_cursor into its raw JSON values"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise InvalidCursorError("Invalid cursor")
+    return values
+
+def decode_timestamp_cursor(cursor: str) -> tuple:
+    """Decode a (created_at, id) cursor"""
+    values = decode_cursor(cursor)
+    try:
+        created_at, row_id = values
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+def newest_first_after(created_at_column, id_column, created_at: datetime, row_id: int, dialect: str):
+    """Keyset condition for the rows after (created_at, row_id) in newest-first order.
+
+    SQLite compares timestamps as text, and rows stamped by the
+    CURRENT_TIMESTAMP server default are stored without a fraction
+    ("...:SS" rather than "...:SS.000000"). For a cursor on a whole second
+    both spellings count as that second, so the cursor always moves on.
+    """
+    if dialect != "sqlite" or created_at.microsecond:
+        return or_(
+            created_at_column < created_at,
+            and_(created_at_column == created_at, id_column < row_id)
+        )
+    stored = type_coerce(created_at_column, String)
+    whole_second = created_at.strftime("%Y-%m-%d %H:%M:%S")
+    return or_(
+        stored < whole_second,
+        and_(stored.in_([whole_second, created_at.strftime(SQLITE_DATETIME_FORMAT)]), id_column < row_id)
+    )
+
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalize a filter timestamp to UTC; naive values are taken as UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc)
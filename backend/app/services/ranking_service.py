@@ -0,0 +1,322 @@
+import asyncio
+import json
+import math
+import os
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import database
+from ..models.database import EmissionRollup, RankingSnapshot
+
+PERIOD = "month"
+
+class RankingNotReadyError(RuntimeError):
+    """Raised by rank() before the warm-up has loaded a snapshot or rebuilt the sketch"""
+
+class LogHistogramSketch:
+    """Quantile sketch over logarithmic buckets (the DDSketch layout).
+
+    Bucket i holds values in (gamma**(i-1), gamma**i] above `min_value`,
+    with gamma = (1 + alpha) / (1 - alpha), so every value in a bucket is
+    within relative error `alpha` of the bucket's representative value.
+    Unlike t-digest or KLL it supports exact deletions, which is what a
+    sketch of *changing* per-user totals needs: an update removes the old
+    total and adds the new one. Values at or below `min_value` (including
+    zero and negative totals) share bucket 0; values above `max_value`
+    share the last bucket. Memory and query cost depend only on the
+    bucket count, never on the number of values.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3, max_value: float = 1e9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bucket_count = math.ceil(math.log(max_value / min_value) / self._log_gamma) + 2
+        self.counts = np.zeros(self.bucket_count, dtype=np.int64)
+        self.total = 0
+
+    def bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = math.ceil(math.log(value / self.min_value) / self._log_gamma)
+        return min(max(index, 1), self.bucket_count - 1)
+
+    def add(self, value: float) -> None:
+        self.counts[self.bucket(value)] += 1
+        self.total += 1
+
+    def remove(self, value: float) -> None:
+        index = self.bucket(value)
+        if self.counts[index] > 0:
+            self.counts[index] -= 1
+            self.total -= 1
+
+    def rank(self, value: float) -> Tuple[float, float]:
+        """Share of values below `value`, and the maximum error of that share.
+
+        Values in the same bucket as `value` are counted as half below and
+        half above; the error is therefore at most half that bucket's share.
+        """
+        if self.total == 0:
+            return 0.0, 0.0
+        index = self.bucket(value)
+        below = int(self.counts[:index].sum())
+        same = int(self.counts[index])
+        return (below + same / 2) / self.total, same / 2 / self.total
+
+    def value_at(self, quantile: float) -> float:
+        """Approximate value at a quantile, within the relative accuracy"""
+        if self.total == 0:
+            return 0.0
+        target = quantile * (self.total - 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), target, side="right"))
+        if index == 0:
+            return self.min_value
+        # Midpoint (in relative terms) of the bucket's range
+        return self.min_value * self.gamma ** index * 2 / (1 + self.gamma)
+
+    def to_json(self) -> str:
+        nonzero = np.nonzero(self.counts)[0]
+        return json.dumps({str(i): int(self.counts[i]) for i in nonzero})
+
+    def load_json(self, payload: str) -> None:
+        self.counts[:] = 0
+        for index, count in json.loads(payload).items():
+            self.counts[int(index)] = count
+        self.total = int(self.counts.sum())
+
+def current_period_start(now: Optional[datetime] = None) -> date:
+    return (now or datetime.now(timezone.utc)).date().replace(day=1)
+
+class UserRanking:
+    """Percentile rank of users' monthly CO2 totals against all active users.
+
+    Holds each active user's total for the current month and a sketch of
+    those totals. Writes feed it rollup deltas after they commit; a
+    rebuild recomputes everything from the month rollups. The compact
+    sketch is persisted periodically so a restarted worker can answer
+    from it while its own rebuild runs. With several workers each process
+    only sees its own writes between rebuilds, so `refresh_seconds`
+    bounds how far they drift apart.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        relative_accuracy: float = 0.01,
+        persist_seconds: float = 60,
+        refresh_seconds: float = 900
+    ):
+        self.enabled = enabled
+        self.relative_accuracy = relative_accuracy
+        self.persist_seconds = persist_seconds
+        self.refresh_seconds = refresh_seconds
+
+        self.period_start = current_period_start()
+        self.sketch = LogHistogramSketch(relative_accuracy)
+        self.totals: Dict[str, float] = {}
+        # False until a rebuild has loaded every user's total
+        self.live = False
+        self.as_of: Optional[datetime] = None
+
+        self._lock = threading.Lock()
+        # Deltas committed while a rebuild is reading the rollups
+        self._pending: Optional[list] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _check_period(self) -> None:
+        # A new month starts with nobody active
+        period_start = current_period_start()
+        if self.live and period_start != self.period_start:
+            self.period_start = period_start
+            self.sketch = LogHistogramSketch(self.relative_accuracy)
+            self.totals = {}
+            self.as_of = datetime.now(timezone.utc)
+
+    def _apply(self, email: str, delta: float) -> None:
+        old = self.totals.get(email)
+        if old is not None:
+            self.sketch.remove(old)
+        new = (old or 0.0) + delta
+        self.totals[email] = new
+        self.sketch.add(new)
+
+    def record(self, deltas: Dict[tuple, list]) -> None:
+        """Fold committed rollup deltas ({(email, period, start, category): [co2, count]}) in"""
+        if not self.enabled:
+            return
+        month = [(email, start, co2) for (email, period, start, _), (co2, _) in deltas.items() if period == PERIOD]
+        if not month:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(month)
+                return
+            if not self.live:
+                # The next rebuild reads these from the rollups
+                return
+            self._check_period()
+            for email, start, co2 in month:
+                # Imports can carry other months; only the current one is ranked
+                if start == self.period_start:
+                    self._apply(email, co2)
+
+    def rebuild(self, session: Session) -> int:
+        """Recompute the current month's totals and sketch from the rollups"""
+        period_start = current_period_start()
+        with self._lock:
+            self._pending = []
+        try:
+            rows = session.execute(
+                select(EmissionRollup.user_email, func.sum(EmissionRollup.total_co2))
+                .where(EmissionRollup.period == PERIOD, EmissionRollup.period_start == period_start)
+                .group_by(EmissionRollup.user_email)
+            ).all()
+            sketch = LogHistogramSketch(self.relative_accuracy)
+            totals = {}
+            for email, total in rows:
+                totals[email] = total
+                sketch.add(total)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self.period_start, self.sketch, self.totals = period_start, sketch, totals
+            self.live = True
+            self.as_of = datetime.now(timezone.utc)
+            for email, start, co2 in pending:
+                if start == self.period_start:
+                    self._apply(email, co2)
+        return len(totals)
+
+    def persist(self, session: Session) -> None:
+        """Save the compact sketch (bucket counts only) for warm restarts"""
+        with self._lock:
+            if not self.live:
+                return
+            snapshot = RankingSnapshot(
+                period_start=self.period_start,
+                relative_accuracy=self.relative_accuracy,
+                users=self.sketch.total,
+                buckets=self.sketch.to_json(),
+                updated_at=datetime.now(timezone.utc)
+            )
+        session.merge(snapshot)
+        session.commit()
+
+    def load_snapshot(self, session: Session) -> bool:
+        """Serve ranks from the last persisted sketch until a rebuild finishes"""
+        snapshot = session.get(RankingSnapshot, current_period_start())
+        if snapshot is None or snapshot.relative_accuracy != self.relative_accuracy:
+            return False
+        with self._lock:
+            if self.live:
+                return False
+            self.period_start = snapshot.period_start
+            self.sketch.load_json(snapshot.buckets)
+            self.as_of = snapshot.updated_at
+        return True
+
+    def user_total(self, session: Session, email: str) -> float:
+        """A user's total for the current month (from memory once live)"""
+        with self._lock:
+            self._check_period()
+            if self.live:
+                return self.totals.get(email, 0.0)
+        total = session.scalar(
+            select(func.sum(EmissionRollup.total_co2)).where(
+                EmissionRollup.user_email == email,
+                EmissionRollup.period == PERIOD,
+                EmissionRollup.period_start == current_period_start()
+            )
+        )
+        return total or 0.0
+
+    def rank(self, session: Session, email: str) -> Dict:
+        """Where a user's monthly total sits among all active users.
+
+        Never rebuilds inline: until the background warm-up has loaded a
+        snapshot or rebuilt the sketch this raises RankingNotReadyError.
+        """
+        if not self.live and self.as_of is None:
+            raise RankingNotReadyError("User ranking is still warming up")
+        total = self.user_total(session, email)
+        with self._lock:
+            self._check_period()
+            below, error = self.sketch.rank(total)
+            users = self.sketch.total
+            # A user with no activity this month is not part of the sketch
+            active = total != 0.0 or email in self.totals
+            return {
+                "user_email": email,
+                "period_start": self.period_start,
+                "total_co2": round(total, 3),
+                "users": users,
+                "percentile": round(below * 100, 2),
+                "emits_less_than_percent": round((1 - below) * 100, 2) if active else None,
+                "max_error_percent": round(error * 100, 2),
+                "relative_accuracy": self.relative_accuracy,
+                "as_of": self.as_of,
+                "live": self.live
+            }
+
+    async def start(self) -> None:
+        """Warm up from the snapshot, rebuild, then persist and refresh periodically"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await run_in_threadpool(self._with_session, self.persist)
+        except Exception as e:
+            print(f"Failed to persist user ranking: {e}")
+
+    def _with_session(self, fn):
+        with database.SessionLocal() as session:
+            return fn(session)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await run_in_threadpool(self._with_session, self.load_snapshot)
+            await run_in_threadpool(self._with_session, self.rebuild)
+        except Exception as e:
+            print(f"User ranking warm-up failed: {e}")
+        last_refresh = loop.time()
+        while True:
+            await asyncio.sleep(self.persist_seconds)
+            try:
+                if loop.time() - last_refresh >= self.refresh_seconds:
+                    await run_in_threadpool(self._with_session, self.rebuild)
+                    last_refresh = loop.time()
+                await run_in_threadpool(self._with_session, self.persist)
+            except Exception as e:
+                print(f"User ranking maintenance failed: {e}")
+
+# Global instance
+user_ranking = UserRanking(
+    enabled=os.getenv("RANKING_ENABLED", "true").lower() in ("1", "true", "yes"),
+    relative_accuracy=float(os.getenv("RANKING_RELATIVE_ACCURACY", "0.01")),
+    persist_seconds=float(os.getenv("RANKING_PERSIST_SECONDS", "60")),
+    refresh_seconds=float(os.getenv("RANKING_REFRESH_SECONDS", "900"))
+)
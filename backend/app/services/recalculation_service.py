@@ -0,0 +1,217 @@
+import os
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import OperationalError
+
+from ..database import SessionLocal
+from ..models.database import Activity, JobCheckpoint
+from .checkpoint_service import claim_run
+from .digest_service import RateLimiter
+from .emission_service import FactorTable, emission_service
+from .ranking_service import user_ranking
+from .rollup_service import aggregate_rollups, apply_rollup_deltas
+
+JOB_NAME = "recalculate_emissions"
+
+CHUNK_COLUMNS = (
+    Activity.id, Activity.user_email, Activity.activity_type, Activity.quantity, Activity.co2_emissions, Activity.created_at
+)
+
+class RecalculationJob:
+    """Re-price stored activities against the current emission factor table.
+
+    Walks `activities` in primary-key order, `chunk_size` rows at a time.
+    Each chunk is one short transaction: read the rows (locking them on
+    Postgres), price them in one vectorized pass, update only the rows
+    whose CO2 changed, add the differences to the rollups and advance the
+    checkpoint. A run that dies resumes after the last committed chunk,
+    and since the rollup corrections commit with the checkpoint they are
+    applied exactly once. Chunks are spaced so at most `rows_per_second`
+    rows are read. Rows whose activity type is no longer in the table
+    keep their stored value and are counted as unpriced. Archived
+    activities are not touched.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        chunk_size: int = 2000,
+        rows_per_second: float = 20000,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.limiter = RateLimiter(rows_per_second / chunk_size if rows_per_second > 0 else 0)
+
+    def run(
+        self,
+        run_key: str,
+        activity_types: Optional[Sequence[str]] = None,
+        table: Optional[FactorTable] = None,
+        on_chunk: Optional[Callable[[Dict], None]] = None,
+        claimed: bool = False
+    ) -> Dict:
+        """Run (or resume) the recalculation for `run_key` and return its progress.
+
+        Claims the run first unless the caller already did (`claimed`);
+        raises RunInProgressError while any recalculation run is live, since
+        two runs would read the same stored values and apply their rollup
+        corrections twice.
+        """
+        table = table or emission_service.table
+        types = sorted(set(activity_types)) if activity_types else None
+        for activity_type in types or ():
+            if activity_type not in table.index:
+                raise ValueError(f"Unknown activity type '{activity_type}'")
+
+        with self.session_factory() as session:
+            if claimed:
+                checkpoint = session.get(JobCheckpoint, (JOB_NAME, run_key))
+            else:
+                checkpoint = claim_run(session, JOB_NAME, run_key, exclusive=True)
+            if checkpoint.status == "completed":
+                return checkpoint_progress(checkpoint)
+
+            # Rows written after the run starts are priced with the new factors already
+            max_id = session.scalar(select(func.max(Activity.id))) or 0
+            try:
+                while checkpoint.last_id < max_id:
+                    self.limiter.acquire()
+                    query = select(*CHUNK_COLUMNS).where(Activity.id > checkpoint.last_id, Activity.id <= max_id)
+                    if types:
+                        query = query.where(Activity.activity_type.in_(types))
+                    deltas = self._process_chunk(session, checkpoint, query, table)
+                    if deltas is None:
+                        break
+                    user_ranking.record(deltas)
+                    if on_chunk is not None:
+                        on_chunk(checkpoint_progress(checkpoint, max_id))
+
+                checkpoint.last_id = max(checkpoint.last_id, max_id)
+                checkpoint.status = "completed"
+            except Exception:
+                session.rollback()
+                checkpoint.status = "failed"
+                raise
+            finally:
+                session.commit()
+
+            return checkpoint_progress(checkpoint, max_id)
+
+    def _process_chunk(self, session, checkpoint: JobCheckpoint, query, table: FactorTable) -> Optional[Dict]:
+        """Re-price the next chunk and commit it with the checkpoint; None once no rows are left"""
+        query = query.order_by(Activity.id).limit(self.chunk_size).with_for_update()
+        for attempt in range(self.max_retries + 1):
+            try:
+                rows = session.execute(query).all()
+                if not rows:
+                    return None
+                updated, unpriced, deltas = self._reprice(session, rows, table)
+                checkpoint.last_id = rows[-1].id
+                checkpoint.processed += updated
+                checkpoint.failed += unpriced
+                session.commit()
+                return deltas
+            except OperationalError as e:
+                # Lock conflicts with concurrent writers; the chunk is retried from scratch
+                session.rollback()
+                if attempt == self.max_retries:
+                    raise
+                print(f"Recalculation chunk after id {checkpoint.last_id} failed, retrying: {e}")
+                time.sleep(self.backoff_seconds * 2 ** attempt)
+
+    def _reprice(self, session, rows, table: FactorTable):
+        """Update one chunk's changed rows and their rollups. Does not commit."""
+        count = len(rows)
+        old = np.fromiter(
+            (row.co2_emissions if row.co2_emissions is not None else np.nan for row in rows),
+            dtype=np.float64,
+            count=count
+        )
+        new = emission_service.calculate_emissions_batch(
+            [row.activity_type for row in rows], [row.quantity or 0.0 for row in rows], table=table
+        )
+        priced = ~np.isnan(new)
+        # Stored values were rounded the same way; ignore float noise
+        changed = np.flatnonzero(priced & ~np.isclose(new, old, rtol=0, atol=1e-9))
+        if not len(changed):
+            return 0, int(count - priced.sum()), {}
+
+        differences = new[changed] - np.nan_to_num(old[changed])
+        activities = Activity.__table__
+        session.execute(
+            update(activities).where(activities.c.id == bindparam("row_id")).values(co2_emissions=bindparam("co2")),
+            [{"row_id": rows[index].id, "co2": float(new[index])} for index in changed]
+        )
+        deltas = aggregate_rollups(
+            (
+                {
+                    "user_email": rows[index].user_email,
+                    "activity_type": rows[index].activity_type,
+                    "created_at": rows[index].created_at,
+                    "co2_emissions": float(difference)
+                }
+                for index, difference in zip(changed, differences)
+            ),
+            count=0
+        )
+        apply_rollup_deltas(session, deltas)
+        return len(changed), int(count - priced.sum()), deltas
+
+def checkpoint_progress(checkpoint: JobCheckpoint, max_id: Optional[int] = None) -> Dict:
+    """Public view of a recalculation run's checkpoint"""
+    progress = {
+        "run_key": checkpoint.run_key,
+        "status": checkpoint.status,
+        "last_id": checkpoint.last_id,
+        "updated": checkpoint.processed,
+        "unpriced": checkpoint.failed
+    }
+    if max_id is not None:
+        progress["max_id"] = max_id
+    return progress
+
+def default_run_key(activity_types: Optional[Sequence[str]] = None, table: Optional[FactorTable] = None) -> str:
+    """Default run key: the factor table version, plus the activity types when limited to some"""
+    version = (table or emission_service.table).version
+    if not activity_types:
+        return version
+    return f"{version}:{','.join(sorted(set(activity_types)))}"[:100]
+
+def claim_recalculation_run(run_key: str) -> Dict:
+    """Claim a recalculation run for a later run_recalculation(run_key, claimed=True).
+
+    Returns the run's progress; a completed run is left as it is.
+    Raises RunInProgressError while any recalculation run is live.
+    """
+    with SessionLocal() as session:
+        return checkpoint_progress(claim_run(session, JOB_NAME, run_key, exclusive=True))
+
+def run_recalculation(
+    run_key: Optional[str] = None,
+    activity_types: Optional[Sequence[str]] = None,
+    on_chunk: Optional[Callable[[Dict], None]] = None,
+    claimed: bool = False
+) -> Dict:
+    """Run the recalculation with the chunk size and throttle from the environment"""
+    job = RecalculationJob(
+        chunk_size=int(os.getenv("RECALC_CHUNK_SIZE", "2000")),
+        rows_per_second=float(os.getenv("RECALC_ROWS_PER_SECOND", "20000"))
+    )
+    table = emission_service.table
+    return job.run(run_key or default_run_key(activity_types, table), activity_types, table, on_chunk, claimed)
+
+def get_recalculation_progress(run_key: str) -> Optional[Dict]:
+    """Progress of a recalculation run, or None if it never started"""
+    with SessionLocal() as session:
+        checkpoint = session.get(JobCheckpoint, (JOB_NAME, run_key))
+        if checkpoint is None:
+            return None
+        max_id = session.scalar(select(func.max(Activity.id))) or 0
+        return checkpoint_progress(checkpoint, max(max_id, checkpoint.last_id))
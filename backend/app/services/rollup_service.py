@@ -0,0 +1,207 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Collection, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from ..database import dialect_insert
+from ..models.database import Activity, EmissionRollup
+from .archive_service import activity_archive
+from .emission_service import emission_service
+
+PERIODS = ("day", "week", "month")
+
+# Category used for activity types that are no longer in the factor table
+UNKNOWN_CATEGORY = "other"
+
+RollupKey = Tuple[str, str, date, str]
+
+def period_start(period: str, timestamp: datetime) -> date:
+    """First day of the day/week/month bucket containing a UTC timestamp"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    day = timestamp.date()
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown rollup period '{period}'")
+
+def category_for(activity_type: str) -> str:
+    """Factor-table category of an activity type"""
+    entry = emission_service.get_factor(activity_type)
+    return entry.category if entry is not None else UNKNOWN_CATEGORY
+
+def _fold_row(totals: Dict[RollupKey, list], row, count: int = 1) -> None:
+    category = category_for(row["activity_type"])
+    created_at = row["created_at"] or datetime.now(timezone.utc)
+    for period in PERIODS:
+        bucket = totals[(row["user_email"], period, period_start(period, created_at), category)]
+        bucket[0] += row["co2_emissions"]
+        bucket[1] += count
+
+def aggregate_rollups(rows: Iterable[Dict], count: int = 1) -> Dict[RollupKey, list]:
+    """Sum activity rows into [total_co2, activity_count] per rollup key.
+
+    Pass `count=0` when the rows carry CO2 corrections to already counted
+    activities rather than new activities.
+    """
+    totals: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        _fold_row(totals, row, count)
+    return totals
+
+def _rollup_rows(totals: Dict[RollupKey, list]) -> list:
+    # Sorted so concurrent writers lock rollup rows in the same order
+    return [
+        {
+            "user_email": email,
+            "period": period,
+            "period_start": start,
+            "category": category,
+            "total_co2": total_co2,
+            "activity_count": activity_count
+        }
+        for (email, period, start, category), (total_co2, activity_count) in sorted(totals.items())
+    ]
+
+def apply_rollup_deltas(session: Session, totals: Dict[RollupKey, list]) -> None:
+    """Add aggregated deltas to the rollup table. Does not commit."""
+    if not totals:
+        return
+
+    rows = _rollup_rows(totals)
+    table = EmissionRollup.__table__
+    bind = session.get_bind()
+    if bind.dialect.name in ("sqlite", "postgresql"):
+        statement = dialect_insert(bind, table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_email", "period", "period_start", "category"],
+            set_={
+                "total_co2": table.c.total_co2 + statement.excluded.total_co2,
+                "activity_count": table.c.activity_count + statement.excluded.activity_count
+            }
+        )
+        session.execute(statement, rows)
+        return
+
+    # Other databases: update in place, insert the buckets that did not exist
+    for row in rows:
+        result = session.execute(
+            update(table)
+            .where(
+                table.c.user_email == row["user_email"],
+                table.c.period == row["period"],
+                table.c.period_start == row["period_start"],
+                table.c.category == row["category"]
+            )
+            .values(
+                total_co2=table.c.total_co2 + row["total_co2"],
+                activity_count=table.c.activity_count + row["activity_count"]
+            )
+        )
+        if result.rowcount == 0:
+            session.execute(insert(table), [row])
+
+def update_rollups(session: Session, rows: Iterable[Dict]) -> None:
+    """Fold newly written activity rows into the rollups. Does not commit."""
+    apply_rollup_deltas(session, aggregate_rollups(rows))
+
+def running_totals(session: Session, emails: Collection[str]) -> Dict[str, Tuple[float, int]]:
+    """All-time (total_co2, activity_count) per user, summed from the month rollups"""
+    totals = {email: (0.0, 0) for email in emails}
+    rows = session.execute(
+        select(EmissionRollup.user_email, func.sum(EmissionRollup.total_co2), func.sum(EmissionRollup.activity_count))
+        .where(EmissionRollup.user_email.in_(list(emails)), EmissionRollup.period == "month")
+        .group_by(EmissionRollup.user_email)
+    )
+    for email, total_co2, activity_count in rows:
+        totals[email] = (total_co2 or 0.0, activity_count or 0)
+    return totals
+
+def _rebuild_user(session: Session, user_email: str, chunk_size: int) -> None:
+    """Replace one user's rollups. Does not commit; writers wait until the caller does.
+
+    Without the lock, an increment committed by save_activities between
+    the read of the activities and the rewrite of the rollups is lost.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        # Conflicts with the lock every rollup upsert takes, and with itself, until commit
+        session.execute(text("LOCK TABLE emission_rollups IN SHARE ROW EXCLUSIVE MODE"))
+    # Deleting before reading makes SQLite take its database write lock first
+    session.execute(delete(EmissionRollup).where(EmissionRollup.user_email == user_email))
+
+    query = (
+        select(Activity.user_email, Activity.activity_type, Activity.co2_emissions, Activity.created_at)
+        .where(Activity.user_email == user_email)
+        .execution_options(yield_per=chunk_size)
+    )
+    totals: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    for row in session.execute(query).mappings():
+        _fold_row(totals, row)
+    for row in activity_archive.iter_rows(user_email):
+        _fold_row(totals, row._asdict())
+
+    if totals:
+        session.execute(insert(EmissionRollup.__table__), _rollup_rows(totals))
+
+def rebuild_rollups(
+    session: Session,
+    user_email: Optional[str] = None,
+    chunk_size: int = 10000,
+    users_per_query: int = 100
+) -> int:
+    """Recompute rollups from the activities table.
+
+    Walks users in email order, `users_per_query` at a time, and replaces
+    each one's rollups from a streamed scan of their activities (archived
+    ones included). Each user is one transaction that holds off rollup
+    writers until it commits, so it is safe to run while the API is
+    writing. Returns the number of users rebuilt.
+    """
+    if user_email:
+        _rebuild_user(session, user_email, chunk_size)
+        session.commit()
+        return 1
+
+    # Users whose activities are all archived are rebuilt after the walk
+    archived_emails = activity_archive.user_emails()
+    archived_only = set(archived_emails)
+    users = 0
+    last_email = ""
+    while True:
+        emails = session.scalars(
+            select(Activity.user_email)
+            .where(Activity.user_email > last_email)
+            .distinct()
+            .order_by(Activity.user_email)
+            .limit(users_per_query)
+        ).all()
+        if not emails:
+            break
+        for email in emails:
+            _rebuild_user(session, email, chunk_size)
+            session.commit()
+            archived_only.discard(email)
+        users += len(emails)
+        last_email = emails[-1]
+
+    for email in sorted(archived_only):
+        _rebuild_user(session, email, chunk_size)
+        session.commit()
+        users += 1
+
+    # Drop rollups of users that no longer have any activities
+    stale = session.scalars(
+        select(EmissionRollup.user_email).distinct().where(EmissionRollup.user_email.not_in(
+            select(Activity.user_email).where(Activity.user_email.is_not(None)).distinct()
+        ))
+    ).all()
+    stale = [email for email in stale if email not in archived_emails]
+    for index in range(0, len(stale), 500):
+        session.execute(delete(EmissionRollup).where(EmissionRollup.user_email.in_(stale[index:index + 500])))
+    session.commit()
+    return users
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import database
+from ..models.database import Activity
+from .archive_service import activity_archive
+from .emission_service import FactorTable, emission_service
+
+SUMMARY_QUANTILES = (5, 50, 95)
+
+# Up to this many (sample, user) draws per rule adopters are drawn user by user
+EXACT_ADOPTION_DRAWS = 20_000_000
+
+class ActivityProfiles(NamedTuple):
+    """Annualized quantity per (user, activity type), one row per active user.
+
+    The per-type sums the simulation needs are taken once at load time.
+    """
+    activity_types: List[str]
+    quantities: np.ndarray
+    totals: np.ndarray
+    squares: np.ndarray
+    active_users: np.ndarray
+    loaded_at: float
+
+    @property
+    def users(self) -> int:
+        return self.quantities.shape[0]
+
+def load_profiles(session: Session, lookback_days: int) -> ActivityProfiles:
+    """Sum each user's quantities per activity type over the lookback window, scaled to a year.
+
+    Archived activities inside the window count as well.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    rows = session.execute(
+        select(Activity.user_email, Activity.activity_type, func.sum(Activity.quantity))
+        .where(Activity.created_at >= since)
+        .group_by(Activity.user_email, Activity.activity_type)
+    ).all()
+    rows += activity_archive.quantity_totals(since)
+
+    user_codes: Dict[str, int] = {}
+    type_codes: Dict[str, int] = {}
+    count = len(rows)
+    users = np.fromiter((user_codes.setdefault(row[0], len(user_codes)) for row in rows), dtype=np.int64, count=count)
+    types = np.fromiter((type_codes.setdefault(row[1], len(type_codes)) for row in rows), dtype=np.int64, count=count)
+    totals = np.fromiter((row[2] or 0.0 for row in rows), dtype=np.float64, count=count)
+
+    quantities = np.zeros((len(user_codes), len(type_codes)))
+    # A (user, type) pair can appear twice, once live and once archived
+    np.add.at(quantities, (users, types), totals * (365.0 / lookback_days))
+    return build_profiles(list(type_codes), quantities)
+
+def build_profiles(activity_types: List[str], quantities: np.ndarray) -> ActivityProfiles:
+    """Profiles from a (users x activity types) matrix of annual quantities"""
+    return ActivityProfiles(
+        activity_types=activity_types,
+        quantities=quantities,
+        totals=quantities.sum(axis=0),
+        squares=np.square(quantities).sum(axis=0),
+        active_users=np.count_nonzero(quantities, axis=0),
+        loaded_at=time.monotonic()
+    )
+
+def summarize(samples: np.ndarray) -> Dict:
+    """Mean, standard deviation and 5th/50th/95th percentiles of a sample vector"""
+    p5, p50, p95 = np.percentile(samples, SUMMARY_QUANTILES)
+    return {
+        "mean": round(float(samples.mean()), 3),
+        "std": round(float(samples.std()), 3),
+        "p5": round(float(p5), 3),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3)
+    }
+
+def sample_adoption(rng: np.random.Generator, mean: float, sd: float, samples: int) -> np.ndarray:
+    """Adoption rates drawn from a beta distribution with the given mean and standard deviation"""
+    if sd == 0 or mean in (0.0, 1.0):
+        return np.full(samples, mean)
+    variance = sd * sd
+    if variance >= mean * (1 - mean):
+        raise ValueError(f"adoption_sd {sd} is too large for adoption {mean}")
+    concentration = mean * (1 - mean) / variance - 1
+    return rng.beta(mean * concentration, (1 - mean) * concentration, samples)
+
+class ScenarioEngine:
+    """Monte Carlo what-if simulation of activity substitutions.
+
+    Users' annualized activity profiles are loaded into a (users x types)
+    matrix and cached for `profile_ttl` seconds. Each sample draws
+    every emission factor from a mean-preserving lognormal (relative
+    spread `factor_uncertainty`, or the entry's own `uncertainty` in the
+    factor file) and each rule's adoption rate from a beta distribution.
+    Given a rate, each user who has the source activity adopts
+    independently. For small populations that choice is drawn per user;
+    beyond EXACT_ADOPTION_DRAWS the moved quantity, a sum of many
+    independent choices, is drawn from its normal approximation (mean
+    a*S1, variance a*(1-a)*S2 over the users' quantities), so the cost
+    is O(samples x rules) whatever the number of users.
+    """
+
+    def __init__(self, profile_ttl: float = 900):
+        self.profile_ttl = profile_ttl
+        self._profiles: Dict[int, ActivityProfiles] = {}
+        self._lock = threading.Lock()
+
+    def profiles(self, lookback_days: int) -> ActivityProfiles:
+        with self._lock:
+            profiles = self._profiles.get(lookback_days)
+            if profiles is None or time.monotonic() - profiles.loaded_at > self.profile_ttl:
+                with database.SessionLocal() as session:
+                    profiles = self._profiles[lookback_days] = load_profiles(session, lookback_days)
+            return profiles
+
+    def simulate(
+        self,
+        rules: Sequence[Dict],
+        samples: int = 10000,
+        factor_uncertainty: float = 0.1,
+        lookback_days: int = 365,
+        seed: Optional[int] = None,
+        profiles: Optional[ActivityProfiles] = None,
+        table: Optional[FactorTable] = None
+    ) -> Dict:
+        """Distribution of annual CO2 before and after applying substitution `rules`.
+
+        Each rule moves `shift` of the `from_activity` quantity of adopting
+        users to `to_activity` (converted by `conversion` units per unit),
+        or drops it when there is no `to_activity`. Rules act on the
+        baseline quantities; the shares moved out of one activity may not
+        exceed 100% in expectation.
+        """
+        started = time.perf_counter()
+        table = table or emission_service.table
+        self._validate(rules, table)
+        profiles = profiles or self.profiles(lookback_days)
+
+        # Activity types in the profiles plus any rule targets nobody uses yet
+        activity_types = list(profiles.activity_types)
+        for rule in rules:
+            for key in (rule["from_activity"], rule.get("to_activity")):
+                if key and key not in activity_types:
+                    activity_types.append(key)
+        columns = {key: index for index, key in enumerate(activity_types)}
+        padding = len(activity_types) - len(profiles.activity_types)
+        totals = np.pad(profiles.totals, (0, padding))
+        squares = np.pad(profiles.squares, (0, padding))
+        active_users = np.pad(profiles.active_users, (0, padding))
+
+        # Priced activity types only; unknown historical types carry no emissions
+        known = np.array([key in table.index for key in activity_types])
+        factors = np.array([table.index[key].factor if key in table.index else 0.0 for key in activity_types])
+        spreads = np.array([self._uncertainty(table, key, factor_uncertainty) for key in activity_types])
+
+        rng = np.random.default_rng(seed)
+        # Mean-preserving lognormal noise, one draw per sample and activity type
+        noise = rng.standard_normal((samples, len(activity_types)))
+        sampled_factors = factors * np.exp(spreads * noise - spreads * spreads / 2) * known
+
+        baseline = sampled_factors @ totals
+
+        reduction = np.zeros(samples)
+        rule_results = []
+        for rule in rules:
+            source = columns[rule["from_activity"]]
+            adoption = sample_adoption(rng, rule["adoption"], rule.get("adoption_sd", 0.05), samples)
+            moved = self._moved_quantity(rng, profiles, source, adoption, totals[source], squares[source])
+            moved *= rule.get("shift", 1.0)
+
+            saved = moved * sampled_factors[:, source]
+            if rule.get("to_activity"):
+                target = columns[rule["to_activity"]]
+                saved = saved - moved * rule.get("conversion", 1.0) * sampled_factors[:, target]
+            reduction += saved
+            rule_results.append({
+                "from_activity": rule["from_activity"],
+                "to_activity": rule.get("to_activity"),
+                "affected_users": int(active_users[source]),
+                "baseline_quantity": round(float(totals[source]), 3),
+                "reduction_co2": summarize(saved)
+            })
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            reduction_percent = np.where(baseline > 0, reduction / baseline * 100, 0.0)
+        return {
+            "users": profiles.users,
+            "samples": samples,
+            "lookback_days": lookback_days,
+            "factor_version": table.version,
+            "baseline_co2": summarize(baseline),
+            "scenario_co2": summarize(baseline - reduction),
+            "reduction_co2": summarize(reduction),
+            "reduction_percent": summarize(reduction_percent),
+            "rules": rule_results,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def _moved_quantity(self, rng, profiles, source, adoption, total, square) -> np.ndarray:
+        """Quantity of the source activity whose users adopt, per sample"""
+        if source < len(profiles.activity_types):
+            column = profiles.quantities[:, source]
+            users = column[column > 0]
+            if len(users) * len(adoption) <= EXACT_ADOPTION_DRAWS:
+                moved = np.empty(len(adoption))
+                # About a million draws at a time to bound memory
+                step = max(1, (1 << 20) // max(len(users), 1))
+                for first in range(0, len(adoption), step):
+                    rates = adoption[first:first + step, None]
+                    moved[first:first + step] = (rng.random((len(rates), len(users))) < rates) @ users
+                return moved
+        spread = np.sqrt(adoption * (1 - adoption) * square)
+        return np.clip(adoption * total + spread * rng.standard_normal(len(adoption)), 0.0, total)
+
+    def _uncertainty(self, table: FactorTable, key: str, default: float) -> float:
+        entry = table.index.get(key)
+        if entry is None:
+            return 0.0
+        uncertainty = table.raw[entry.category][key].get("uncertainty", default)
+        return float(uncertainty) if isinstance(uncertainty, (int, float)) and uncertainty >= 0 else default
+
+    def _validate(self, rules: Sequence[Dict], table: FactorTable) -> None:
+        shares: Dict[str, float] = {}
+        for rule in rules:
+            for key in (rule["from_activity"], rule.get("to_activity")):
+                if key and key not in table.index:
+                    raise ValueError(f"Unknown activity type '{key}'")
+            if rule["from_activity"] == rule.get("to_activity"):
+                raise ValueError(f"Rule moves '{rule['from_activity']}' onto itself")
+            share = shares.get(rule["from_activity"], 0.0) + rule["adoption"] * rule.get("shift", 1.0)
+            if share > 1.0 + 1e-9:
+                raise ValueError(f"Rules move more than 100% of '{rule['from_activity']}'")
+            shares[rule["from_activity"]] = share
+
+# Global instance
+scenario_engine = ScenarioEngine(profile_ttl=float(os.getenv("SCENARIO_PROFILE_TTL_SECONDS", "900")))
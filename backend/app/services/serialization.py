@@ -0,0 +1,37 @@
+import json
+from datetime import date, datetime
+from typing import Iterable, Sequence
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the json module gives the same output, slower
+    orjson = None
+
+from fastapi import Response
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        # Match Pydantic and orjson: UTC offsets are written as "Z"
+        text = value.isoformat()
+        return text[:-6] + "Z" if value.utcoffset() is not None and not value.utcoffset() else text
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_json(value) -> bytes:
+    """Encode a JSON-compatible value (datetimes allowed) to compact bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_encode_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def encode_rows(columns: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Encode column tuples as a JSON array of objects, straight to bytes.
+
+    Rows are expected to come from a typed column select, so they are
+    not re-validated on the way out.
+    """
+    return encode_json([dict(zip(columns, row)) for row in rows])
+
+def rows_response(columns: Sequence[str], rows: Iterable[Sequence], headers=None) -> Response:
+    """JSON response for a list endpoint, bypassing response_model serialization"""
+    return Response(encode_rows(columns, rows), media_type="application/json", headers=headers)
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from ..database import dialect_insert
+from ..models.database import User
+
+class KnownUserCache:
+    """Bounded LRU of emails known to have a User row, with a TTL.
+
+    Users are never deleted by the API, so a hit can skip the user table
+    entirely; the TTL only bounds staleness after manual deletions.
+    """
+
+    def __init__(self, max_size: int = 100000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, email: str) -> bool:
+        """Check whether an email is known, counting the hit or miss"""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(email)
+            if expires_at is not None and expires_at > now:
+                self._entries.move_to_end(email)
+                self.hits += 1
+                return True
+            if expires_at is not None:
+                del self._entries[email]
+            self.misses += 1
+            return False
+
+    def add_many(self, emails: Iterable[str]) -> None:
+        """Remember emails whose User rows are committed"""
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for email in emails:
+                self._entries[email] = expires_at
+                self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def insert_users_if_missing(session: Session, emails: Iterable[str], is_subscribed: bool = True) -> int:
+    """Insert a User for each email that has none, without racing other writers.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on SQLite and Postgres, so
+    concurrent first-time requests never hit an IntegrityError. Returns
+    the number of users actually created. Does not commit.
+    """
+    emails = sorted(set(emails))
+    if not emails:
+        return 0
+
+    rows = [{"email": email, "is_subscribed": is_subscribed} for email in emails]
+    bind = session.get_bind()
+    if bind.dialect.name in ("sqlite", "postgresql"):
+        statement = dialect_insert(bind, User.__table__).on_conflict_do_nothing(index_elements=["email"])
+        result = session.execute(statement, rows)
+        return max(result.rowcount, 0)
+
+    # Other databases: check first, then insert whatever is still missing
+    existing = set(session.scalars(select(User.email).where(User.email.in_(emails))))
+    missing = [row for row in rows if row["email"] not in existing]
+    if missing:
+        session.execute(insert(User.__table__), missing)
+    return len(missing)
+
+def ensure_users(session: Session, emails: Iterable[str]) -> Set[str]:
+    """Make sure every email has a User row, skipping the ones already known.
+
+    Returns the emails that were not in the cache. Callers add them to
+    `known_users` once their transaction commits.
+    """
+    unknown = {email for email in set(emails) if not known_users.contains(email)}
+    if unknown:
+        insert_users_if_missing(session, unknown)
+    return unknown
+
+# Global instance
+known_users = KnownUserCache(
+    max_size=int(os.getenv("KNOWN_USER_CACHE_SIZE", "100000")),
+    ttl_seconds=float(os.getenv("KNOWN_USER_CACHE_TTL", "3600"))
+)
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import database
+from .activity_service import save_activities
+
+_STOP = object()
+
+class ActivityWriteBuffer:
+    """Bounded in-process queue that persists activities in bulk.
+
+    Requests enqueue rows and return immediately; a background task flushes
+    them every `flush_rows` rows or `flush_interval_ms` milliseconds,
+    whichever comes first. When the queue is full, enqueue waits up to
+    `enqueue_timeout_ms` for space, then hands the row back to the caller
+    to write synchronously. A batch that fails to write is retried row
+    by row; only rows that still fail are dropped.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_size: int = 10000,
+        flush_rows: int = 500,
+        flush_interval_ms: int = 200,
+        enqueue_timeout_ms: int = 1000
+    ):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.flushes = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._closing
+
+    async def start(self) -> None:
+        """Start the background flusher on the running event loop"""
+        if not self.enabled or self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything queued so far and stop the flusher"""
+        if not self.running:
+            return
+        # Rows enqueued after this point are written synchronously by the caller
+        self._closing = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, row: Dict) -> bool:
+        """Queue a row for writing.
+
+        Returns False if the buffer is not running or stayed full for
+        `enqueue_timeout_ms`; the caller must then write the row itself.
+        """
+        if not self.running:
+            return False
+        try:
+            await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.overflowed += 1
+            print(f"Activity write buffer full, writing row for {row['user_email']} synchronously")
+            return False
+        self.queued += 1
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]) -> None:
+        # save_activities only raises when its transaction did not commit, so a retry cannot duplicate rows
+        try:
+            await self._write(batch)
+        except Exception as e:
+            print(f"Failed to flush {len(batch)} buffered activities, retrying row by row: {e}")
+            written = 0
+            for row in batch:
+                try:
+                    await self._write([row])
+                    written += 1
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"Dropped buffered activity for {row.get('user_email')}: {e}")
+            self.flushed += written
+        else:
+            self.flushed += len(batch)
+        self.flushes += 1
+
+    async def _write(self, rows: List[Dict]) -> None:
+        if database.AsyncSessionLocal is not None:
+            async with database.AsyncSessionLocal() as db:
+                await db.run_sync(save_activities, rows)
+        else:
+            await run_in_threadpool(self._flush_sync, rows)
+
+    def _flush_sync(self, batch: List[Dict]) -> None:
+        with database.SessionLocal() as session:
+            save_activities(session, batch)
+
+    def stats(self) -> Dict:
+        """Counters for queued, flushed, dropped and overflowed rows"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self.running else 0,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "overflowed": self.overflowed,
+            "flushes": self.flushes
+        }
+
+# Global instance
+activity_buffer = ActivityWriteBuffer(
+    enabled=os.getenv("ACTIVITY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes"),
+    max_size=int(os.getenv("ACTIVITY_BUFFER_SIZE", "10000")),
+    flush_rows=int(os.getenv("ACTIVITY_FLUSH_ROWS", "500")),
+    flush_interval_ms=int(os.getenv("ACTIVITY_FLUSH_INTERVAL_MS", "200")),
+    enqueue_timeout_ms=int(os.getenv("ACTIVITY_ENQUEUE_TIMEOUT_MS", "1000"))
+)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Move old activities out of the database into compressed Parquet files
+"""
+import argparse
+import os
+import sys
+
+# Add the current directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.services.archive_service import ARCHIVE_AFTER_DAYS, activity_archive, archive_cutoff
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive activities older than a cutoff to cold storage")
+    parser.add_argument(
+        "--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS,
+        help="Archive activities created more than this many days ago"
+    )
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Activities moved per transaction")
+    args = parser.parse_args()
+
+    try:
+        cutoff = archive_cutoff(args.older_than_days)
+        print(f"Archiving activities created before {cutoff.isoformat()} to {activity_archive.root}...")
+        with SessionLocal() as session:
+            archived = activity_archive.archive(session, cutoff, chunk_size=args.chunk_size)
+        print(f"✅ Archived {archived} activities")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to archive activities: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
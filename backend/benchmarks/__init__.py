@@ -0,0 +1,3 @@
+"""
+Load and latency benchmarks for the API hot paths
+"""
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files and flag regressions
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List
+
+# Add the backend directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Metric name -> whether a larger value is better
+METRICS = {"rps": True, "p50_ms": False, "p99_ms": False}
+
+# Settings that must match for two runs to be comparable
+COMPARABLE_SETTINGS = ("database", "async_db", "target", "workers", "concurrency", "users", "activities_per_user")
+
+def mismatched_settings(baseline: Dict, candidate: Dict) -> List[str]:
+    """Run settings that differ between the two result files"""
+    before, after = baseline.get("meta", {}), candidate.get("meta", {})
+    return [setting for setting in COMPARABLE_SETTINGS if before.get(setting) != after.get(setting)]
+
+def compare_results(baseline: Dict, candidate: Dict, threshold: float = 0.10) -> List[Dict]:
+    """One row per scenario and metric present in both runs.
+
+    A metric regresses when it moves in the bad direction by more than
+    `threshold` (a fraction of the baseline value). Candidate runs with
+    more errors than the baseline are always flagged.
+    """
+    rows = []
+    for name, base in baseline.get("scenarios", {}).items():
+        new = candidate.get("scenarios", {}).get(name)
+        if new is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = base.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            rows.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": before,
+                "candidate": after,
+                "change": round(change, 4),
+                "regression": worse > threshold
+            })
+        if new.get("errors", 0) > base.get("errors", 0):
+            rows.append({
+                "scenario": name,
+                "metric": "errors",
+                "baseline": base.get("errors", 0),
+                "candidate": new["errors"],
+                "change": None,
+                "regression": True
+            })
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag regressions between two benchmark runs")
+    parser.add_argument("baseline", help="Results JSON of the reference run")
+    parser.add_argument("candidate", help="Results JSON of the run to check")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed relative slowdown before a metric is flagged (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    for setting in mismatched_settings(baseline, candidate):
+        print(f"⚠️  Runs differ in {setting}: {baseline['meta'].get(setting)} vs {candidate['meta'].get(setting)}")
+
+    rows = compare_results(baseline, candidate, args.threshold)
+    for row in rows:
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "n/a"
+        flag = "❌ REGRESSION" if row["regression"] else "✅"
+        print(f"{row['scenario']:<22} {row['metric']:<7} {row['baseline']:>10} -> {row['candidate']:>10} {change:>8}  {flag}")
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return False
+    print("✅ No regressions")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import math
+import random
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import httpx
+
+class RequestSpec(NamedTuple):
+    method: str
+    path: str
+    json: Optional[Dict] = None
+
+class Scenario(NamedTuple):
+    """A named request generator; `make(i)` builds the i-th request"""
+    name: str
+    make: Callable[[int], RequestSpec]
+
+def build_scenarios(emails: Sequence[str], activity_types: Sequence[str], seed: int = 42) -> Dict[str, Scenario]:
+    """The hot paths measured by the suite, keyed by name"""
+    rng = random.Random(seed)
+    # Pre-draw inputs so the generator costs nothing inside the timed loop
+    types = [rng.choice(activity_types) for _ in range(4096)]
+    quantities = [round(rng.uniform(0.5, 100), 2) for _ in range(4096)]
+    picked = [rng.choice(emails) for _ in range(4096)] if emails else []
+    # Unique per process run so subscribe always measures the create path
+    run_tag = f"{time.time_ns():x}"
+
+    def calculate(i: int) -> RequestSpec:
+        return RequestSpec("POST", "/api/emissions/calculate", {
+            "activity_type": types[i % 4096], "quantity": quantities[i % 4096]
+        })
+
+    def calculate_with_email(i: int) -> RequestSpec:
+        return RequestSpec("POST", "/api/emissions/calculate", {
+            "activity_type": types[i % 4096], "quantity": quantities[i % 4096], "user_email": picked[i % 4096]
+        })
+
+    def history(i: int) -> RequestSpec:
+        return RequestSpec("GET", f"/api/emissions/history/{picked[i % 4096]}?limit=50")
+
+    def activities(i: int) -> RequestSpec:
+        return RequestSpec("GET", "/api/emissions/activities")
+
+    def subscribe(i: int) -> RequestSpec:
+        return RequestSpec("POST", "/api/users/subscribe", {"email": f"bench-{run_tag}-{i}@example.com"})
+
+    scenarios = [
+        Scenario("calculate", calculate),
+        Scenario("activities", activities),
+        Scenario("subscribe", subscribe)
+    ]
+    if emails:
+        scenarios += [Scenario("calculate_with_email", calculate_with_email), Scenario("history", history)]
+    return {scenario.name: scenario for scenario in scenarios}
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    """Throughput and latency percentiles (milliseconds) for one scenario"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if count else 0.0
+    }
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    warmup: int = 0
+) -> Dict:
+    """Drive `requests` requests through `concurrency` closed-loop workers"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def send(spec: RequestSpec) -> bool:
+        response = await client.request(spec.method, spec.path, json=spec.json)
+        return response.status_code < 400
+
+    for i in range(warmup):
+        await send(scenario.make(requests + i))
+
+    async def worker() -> None:
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            spec = scenario.make(i)
+            started = time.perf_counter()
+            try:
+                ok = await send(spec)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark the API hot paths in-process (httpx ASGI transport) or against uvicorn
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Add the backend directory to Python path so we can import our modules
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+import httpx
+
+DEFAULT_SCENARIOS = "calculate,calculate_with_email,history,activities,subscribe"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the API hot paths")
+    parser.add_argument("--target", choices=("inprocess", "uvicorn"), default="inprocess",
+                        help="Drive the ASGI app in-process, or a uvicorn server in a subprocess")
+    parser.add_argument("--database-url", help="Database to benchmark (default: a fresh temporary SQLite file)")
+    parser.add_argument("--async-db", action="store_true", help="Serve requests with the asyncio engine")
+    parser.add_argument("--reset", action="store_true",
+                        help="Drop and recreate all tables before seeding (required for reproducible runs on --database-url)")
+    parser.add_argument("--users", type=int, default=1000, help="Users to seed")
+    parser.add_argument("--activities-per-user", type=int, default=100, help="Activities to seed per user")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed for data and request inputs")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=2000, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent in-flight requests")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (--target uvicorn)")
+    parser.add_argument("--port", type=int, default=0, help="uvicorn port (default: a free port)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+def configure_environment(args) -> str:
+    """Point the app at the benchmark database before anything imports it"""
+    database_url = args.database_url
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='carbon_bench_'), 'bench.db')}"
+        args.reset = True
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DATABASE_ASYNC"] = "true" if args.async_db else "false"
+    # Activities must be visible to history reads right after they are written
+    os.environ.setdefault("ACTIVITY_WRITE_BEHIND", "false")
+    return database_url
+
+def prepare_database(args) -> int:
+    from app.database import SessionLocal, engine
+    from app.models.database import Base
+    from benchmarks.seed import seed_database
+
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    if not args.reset:
+        return 0
+
+    print(f"Seeding {args.users} users x {args.activities_per_user} activities...")
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        inserted = seed_database(session, args.users, args.activities_per_user, seed=args.seed)
+    print(f"✅ Seeded {inserted} activities in {time.perf_counter() - started:.1f}s")
+    return inserted
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_uvicorn(args) -> tuple:
+    port = args.port or _free_port()
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--no-access-log", "--log-level", "warning"
+    ]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy within 30s")
+
+async def run_benchmarks(args, client: httpx.AsyncClient) -> dict:
+    from app.services.emission_service import emission_service
+    from benchmarks.loadgen import build_scenarios, run_scenario
+    from benchmarks.seed import seed_emails
+
+    emails = seed_emails(args.users) if args.users and args.activities_per_user else []
+    available = build_scenarios(emails, sorted(emission_service.table.factor_values), seed=args.seed)
+
+    results = {}
+    for name in [name.strip() for name in args.scenarios.split(",") if name.strip()]:
+        if name not in available:
+            print(f"⚠️  Skipping unknown or unavailable scenario '{name}'")
+            continue
+        stats = await run_scenario(client, available[name], args.requests, args.concurrency, args.warmup)
+        results[name] = stats
+        print(
+            f"{name:<22} {stats['rps']:>9.1f} req/s  p50 {stats['p50_ms']:>8.2f} ms  "
+            f"p99 {stats['p99_ms']:>8.2f} ms  errors {stats['errors']}"
+        )
+    return results
+
+async def run_inprocess(args) -> dict:
+    from app.main import app
+
+    # ASGITransport does not send lifespan events, so run the lifespan here
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await run_benchmarks(args, client)
+
+async def run_against_server(args, base_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        return await run_benchmarks(args, client)
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = configure_environment(args)
+
+    try:
+        prepare_database(args)
+        if args.target == "uvicorn":
+            process, base_url = start_uvicorn(args)
+            try:
+                scenarios = asyncio.run(run_against_server(args, base_url))
+            finally:
+                process.terminate()
+                process.wait()
+        else:
+            scenarios = asyncio.run(run_inprocess(args))
+    except Exception as e:
+        print(f"❌ Benchmark failed: {e}")
+        return False
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database_url.split(":", 1)[0],
+            "async_db": args.async_db,
+            "target": args.target,
+            "workers": args.workers if args.target == "uvicorn" else 1,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "users": args.users,
+            "activities_per_user": args.activities_per_user,
+            "seed": args.seed
+        },
+        "scenarios": scenarios
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
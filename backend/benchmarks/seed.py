@@ -0,0 +1,61 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from app.services.emission_service import emission_service
+from app.services.import_service import ActivityChunk, vectorized_rollups, write_activities
+from app.services.rollup_service import apply_rollup_deltas
+from app.services.user_service import insert_users_if_missing
+
+def seed_emails(users: int) -> List[str]:
+    """Emails of the seeded users, in seeding order"""
+    return [f"bench-user-{i}@example.com" for i in range(users)]
+
+def seed_database(
+    session: Session,
+    users: int,
+    activities_per_user: int,
+    days: int = 365,
+    seed: int = 42,
+    chunk_size: int = 50000
+) -> int:
+    """Insert `users` users with `activities_per_user` activities each.
+
+    Activity types, quantities and timestamps (spread over the last `days`
+    days) come from a seeded RNG, so two runs with the same arguments
+    produce the same data. Rollups are written alongside. Returns the
+    number of activities inserted.
+    """
+    rng = random.Random(seed)
+    emails = seed_emails(users)
+    for start in range(0, len(emails), chunk_size):
+        insert_users_if_missing(session, emails[start:start + chunk_size])
+    session.commit()
+
+    activity_types = sorted(emission_service.table.factor_values)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    span = days * 86400
+
+    inserted = 0
+    chunk = ActivityChunk()
+    for email in emails:
+        for _ in range(activities_per_user):
+            chunk.emails.append(email)
+            chunk.types.append(rng.choice(activity_types))
+            chunk.quantities.append(round(rng.uniform(0.5, 100), 2))
+            chunk.timestamps.append(now - timedelta(seconds=rng.randrange(span)))
+            if len(chunk) >= chunk_size:
+                inserted += _write_chunk(session, chunk)
+                chunk = ActivityChunk()
+    if chunk:
+        inserted += _write_chunk(session, chunk)
+    return inserted
+
+def _write_chunk(session: Session, chunk: ActivityChunk) -> int:
+    chunk.co2 = emission_service.calculate_emissions_batch(chunk.types, chunk.quantities).tolist()
+    write_activities(session, chunk)
+    apply_rollup_deltas(session, vectorized_rollups(chunk))
+    session.commit()
+    return len(chunk)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of list responses: ORM + response_model versus column tuples + orjson
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+# Add the backend directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare list response serialization paths")
+    parser.add_argument("--database-url", help="Database to use (default: a fresh temporary SQLite file)")
+    parser.add_argument("--rows", type=int, default=500, help="Rows per page (the history endpoint allows 500)")
+    parser.add_argument("--iterations", type=int, default=200, help="Pages serialized per path")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='carbon_bench_'), 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from starlette.responses import JSONResponse
+
+    from app.database import SessionLocal, engine, init_db
+    from app.models.database import Activity
+    from app.models.schemas import ActivityResponse
+    from app.routers.emissions import HISTORY_COLUMNS
+    from app.services.serialization import encode_rows, orjson
+    from benchmarks.seed import seed_database, seed_emails
+
+    init_db()
+    with SessionLocal() as session:
+        seed_database(session, users=1, activities_per_user=args.rows)
+    email = seed_emails(1)[0]
+    adapter = TypeAdapter(List[ActivityResponse])
+
+    def orm_path(session) -> bytes:
+        # What FastAPI does for response_model=List[ActivityResponse] with ORM objects
+        activities = session.scalars(select(Activity).where(Activity.user_email == email).limit(args.rows)).all()
+        content = adapter.dump_python(adapter.validate_python(activities, from_attributes=True), mode="json")
+        return JSONResponse(content).body
+
+    def fast_path(session) -> bytes:
+        columns = (getattr(Activity, column) for column in HISTORY_COLUMNS)
+        rows = session.execute(select(*columns).where(Activity.user_email == email).limit(args.rows)).all()
+        return encode_rows(HISTORY_COLUMNS, rows)
+
+    results = {"rows": args.rows, "iterations": args.iterations, "orjson": orjson is not None, "paths": {}}
+    for name, path in (("orm_response_model", orm_path), ("columns_orjson", fast_path)):
+        with SessionLocal() as session:
+            path(session)
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                path(session)
+            elapsed = time.perf_counter() - started
+        per_row_us = elapsed / (args.iterations * args.rows) * 1e6
+        results["paths"][name] = {"page_ms": round(elapsed / args.iterations * 1000, 3), "per_row_us": round(per_row_us, 3)}
+        print(f"{name:<20} {elapsed / args.iterations * 1000:>8.2f} ms/page  {per_row_us:>7.2f} µs/row")
+
+    base, fast = (results["paths"][name]["per_row_us"] for name in ("orm_response_model", "columns_orjson"))
+    print(f"✅ Fast path is {base / fast:.1f}x cheaper per row")
+    engine.dispose()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
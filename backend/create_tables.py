@@ -8,8 +8,7 @@ import sys
 # Add the current directory to Python path so we can import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import engine
-from app.models.database import Base
+from app.database import engine, init_db
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,8 +19,9 @@ def create_tables():
     try:
         # Create all tables
         print("Creating database tables...")
-        Base.metadata.create_all(bind=engine)
-        print("✅ All tables created successfully!")
+        # Also adds indexes that are missing on tables created by an older version
+        created = init_db()
+        print(f"✅ All tables created successfully! (new: {', '.join(created) or 'none'})")
         
         # List the tables that were created
         from sqlalchemy import inspect
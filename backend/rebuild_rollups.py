@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Rebuild the per-user emission rollups from the activities table
+"""
+import argparse
+import os
+import sys
+
+# Add the current directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.services.ranking_service import user_ranking
+from app.services.rollup_service import rebuild_rollups
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute emission rollups from raw activities")
+    parser.add_argument("--email", help="Only rebuild this user's rollups")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Activities fetched per round trip")
+    args = parser.parse_args()
+
+    try:
+        print("Rebuilding emission rollups...")
+        with SessionLocal() as session:
+            users = rebuild_rollups(session, user_email=args.email, chunk_size=args.chunk_size)
+            # Refresh the persisted ranking sketch that workers warm up from
+            ranked = user_ranking.rebuild(session)
+            user_ranking.persist(session)
+        print(f"✅ Rebuilt rollups for {users} user(s)")
+        print(f"✅ Rebuilt ranking sketch for {ranked} active user(s) this month")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to rebuild rollups: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Re-price stored activities after a correction to emission_factors.json
+"""
+import argparse
+import os
+import sys
+
+# Add the current directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.emission_service import emission_service
+from app.services.recalculation_service import default_run_key, run_recalculation
+
+def report(progress):
+    print(
+        f"  ... id {progress['last_id']}/{progress['max_id']}: "
+        f"{progress['updated']} updated, {progress['unpriced']} unpriced"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalculate (or resume recalculating) stored CO2 emissions")
+    parser.add_argument("--run-key", default=None, help="Run identifier, defaults to the factor table version")
+    parser.add_argument(
+        "--activity-type", action="append", default=[],
+        help="Only recalculate this activity type (repeatable); all types by default"
+    )
+    args = parser.parse_args()
+
+    try:
+        emission_service.load()
+        run_key = args.run_key or default_run_key(args.activity_type)
+        print(f"Recalculating stored emissions for run {run_key}...")
+        progress = run_recalculation(run_key, args.activity_type or None, on_chunk=report)
+        print(f"✅ Recalculation {progress['status']}: {progress['updated']} updated, {progress['unpriced']} unpriced")
+        return True
+    except Exception as e:
+        print(f"❌ Recalculation failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
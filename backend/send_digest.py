@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Send the weekly carbon reduction tip to every subscribed user
+"""
+import argparse
+import os
+import sys
+
+# Add the current directory to Python path so we can import our modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.digest_service import current_run_key, run_weekly_digest
+
+def main():
+    parser = argparse.ArgumentParser(description="Send (or resume) the weekly digest")
+    parser.add_argument("--run-key", default=None, help="Run identifier, defaults to the current ISO week")
+    args = parser.parse_args()
+
+    run_key = args.run_key or current_run_key()
+    try:
+        print(f"Sending weekly digest for run {run_key}...")
+        progress = run_weekly_digest(run_key)
+        print(f"✅ Digest {progress['status']}: {progress['sent']} sent, {progress['failed']} failed")
+        return True
+    except Exception as e:
+        print(f"❌ Weekly digest failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# Point the app at a throwaway SQLite file before anything imports it
+_test_db_dir = tempfile.mkdtemp(prefix="carbon_tracker_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_test_db_dir, 'test.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(_test_db_dir, "archive")
+
+from app.database import engine
+from app.models.database import Base
+
+Base.metadata.create_all(bind=engine)
@@ -0,0 +1,97 @@
+from datetime import date, datetime
+
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+from app.services.activity_service import activity_row, save_activities
+from app.services.analytics_service import ActivityAnalytics, activity_analytics
+
+client = TestClient(app)
+
+def seed(email, activities):
+    rows = []
+    for activity_type, co2, created_at in activities:
+        row = activity_row(email, activity_type, 1.0, co2)
+        row["created_at"] = created_at
+        rows.append(row)
+    with SessionLocal() as session:
+        save_activities(session, rows)
+
+def test_group_by_and_incremental_refresh():
+    """Test vectorized breakdowns and that refresh only appends new rows"""
+    email = "analytics@example.com"
+    seed(email, [
+        ("car_gasoline", 2.0, datetime(2023, 3, 6, 9, 0, 0)),
+        ("beef", 27.0, datetime(2023, 3, 8, 9, 0, 0)),
+        ("train", 1.0, datetime(2023, 4, 2, 9, 0, 0))
+    ])
+    analytics = ActivityAnalytics(overlap=2)
+    with SessionLocal() as session:
+        analytics.rebuild(session)
+
+    result = analytics.query(["category"], user_email=email)
+    assert result["rows"] == [
+        {"total_co2": 27.0, "activity_count": 1, "category": "food"},
+        {"total_co2": 3.0, "activity_count": 2, "category": "transport"}
+    ]
+    assert result["total_co2"] == 30.0
+
+    monthly = analytics.query(["month", "category"], user_email=email, start=datetime(2023, 3, 7))
+    assert [(row["period_start"], row["category"], row["total_co2"]) for row in monthly["rows"]] == [
+        (date(2023, 3, 1), "food", 27.0), (date(2023, 4, 1), "transport", 1.0)
+    ]
+    weekly = analytics.query(["week"], user_email=email, category="transport")
+    assert [row["period_start"] for row in weekly["rows"]] == [date(2023, 3, 6), date(2023, 3, 27)]
+
+    seed(email, [("beef", 13.5, datetime(2023, 4, 3, 9, 0, 0))])
+    with SessionLocal() as session:
+        assert analytics.refresh(session) == 1
+        assert analytics.refresh(session) == 0
+    by_type = analytics.query(["activity_type"], user_email=email, activity_type="beef")
+    assert by_type["rows"] == [{"total_co2": 40.5, "activity_count": 2, "activity_type": "beef"}]
+
+def test_analytics_endpoint(monkeypatch):
+    """Test the analytics endpoint and its dimension validation"""
+    monkeypatch.setattr(activity_analytics, "enabled", False)
+    assert client.get("/api/analytics/emissions").status_code == 503
+    monkeypatch.setattr(activity_analytics, "enabled", True)
+    email = "analytics-api@example.com"
+    seed(email, [("electricity_grid", 5.0, datetime(2023, 5, 1, 12, 0, 0))])
+
+    response = client.get("/api/analytics/emissions", params={"group_by": ["day"], "user_email": email})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rows"] == [{"period_start": "2023-05-01", "total_co2": 5.0, "activity_count": 1}]
+    assert data["rows_loaded"] >= 1
+    assert data["source"] == "scan"
+
+    response = client.get("/api/analytics/emissions", params={"group_by": ["day", "month"]})
+    assert response.status_code == 422
+
+def test_cube_and_edge_scans_agree():
+    """Test that whole days come from the cube and partial days from a row scan"""
+    seed("analytics-cube@example.com", [
+        ("bus", 0.5, datetime(2023, 6, 1, 0, 0, 0)),
+        ("beef", 27.0, datetime(2023, 6, 14, 23, 59, 59))
+    ])
+    analytics = ActivityAnalytics()
+    with SessionLocal() as session:
+        analytics.rebuild(session)
+
+    def cells(result):
+        return {(row["period_start"], row["category"]): row["total_co2"] for row in result["rows"]}
+
+    whole = analytics.query(["day", "category"], start=datetime(2023, 6, 1), end=datetime(2023, 6, 15))
+    assert whole["source"] == "cube"
+    assert cells(whole)[(date(2023, 6, 14), "food")] == 27.0
+    assert cells(whole)[(date(2023, 6, 1), "transport")] == 0.5
+
+    edges = analytics.query(["day", "category"], start=datetime(2023, 5, 31, 12), end=datetime(2023, 6, 14, 12))
+    assert edges["source"] == "cube+scan"
+    assert (date(2023, 6, 14), "food") not in cells(edges)
+    assert cells(edges)[(date(2023, 6, 1), "transport")] == 0.5
+
+    within = analytics.query(["category"], start=datetime(2023, 6, 14, 23), end=datetime(2023, 6, 15))
+    assert within["source"] == "scan"
+    assert within["rows"] == [{"total_co2": 27.0, "activity_count": 1, "category": "food"}]
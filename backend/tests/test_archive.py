@@ -0,0 +1,125 @@
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.database import Activity, ArchivedUser, EmissionRollup
+from app.services.activity_service import activity_row, save_activities
+from app.services.archive_service import ActivityArchive, activity_archive
+from app.services.rollup_service import rebuild_rollups
+from app.services.scenario_service import load_profiles
+
+client = TestClient(app)
+
+def seed(email, timestamps):
+    rows = []
+    for index, created_at in enumerate(timestamps):
+        row = activity_row(email, "car_gasoline", float(index + 1), round(0.21 * (index + 1), 3))
+        row["created_at"] = created_at
+        rows.append(row)
+    with SessionLocal() as session:
+        save_activities(session, rows)
+
+def month_totals(email):
+    with SessionLocal() as session:
+        return dict(session.execute(
+            select(EmissionRollup.period_start, func.sum(EmissionRollup.total_co2))
+            .where(EmissionRollup.user_email == email, EmissionRollup.period == "month")
+            .group_by(EmissionRollup.period_start)
+        ).all())
+
+def test_archived_activities_stay_readable():
+    """Test that history, export and rollup rebuilds see archived rows"""
+    email = "archive@example.com"
+    old = [datetime(2022, month, 10, 12, 0, 0) for month in (1, 1, 2, 3)]
+    recent = [datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours) for hours in (3, 2, 1)]
+    seed(email, old + recent)
+    before = month_totals(email)
+
+    with SessionLocal() as session:
+        archived = activity_archive.archive(session, datetime(2023, 1, 1, tzinfo=timezone.utc), chunk_size=2)
+        remaining = session.scalar(select(func.count()).select_from(Activity).where(Activity.user_email == email))
+    assert archived >= 4
+    assert remaining == 3
+    assert {entry["month"] for entry in activity_archive.manifest()["files"]} >= {"2022-01", "2022-02", "2022-03"}
+
+    # Page through hot and cold rows with the cursor
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/api/emissions/history/{email}", params=params)
+        assert response.status_code == 200
+        seen.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [item["quantity"] for item in seen] == [7.0, 6.0, 5.0, 4.0, 3.0, 2.0, 1.0]
+
+    filtered = client.get(f"/api/emissions/history/{email}", params={
+        "start": "2022-01-01T00:00:00", "end": "2022-02-01T00:00:00"
+    }).json()
+    assert [item["quantity"] for item in filtered] == [2.0, 1.0]
+
+    export = client.get(f"/api/emissions/export/{email}").text
+    quantities = [float(row["quantity"]) for row in csv.DictReader(io.StringIO(export))]
+    assert quantities == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+
+    # Scenario profiles over a long lookback count the archived quantities too
+    assert (email, "car_gasoline", 10.0) in activity_archive.quantity_totals(datetime(2022, 1, 1))
+    with SessionLocal() as session:
+        profiles = load_profiles(session, 3650)
+    column = profiles.activity_types.index("car_gasoline")
+    assert any(abs(quantity - 28.0 * 365 / 3650) < 1e-9 for quantity in profiles.quantities[:, column])
+
+    with SessionLocal() as session:
+        rebuild_rollups(session)
+    assert month_totals(email) == before
+
+    # archived_users records who has archived rows, and is rebuilt for archives written before it
+    with SessionLocal() as session:
+        archived_user = session.get(ArchivedUser, email)
+        assert archived_user.activity_count == 4
+        assert archived_user.max_created_at == datetime(2022, 3, 10, 12, 0, 0)
+        session.execute(delete(ArchivedUser))
+        session.commit()
+        activity_archive.recover(session)
+        assert session.get(ArchivedUser, email).activity_count == 4
+
+def test_history_skips_archive_for_users_without_archived_rows(monkeypatch):
+    """Test that only users with archived rows make history read the archive"""
+    seed("archive-old@example.com", [datetime(2021, 1, 5, 12, 0, 0)])
+    with SessionLocal() as session:
+        activity_archive.archive(session, datetime(2021, 2, 1, tzinfo=timezone.utc))
+    assert activity_archive.has_data()
+
+    email = "archive-hot-only@example.com"
+    seed(email, [datetime.now(timezone.utc).replace(tzinfo=None)])
+
+    def no_archive_reads(*args, **kwargs):
+        raise AssertionError("archive read for a user without archived rows")
+
+    monkeypatch.setattr(activity_archive, "history_page", no_archive_reads)
+    response = client.get(f"/api/emissions/history/{email}")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+def test_interrupted_batch_is_recovered(tmp_path):
+    """Test that a part file of an uncommitted batch is discarded"""
+    email = "archive-recover@example.com"
+    seed(email, [datetime(2021, 5, 1, 9, 0, 0)])
+    archive = ActivityArchive(str(tmp_path))
+    with SessionLocal() as session:
+        row_id = session.scalar(select(Activity.id).where(Activity.user_email == email))
+        # A run that wrote its file but died before deleting the rows
+        leftover = tmp_path / "activities" / "month=2021-05" / f"part-{row_id}-{row_id}.parquet.tmp"
+        leftover.parent.mkdir(parents=True)
+        leftover.write_bytes(b"incomplete")
+
+        archive.recover(session)
+        assert not leftover.exists()
+        assert archive.manifest()["files"] == []
+        assert session.get(Activity, row_id) is not None
@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import DATABASE_URL, get_async_database_url, get_session
+from app.main import app
+
+def test_async_database_url_mapping():
+    """Test that sync URLs are mapped onto their asyncio drivers"""
+    assert get_async_database_url("sqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+    assert get_async_database_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert get_async_database_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert get_async_database_url("sqlite+aiosqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+def test_routers_with_async_session():
+    """Test the routers end to end on an aiosqlite AsyncSession"""
+    async_engine = create_async_engine(get_async_database_url(DATABASE_URL))
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_async_test_session():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_async_test_session
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/emissions/calculate", json={
+                "activity_type": "bus",
+                "quantity": 10.0,
+                "user_email": "async@example.com"
+            })
+            assert response.status_code == 200
+            assert response.json()["co2_emissions"] == 0.8
+
+            history = client.get("/api/emissions/history/async@example.com").json()
+            assert len(history) == 1
+
+            response = client.post("/api/users/unsubscribe", params={"email": "async@example.com"})
+            assert response.status_code == 200
+            response = client.post("/api/users/subscribe", json={"email": "async@example.com"})
+            assert response.status_code == 200
+            assert response.json()["is_subscribed"] is True
+    finally:
+        app.dependency_overrides.pop(get_session, None)
@@ -0,0 +1,35 @@
+from benchmarks.compare import compare_results, mismatched_settings
+from benchmarks.loadgen import percentile, summarize
+
+def _run(**scenarios):
+    return {"meta": {"database": "sqlite", "concurrency": 16}, "scenarios": scenarios}
+
+def test_percentile_uses_nearest_rank():
+    """Test percentile picks observed values"""
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.99) == 0.0
+
+def test_summarize_reports_milliseconds():
+    """Test that scenario stats convert seconds to milliseconds"""
+    stats = summarize([0.001, 0.002, 0.003, 0.004], errors=1, elapsed=0.5)
+    assert stats["requests"] == 4 and stats["errors"] == 1
+    assert stats["rps"] == 8.0
+    assert stats["p50_ms"] == 2.0 and stats["max_ms"] == 4.0
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    """Test that slower latencies and lower throughput are flagged, improvements are not"""
+    baseline = _run(calculate={"rps": 1000, "p50_ms": 1.0, "p99_ms": 5.0, "errors": 0})
+    candidate = _run(calculate={"rps": 950, "p50_ms": 0.8, "p99_ms": 6.0, "errors": 0})
+    flagged = {row["metric"] for row in compare_results(baseline, candidate, 0.10) if row["regression"]}
+    assert flagged == {"p99_ms"}
+
+def test_compare_flags_new_errors_and_setting_mismatches():
+    """Test that new errors are always regressions and differing setups are reported"""
+    baseline = _run(history={"rps": 100, "errors": 0})
+    candidate = _run(history={"rps": 100, "errors": 3})
+    candidate["meta"]["concurrency"] = 64
+    rows = compare_results(baseline, candidate)
+    assert any(row["metric"] == "errors" and row["regression"] for row in rows)
+    assert mismatched_settings(baseline, candidate) == ["concurrency"]
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, inspect, select
+
+from fastapi.testclient import TestClient
+
+from app.database import Base, SessionLocal, engine, engine_options, effective_sqlite_pragmas, init_db
+from app.main import app
+from app.models.database import Activity
+from app.services.activity_service import activity_row, save_activities
+
+def test_sqlite_connections_are_tuned():
+    """Test that every pooled SQLite connection runs in WAL mode with the tuned pragmas"""
+    with engine.connect() as connection:
+        pragmas = effective_sqlite_pragmas(connection)
+    assert pragmas["journal_mode"] == "wal"
+    assert pragmas["synchronous"] == 1
+    assert pragmas["busy_timeout"] == 5000
+
+def test_pool_options_skip_memory_and_aiosqlite():
+    """Test that queue pool settings are only passed where a queue pool is used"""
+    assert "pool_size" in engine_options("postgresql://localhost/db")
+    assert "pool_size" in engine_options("sqlite:///./file.db")
+    assert "pool_size" not in engine_options("sqlite:///:memory:")
+    assert "pool_size" not in engine_options("sqlite+aiosqlite:///./file.db")
+
+def test_concurrent_writers_do_not_fail():
+    """Test that concurrent activity writes wait for the lock instead of failing"""
+    email = "concurrent-writer@example.com"
+
+    def write(worker):
+        with SessionLocal() as session:
+            for i in range(10):
+                save_activities(session, [activity_row(email, "train", float(worker * 10 + i), 1.0)])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write, range(8)))
+
+    with SessionLocal() as session:
+        assert session.scalar(select(func.count()).where(Activity.user_email == email)) == 80
+
+def test_models_share_the_engine_base():
+    """Test that the models are declared on the Base that init_db creates"""
+    assert Activity.__table__ is Base.metadata.tables["activities"]
+
+def test_init_db_creates_only_missing_tables():
+    """Test the startup schema check"""
+    assert init_db() == []
+    Base.metadata.tables["job_checkpoints"].drop(bind=engine)
+    assert init_db() == ["job_checkpoints"]
+
+def test_init_db_adds_indexes_to_existing_tables():
+    """Test that an index added to an existing table's model is created at startup"""
+    name = "ix_activities_user_email_created_at_id"
+    index = next(index for index in Activity.__table__.indexes if index.name == name)
+    index.drop(bind=engine)
+    assert init_db() == [name]
+    assert name in {index["name"] for index in inspect(engine).get_indexes("activities")}
+    assert init_db() == []
+
+def test_lifespan_startup(capsys):
+    """Test that startup runs the schema check and reports its timings"""
+    with TestClient(app) as lifespan_client:
+        assert lifespan_client.get("/health").status_code == 200
+    assert "Startup complete: import" in capsys.readouterr().out
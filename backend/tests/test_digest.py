@@ -0,0 +1,109 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.database import User
+from app.services.checkpoint_service import RunInProgressError, claim_run
+from app.services.digest_service import JOB_NAME, SMTPConnectionPool, WeeklyDigestJob, claim_digest_run
+from app.services.email_service import email_service
+from app.services.user_service import insert_users_if_missing
+
+class SinkHandler:
+    """Collects delivered messages; soft-fails the first RCPT for chosen addresses"""
+
+    def __init__(self, fail_once=()):
+        self.delivered = []
+        self.messages = {}
+        self.fail_once = set(fail_once)
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.fail_once:
+            self.fail_once.remove(address)
+            return "451 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        for address in envelope.rcpt_tos:
+            self.messages[address] = envelope.original_content
+        return "250 Message accepted"
+
+client = TestClient(app)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_digest_sends_to_subscribers_and_resumes():
+    """Test fan-out over pooled connections, retry on 4xx and resume by run key"""
+    emails = [f"digest{i}@example.com" for i in range(30)]
+    with SessionLocal() as session:
+        insert_users_if_missing(session, emails + ["digest-off@example.com"])
+        session.execute(update(User).where(User.email == "digest-off@example.com").values(is_subscribed=False))
+        session.commit()
+
+    handler = SinkHandler(fail_once={"digest7@example.com"})
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        pool = SMTPConnectionPool("127.0.0.1", port, size=3)
+        job = WeeklyDigestJob(pool, workers=4, rate_per_second=0, batch_size=7, backoff_seconds=0.01)
+        progress = job.run("test-run")
+
+        assert progress["status"] == "completed"
+        assert progress["failed"] == 0
+        assert all(handler.delivered.count(email) == 1 for email in emails)
+        assert "digest-off@example.com" not in handler.delivered
+        assert pool.opened <= 3
+
+        # A completed run is not sent twice
+        delivered = len(handler.delivered)
+        assert job.run("test-run")["status"] == "completed"
+        assert len(handler.delivered) == delivered
+    finally:
+        controller.stop()
+
+def test_digest_headers_are_validated_and_crlf_terminated():
+    """Test that recipients go through the header API and messages use SMTP line endings"""
+    with SessionLocal() as session:
+        insert_users_if_missing(session, ["digest-header@example.com", "digest-bad@example.com\r\nBcc: x@example.com"])
+        session.commit()
+
+    handler = SinkHandler()
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        job = WeeklyDigestJob(SMTPConnectionPool("127.0.0.1", port, size=2), rate_per_second=0)
+        progress = job.run("test-headers")
+    finally:
+        controller.stop()
+
+    assert progress["failed"] >= 1
+    assert not any("digest-bad" in address for address in handler.delivered)
+    message = handler.messages["digest-header@example.com"]
+    assert b"\r\nTo: digest-header@example.com\r\n" in message
+    assert b"\n" not in message.replace(b"\r\n", b"")
+
+def test_live_digest_run_is_not_started_twice(monkeypatch):
+    """Test that a claimed run refuses a second sender until its lease expires"""
+    assert claim_digest_run("test-claim")["status"] == "running"
+
+    job = WeeklyDigestJob(SMTPConnectionPool("127.0.0.1", free_port()), rate_per_second=0)
+    with pytest.raises(RunInProgressError):
+        job.run("test-claim")
+    monkeypatch.setattr(email_service, "smtp_host", "127.0.0.1")
+    response = client.post("/api/users/send-digest", params={"run_key": "test-claim"})
+    assert response.status_code == 409
+
+    # A worker that stopped updating its checkpoint loses the run
+    with SessionLocal() as session:
+        assert claim_run(session, JOB_NAME, "test-claim", lease_seconds=-1).status == "running"
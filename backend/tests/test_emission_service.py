@@ -0,0 +1,109 @@
+import json
+import math
+import time
+
+import pytest
+
+from app.services.emission_service import EmissionService, FactorTable
+
+service = EmissionService()
+
+def test_factor_index_matches_nested_file():
+    """Test that every activity in the JSON file is compiled into the flat index"""
+    for category, activities in service.emission_factors.items():
+        for key, data in activities.items():
+            entry = service.get_factor(key)
+            assert entry.category == category
+            assert entry.factor == data["factor"]
+            assert entry.unit == data["unit"]
+
+def test_factor_index_is_read_only():
+    """Test that the compiled index cannot be mutated by callers"""
+    try:
+        service.table.index["car_gasoline"] = None
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("factor index should be immutable")
+
+def test_activity_catalog_is_read_only():
+    """Test that the shared activity catalog cannot be mutated by callers"""
+    activities = service.get_all_activities()
+    category = next(iter(activities))
+    key = next(iter(activities[category]))
+    with pytest.raises(TypeError):
+        activities["new_category"] = {}
+    with pytest.raises(TypeError):
+        activities[category]["new_activity"] = {}
+    with pytest.raises(TypeError):
+        activities[category][key]["name"] = "changed"
+
+def test_first_category_wins_for_duplicate_keys():
+    """Test that duplicate activity keys resolve like the nested scan did"""
+    table = FactorTable({
+        "a": {"x": {"name": "X", "factor": 1.0, "unit": "kg", "description": ""}},
+        "b": {"x": {"name": "X", "factor": 2.0, "unit": "kg", "description": ""}}
+    })
+    assert table.index["x"].category == "a"
+    assert table.categories == ("a", "b")
+
+def test_batch_matches_single_calculation():
+    """Test that the vectorized path agrees with calculate_emissions"""
+    types = ["car_gasoline", "train", "nope"]
+    emissions = service.calculate_emissions_batch(types, [10.0, 3.5, 1.0])
+    assert emissions[0] == service.calculate_emissions("car_gasoline", 10.0)["co2_emissions"]
+    assert emissions[1] == service.calculate_emissions("train", 3.5)["co2_emissions"]
+    assert math.isnan(emissions[2])
+
+def _write_factors(path, factor):
+    path.write_text(json.dumps({
+        "transport": {"car": {"name": "Car", "factor": factor, "unit": "km", "description": "Car"}}
+    }))
+
+def test_reload_swaps_table_and_reports_version(tmp_path):
+    """Test that a changed file goes live as a new version and old tables stay intact"""
+    path = tmp_path / "factors.json"
+    _write_factors(path, 0.2)
+    local = EmissionService(path=str(path))
+    old_table = local.table
+    first = local.calculate_emissions("car", 10)
+
+    _write_factors(path, 0.3)
+    assert local.reload() is True
+    second = local.calculate_emissions("car", 10)
+
+    assert first["co2_emissions"] == 2.0 and second["co2_emissions"] == 3.0
+    assert first["factor_version"] == old_table.version != second["factor_version"]
+    assert old_table.factor_values["car"] == 0.2
+    # The catalog body omits factor values, so its content-hash ETag is unchanged
+    assert old_table.activities_body.etag == local.table.activities_body.etag
+    assert local.reload() is False
+
+def test_invalid_reload_keeps_current_table(tmp_path):
+    """Test that a file that fails validation is rejected without a swap"""
+    path = tmp_path / "factors.json"
+    _write_factors(path, 0.2)
+    local = EmissionService(path=str(path))
+    version = local.table.version
+
+    for content in ("{not json", json.dumps({"transport": {"car": {"factor": "high"}}})):
+        path.write_text(content)
+        with pytest.raises(ValueError):
+            local.reload()
+    assert local.table.version == version
+    assert local.reload_errors == 2
+
+def test_watcher_reloads_changed_file(tmp_path):
+    """Test that the background watcher picks up file changes"""
+    path = tmp_path / "factors.json"
+    _write_factors(path, 0.2)
+    local = EmissionService(path=str(path), watch=True, watch_interval=0.01)
+    local.start_watching()
+    try:
+        _write_factors(path, 0.5)
+        deadline = time.monotonic() + 5
+        while local.get_factor("car").factor != 0.5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert local.get_factor("car").factor == 0.5
+    finally:
+        local.stop_watching()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+from app.services.activity_service import activity_row, save_activities
+from app.services.live_service import Subscription, live_updates, sse_frame
+
+client = TestClient(app)
+
+def events(body):
+    """(event, data) pairs from a chunk of SSE frames"""
+    parsed = []
+    for frame in body.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+def save(email, *activities):
+    with SessionLocal() as session:
+        save_activities(session, [activity_row(email, activity_type, 1.0, co2) for activity_type, co2 in activities])
+
+def test_stream_pushes_activities_and_totals():
+    """Test that a committed write reaches an open stream with the new running total"""
+    email = "live@example.com"
+    save(email, ("beef", 27.0))
+
+    async def run():
+        subscription = live_updates.subscribe(email)
+        stream = live_updates.stream(subscription)
+        try:
+            assert await stream.__anext__() == b"retry: 5000\n\n"
+            first = events(await asyncio.wait_for(stream.__anext__(), 5))
+            assert first == [("total", {"user_email": email, "total_co2": 27.0, "activity_count": 1})]
+
+            # Writers run off the event loop, as in the threadpool or the write buffer
+            await asyncio.to_thread(save, email, ("bus", 0.5), ("train", 1.5))
+            received = []
+            while not received or received[-1][0] != "total":
+                received += events(await asyncio.wait_for(stream.__anext__(), 5))
+            assert [(event, data.get("activity_type")) for event, data in received] == [
+                ("activity", "bus"), ("activity", "train"), ("total", None)
+            ]
+            assert received[-1][1]["total_co2"] == 29.0
+            assert received[-1][1]["activity_count"] == 3
+        finally:
+            await stream.aclose()
+        assert not live_updates.watching([email])
+
+    asyncio.run(run())
+
+def test_backlog_is_bounded_and_disabled_endpoint():
+    """Test that a slow client keeps only the newest activities, and the 503 when disabled"""
+    async def run():
+        subscription = Subscription("slow@example.com", backlog=2)
+        frames = [sse_frame("activity", {"n": n}) for n in range(5)]
+        subscription.push_activities(frames[:3], skipped=0)
+        subscription.push_activities(frames[3:], skipped=4)
+        subscription.push_total((1.0, 9), sse_frame("total", {"total_co2": 1.0}))
+        subscription.push_total((1.0, 9), sse_frame("total", {"total_co2": 1.0}))
+        assert events(subscription.drain()) == [
+            ("dropped", {"dropped": 7}), ("activity", {"n": 3}), ("activity", {"n": 4}), ("total", {"total_co2": 1.0})
+        ]
+        assert subscription.drain() == b""
+
+    asyncio.run(run())
+
+    live_updates.enabled = False
+    try:
+        assert client.get("/api/emissions/live/slow@example.com").status_code == 503
+    finally:
+        live_updates.enabled = True
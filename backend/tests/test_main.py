@@ -68,4 +68,258 @@ def test_subscribe_user():
     assert response.status_code == 200
     data = response.json()
     assert data["email"] == "test@example.com"
-    assert data["is_subscribed"] == True
\ No newline at end of file
+    assert data["is_subscribed"] == True
+
+def test_calculate_emissions_batch():
+    """Test batch emissions calculation with a bad item"""
+    request_data = {
+        "items": [
+            {"activity_type": "car_gasoline", "quantity": 10.0, "user_email": "batch@example.com"},
+            {"activity_type": "invalid_activity", "quantity": 5.0, "user_email": "batch@example.com"},
+            {"activity_type": "train", "quantity": 100.0, "user_email": "batch@example.com"}
+        ]
+    }
+    response = client.post("/api/emissions/calculate/batch", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 2
+    assert data["failed"] == 1
+    assert data["saved"] == 2
+    assert data["total_co2_emissions"] == 6.1  # 0.21 * 10 + 0.04 * 100
+    assert data["results"][0]["co2_emissions"] == 2.1
+    assert "kg CO₂/km" in data["results"][0]["unit"]
+    assert "Activity type 'invalid_activity' not found" in data["results"][1]["error"]
+
+    history = client.get("/api/emissions/history/batch@example.com").json()
+    assert len(history) == 2
+
+def test_batch_rounding_matches_single_calculation():
+    """Test that a half-way product rounds the same in the batch and single paths"""
+    item = {"activity_type": "car_gasoline", "quantity": 0.05}
+    single = client.post("/api/emissions/calculate", json=item).json()
+    batch = client.post("/api/emissions/calculate/batch", json={"items": [item]}).json()
+    assert single["co2_emissions"] == 0.011
+    assert batch["results"][0]["co2_emissions"] == single["co2_emissions"]
+
+def test_history_keyset_pagination():
+    """Test paging through history with the X-Next-Cursor header"""
+    from datetime import datetime, timedelta
+    from app.database import SessionLocal
+    from app.services.activity_service import activity_row, save_activities
+
+    email = "pages@example.com"
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(7):
+        row = activity_row(email, "bus" if i % 2 else "train", float(i), 0.1)
+        # Two rows share each timestamp so the id tie-break is exercised
+        row["created_at"] = base + timedelta(minutes=i // 2)
+        rows.append(row)
+    with SessionLocal() as session:
+        save_activities(session, rows)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/api/emissions/history/{email}", params=params)
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+    filtered = client.get(f"/api/emissions/history/{email}", params={"activity_type": "bus"}).json()
+    assert [item["activity_type"] for item in filtered] == ["bus"] * 3
+
+    ranged = client.get(f"/api/emissions/history/{email}", params={
+        "start": "2024-01-01T12:01:00",
+        "end": "2024-01-01T12:02:00"
+    }).json()
+    assert len(ranged) == 2
+
+    response = client.get(f"/api/emissions/history/{email}", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_history_pagination_with_server_default_timestamps():
+    """Test paging over rows timestamped by the database default (whole seconds on SQLite)"""
+    from sqlalchemy import insert
+    from app.database import SessionLocal
+    from app.models.database import Activity
+
+    email = "server-default@example.com"
+    with SessionLocal() as session:
+        for _ in range(3):
+            session.execute(insert(Activity).values(
+                user_email=email, activity_type="bus", quantity=1.0, co2_emissions=0.1
+            ))
+        session.commit()
+
+    seen = []
+    cursor = None
+    for _ in range(5):
+        params = {"limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/api/emissions/history/{email}", params=params)
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert cursor is None
+    assert len(seen) == 3
+    assert seen == sorted(seen, reverse=True)
+
+def test_export_history_streams_csv_and_ndjson():
+    """Test the streaming CSV and NDJSON export"""
+    import json
+    from datetime import datetime, timedelta
+    from app.database import SessionLocal
+    from app.services.activity_service import activity_row, save_activities
+
+    email = "export@example.com"
+    rows = []
+    for i in range(5):
+        row = activity_row(email, "bus", float(i), round(0.08 * i, 3))
+        row["created_at"] = datetime(2024, 3, 1) + timedelta(days=i)
+        rows.append(row)
+    with SessionLocal() as session:
+        save_activities(session, rows)
+
+    response = client.get(f"/api/emissions/export/{email}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.strip().splitlines()
+    assert lines[0] == "id,user_email,activity_type,quantity,co2_emissions,created_at"
+    assert len(lines) == 6
+
+    response = client.get(f"/api/emissions/export/{email}", params={
+        "format": "ndjson", "start": "2024-03-02T00:00:00", "end": "2024-03-04T00:00:00"
+    })
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["quantity"] for record in records] == [1.0, 2.0]
+
+def test_import_activities_csv_and_ndjson():
+    """Test bulk import with accepted and rejected rows"""
+    csv_body = (
+        "activity_type,quantity,user_email,created_at\n"
+        "car_gasoline,10,import@example.com,2024-02-01T08:00:00Z\n"
+        "invalid_activity,1,import@example.com,\n"
+        "train,abc,import@example.com,\n"
+        "train,100,,\n"
+    )
+    response = client.post(
+        "/api/emissions/import",
+        params={"user_email": "fallback@example.com"},
+        files={"file": ("activities.csv", csv_body, "text/csv")}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["accepted"] == 2
+    assert report["rejected"] == 2
+    assert report["total_co2_emissions"] == 6.1
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+
+    summary = client.get("/api/emissions/summary/import@example.com").json()
+    assert summary["buckets"][0]["period_start"] == "2024-02-01"
+    assert summary["total_co2"] == 2.1
+    assert len(client.get("/api/emissions/history/fallback@example.com").json()) == 1
+
+    ndjson_body = (
+        '{"activity_type": "bus", "quantity": 5, "user_email": "import@example.com"}\n'
+        'not json\n'
+        '{"activity_type": ["bus"], "quantity": 5, "user_email": "import@example.com"}\n'
+        '{"activity_type": "bus", "quantity": 5, "user_email": 5}\n'
+        '{"activity_type": "bus", "quantity": 5, "user_email": "a@example.com\\r\\nBcc: b@example.com"}\n'
+        '{"activity_type": "bus", "quantity": "nan", "user_email": "import@example.com"}\n'
+    )
+    response = client.post(
+        "/api/emissions/import",
+        files={"file": ("activities.ndjson", ndjson_body, "application/x-ndjson")}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["accepted"] == 1
+    assert report["rejected"] == 5
+    assert [error["row"] for error in report["errors"]] == [2, 3, 4, 5, 6]
+
+def test_import_reports_non_utf8_rows():
+    """Test that a row that is not UTF-8 is rejected on its own instead of failing the upload"""
+    csv_body = (
+        "activity_type,quantity,user_email,created_at\n"
+        "bus,10,latin1@example.com,\n"
+        "bus,10,caf\xe9@example.com,\n"
+        "bus,5,latin1@example.com,\n"
+    ).encode("latin-1")
+    response = client.post(
+        "/api/emissions/import",
+        files={"file": ("activities.csv", csv_body, "text/csv")}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["accepted"] == 2
+    assert report["errors"] == [{"row": 2, "error": "Row is not valid UTF-8"}]
+
+def test_list_users_paginates_and_counts():
+    """Test keyset paging, filters, count and NDJSON export of users"""
+    import json
+
+    for i in range(5):
+        client.post("/api/users/subscribe", json={"email": f"listing{i}@example.com"})
+    client.post("/api/users/unsubscribe", params={"email": "listing0@example.com"})
+
+    total = client.get("/api/users/count").json()["count"]
+    unsubscribed = client.get("/api/users/count", params={"is_subscribed": False}).json()["count"]
+    assert unsubscribed >= 1
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/users/", params=params)
+        assert response.status_code == 200
+        seen.extend(user["id"] for user in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == total
+    assert seen == sorted(seen)
+
+    response = client.get("/api/users/export", params={"is_subscribed": False})
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == unsubscribed
+    assert all(record["is_subscribed"] is False for record in records)
+
+def test_factor_version_reported_and_reload():
+    """Test that results carry the factor version and reload is a no-op when unchanged"""
+    info = client.get("/api/emissions/factors").json()
+    response = client.post("/api/emissions/calculate", json={"activity_type": "car_gasoline", "quantity": 1})
+    assert response.json()["factor_version"] == info["version"]
+
+    response = client.post("/api/emissions/factors/reload")
+    assert response.status_code == 200
+    assert response.json()["changed"] is False
+    assert response.json()["factors"]["version"] == info["version"]
+
+def test_catalog_etag_and_not_modified():
+    """Test that catalog responses carry an ETag and revalidate with 304"""
+    for path in ("/api/emissions/activities", "/api/emissions/categories"):
+        response = client.get(path)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"].startswith("public, max-age=")
+
+        response = client.get(path, headers={"If-None-Match": f'W/"stale", {etag}'})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+        assert client.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text as sql
+
+from app.main import app
+from app.database import make_engine
+from app.services.metrics_service import Histogram, instrument_engine, registry, timed_task
+
+client = TestClient(app)
+
+def _sample(text, prefix):
+    """Value of the first sample line starting with `prefix`"""
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_histogram_renders_cumulative_buckets():
+    """Test Prometheus histogram output"""
+    histogram = Histogram("demo_seconds", "Demo", labels=("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "/x")
+    lines = histogram.samples()
+    assert 'demo_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/x",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/x"} 3' in lines
+
+def test_metrics_endpoint_reports_routes_and_queries():
+    """Test that requests are recorded per route template with their SQL statement counts"""
+    client.post("/api/emissions/calculate", json={
+        "activity_type": "car_gasoline", "quantity": 5, "user_email": "metrics@example.com"
+    })
+    client.get("/api/emissions/history/metrics@example.com")
+    client.get("/api/does-not-exist")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    count = _sample(text, 'http_request_duration_seconds_count{method="GET",route="/api/emissions/history/{email}",status="200"}')
+    assert count and count >= 1
+    assert _sample(text, 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}') >= 1
+    assert _sample(text, 'http_request_db_queries_sum{method="POST",route="/api/emissions/calculate"}') >= 1
+    assert _sample(text, 'db_pool_checkout_seconds_count{engine="sync"}') >= 1
+    assert _sample(text, 'emission_factor_lookups_total{result="hit"}') >= 1
+    assert _sample(text, "http_requests_in_flight") == 1
+
+def test_timed_task_records_outcome():
+    """Test that background task durations are labelled by outcome"""
+    timed_task("demo_task", lambda: False)()
+    text = client.get("/metrics").text
+    assert _sample(text, 'background_task_duration_seconds_count{task="demo_task",outcome="failed"}') == 1
+
+def test_pool_metrics_cover_every_engine_once():
+    """Test one TYPE line per pool family across engines, and counting after dispose()"""
+    directory = tempfile.mkdtemp(prefix="carbon_tracker_metrics_")
+    engines = [make_engine(f"sqlite:///{os.path.join(directory, f'{n}.db')}") for n in range(2)]
+    for n, engine in enumerate(engines):
+        instrument_engine(engine, f"pool_test_{n}")
+        engine.dispose()
+        with engine.connect() as connection:
+            connection.execute(sql("SELECT 1"))
+
+    text = registry.render()
+    for family in ("db_pool_size", "db_pool_checked_out"):
+        assert text.count(f"# TYPE {family} gauge") == 1
+        assert _sample(text, f'{family}{{engine="pool_test_1"}}') is not None
+    assert _sample(text, 'db_pool_checkouts_total{engine="pool_test_0"}') == 1
+    assert _sample(text, 'db_pool_connections_opened_total{engine="pool_test_1"}') == 1
+    assert _sample(text, 'db_pool_checkout_seconds_count{engine="pool_test_1"}') == 1
+    for engine in engines:
+        engine.dispose()
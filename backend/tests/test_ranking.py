@@ -0,0 +1,90 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+from app.services.ranking_service import LogHistogramSketch, RankingNotReadyError, UserRanking, user_ranking
+
+client = TestClient(app)
+
+def test_sketch_rank_within_reported_error():
+    """Test that sketch ranks stay within the error bound they report"""
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1.5) for _ in range(20000)]
+    sketch = LogHistogramSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    ordered = sorted(values)
+    for probe in rng.sample(values, 50):
+        below = sum(1 for value in ordered if value < probe) / len(values)
+        estimate, error = sketch.rank(probe)
+        assert abs(estimate - below) <= error + 1 / len(values)
+
+    median = ordered[len(ordered) // 2]
+    assert abs(sketch.value_at(0.5) - median) / median <= 0.02
+
+def test_sketch_deletes_are_exact():
+    """Test that removing values restores the previous state"""
+    sketch = LogHistogramSketch()
+    for value in (0.0, -3.0, 5.0, 5.0, 1e12):
+        sketch.add(value)
+    before = sketch.counts.copy()
+    sketch.add(42.0)
+    sketch.remove(42.0)
+    assert (sketch.counts == before).all()
+    assert sketch.total == 5
+
+def test_snapshot_round_trip():
+    """Test that a persisted sketch can warm up another worker"""
+    ranking = UserRanking()
+    with SessionLocal() as session:
+        ranking.rebuild(session)
+        ranking.persist(session)
+        warm = UserRanking()
+        assert warm.load_snapshot(session)
+    assert warm.sketch.total == ranking.sketch.total
+    assert not warm.live
+
+def test_cold_ranking_is_not_rebuilt_inline(monkeypatch):
+    """Test that a rank request before the warm-up gets a 503 instead of a full rebuild"""
+    cold = UserRanking()
+    with SessionLocal() as session:
+        with pytest.raises(RankingNotReadyError):
+            cold.rank(session, "rank-cold@example.com")
+
+    monkeypatch.setattr(user_ranking, "live", False)
+    monkeypatch.setattr(user_ranking, "as_of", None)
+    response = client.get("/api/emissions/rank/rank-cold@example.com")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+def test_rank_endpoint_orders_users():
+    """Test that heavier emitters rank higher and updates apply incrementally"""
+    # What the startup warm-up does
+    with SessionLocal() as session:
+        user_ranking.rebuild(session)
+    for email, quantity in (("rank-low@example.com", 1), ("rank-mid@example.com", 50), ("rank-high@example.com", 500)):
+        response = client.post("/api/emissions/calculate", json={
+            "activity_type": "car_gasoline", "quantity": quantity, "user_email": email
+        })
+        assert response.status_code == 200
+
+    low, mid, high = (
+        client.get(f"/api/emissions/rank/rank-{name}@example.com").json() for name in ("low", "mid", "high")
+    )
+    assert low["percentile"] < mid["percentile"] < high["percentile"]
+    assert high["emits_less_than_percent"] < low["emits_less_than_percent"]
+    assert user_ranking.live
+
+    # The low emitter overtakes everyone without a rebuild
+    client.post("/api/emissions/calculate", json={
+        "activity_type": "car_gasoline", "quantity": 100000, "user_email": "rank-low@example.com"
+    })
+    overtaken = client.get("/api/emissions/rank/rank-high@example.com").json()
+    assert client.get("/api/emissions/rank/rank-low@example.com").json()["percentile"] > overtaken["percentile"]
+
+    inactive = client.get("/api/emissions/rank/rank-nobody@example.com").json()
+    assert inactive["total_co2"] == 0 and inactive["emits_less_than_percent"] is None
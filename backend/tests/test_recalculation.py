@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.database import Activity
+from app.services.activity_service import activity_row, save_activities
+from app.services.checkpoint_service import RunInProgressError
+from app.services.recalculation_service import RecalculationJob, get_recalculation_progress
+from app.services.rollup_service import running_totals
+
+client = TestClient(app)
+
+def test_recalculation_resumes_and_keeps_rollups_consistent():
+    """Test chunked re-pricing, resuming after a failure and the rollup corrections"""
+    email = "recalc@example.com"
+    rows = []
+    # Priced with an outdated beef factor (5 instead of 27 kg per kg)
+    for day in range(1, 6):
+        row = activity_row(email, "beef", 2.0, 10.0)
+        row["created_at"] = datetime(2023, 2, day, 12, 0, 0)
+        rows.append(row)
+    rows.append(activity_row(email, "bus", 10.0, 0.89))
+    with SessionLocal() as session:
+        save_activities(session, rows)
+        before = running_totals(session, [email])[email]
+
+    def fail_after_first_chunk(progress):
+        if progress["updated"] >= 2:
+            raise RuntimeError("worker killed")
+
+    job = RecalculationJob(chunk_size=2, rows_per_second=0)
+    with pytest.raises(RuntimeError):
+        job.run("test-beef", ["beef"], on_chunk=fail_after_first_chunk)
+    progress = get_recalculation_progress("test-beef")
+    assert progress["status"] == "failed"
+    assert 0 < progress["last_id"] < progress["max_id"]
+
+    progress = job.run("test-beef", ["beef"])
+    assert progress["status"] == "completed"
+    assert progress["updated"] >= 5
+    # A completed run is not repeated
+    assert job.run("test-beef", ["beef"])["updated"] == progress["updated"]
+
+    with SessionLocal() as session:
+        stored = session.scalars(
+            select(Activity.co2_emissions).where(Activity.user_email == email, Activity.activity_type == "beef")
+        ).all()
+        assert stored == [54.0] * 5
+        total_co2, activity_count = running_totals(session, [email])[email]
+    assert activity_count == before[1]
+    assert total_co2 == pytest.approx(before[0] + 5 * 44.0)
+
+    summary = client.get(f"/api/emissions/summary/{email}", params={"period": "month"}).json()
+    assert summary["buckets"][0]["categories"]["food"] == pytest.approx(270.0)
+
+def test_recalculation_endpoints():
+    """Test the recalculation endpoint's validation and the progress lookup"""
+    response = client.post("/api/emissions/factors/recalculate", params={"activity_type": ["not_an_activity"]})
+    assert response.status_code == 422
+    assert client.get("/api/emissions/factors/recalculate/never-ran").status_code == 404
+
+def test_overlapping_recalculations_are_refused():
+    """Test that a second run, under the same or another key, cannot start while one is live"""
+    email = "recalc-overlap@example.com"
+    rows = [activity_row(email, "pork", 1.0, 1.0) for _ in range(4)]
+    with SessionLocal() as session:
+        save_activities(session, rows)
+        before = running_totals(session, [email])[email]
+
+    refused = []
+
+    def start_overlapping_runs(progress):
+        if refused:
+            return
+        for run_key in ("test-overlap", "test-overlap-other"):
+            with pytest.raises(RunInProgressError):
+                RecalculationJob(chunk_size=2, rows_per_second=0).run(run_key, ["pork"])
+            response = client.post("/api/emissions/factors/recalculate", params={
+                "run_key": run_key, "activity_type": ["pork"]
+            })
+            refused.append(response.status_code)
+
+    progress = RecalculationJob(chunk_size=2, rows_per_second=0).run(
+        "test-overlap", ["pork"], on_chunk=start_overlapping_runs
+    )
+    assert progress["status"] == "completed"
+    assert refused == [409, 409]
+
+    with SessionLocal() as session:
+        total_co2, _ = running_totals(session, [email])[email]
+        stored = session.scalars(select(Activity.co2_emissions).where(Activity.user_email == email)).all()
+    # Each row's correction was applied exactly once
+    assert total_co2 == pytest.approx(before[0] + sum(co2 - 1.0 for co2 in stored))
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from app.database import Base, make_engine, read_replica
+from app.main import app
+from app.models.database import User
+
+client = TestClient(app)
+
+@pytest.fixture
+def replica():
+    """A second SQLite file standing in for a replica that has not caught up"""
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='carbon_tracker_replica_'), 'replica.db')}"
+    replica_engine = make_engine(url)
+    Base.metadata.create_all(bind=replica_engine)
+    with replica_engine.begin() as connection:
+        connection.execute(insert(User), [{"email": "replica-only@example.com", "is_subscribed": True}])
+    replica_engine.dispose()
+    read_replica.configure(url)
+    client.cookies.clear()
+    yield read_replica
+    read_replica.configure(None)
+    client.cookies.clear()
+
+def listed_emails():
+    return {user["email"] for user in client.get("/api/users/", params={"limit": 1000}).json()}
+
+def test_reads_use_replica_except_after_own_writes(replica):
+    """Test routing to the replica, and read-your-writes on the primary"""
+    assert "replica-only@example.com" in listed_emails()
+    assert replica.reads["replica"] >= 1
+
+    email = "replica-writer@example.com"
+    response = client.post("/api/emissions/calculate", json={
+        "activity_type": "bus", "quantity": 10, "user_email": email
+    })
+    assert response.status_code == 200
+    assert "read_primary_until" in response.headers["set-cookie"]
+
+    # The cookie sends every read to the primary
+    assert "replica-only@example.com" not in listed_emails()
+
+    # Without it this worker still remembers the writer
+    client.cookies.clear()
+    assert len(client.get(f"/api/emissions/history/{email}").json()) == 1
+    assert client.get("/api/emissions/history/someone-else@example.com").json() == []
+    assert "replica-only@example.com" in listed_emails()
+
+def test_unreachable_replica_falls_back_to_primary(replica):
+    """Test that reads go to the primary while the replica is down"""
+    replica.configure("sqlite:////nonexistent/carbon_tracker/replica.db")
+    assert "replica-only@example.com" not in listed_emails()
+    assert replica.healthy is False
+    assert replica.failures >= 1
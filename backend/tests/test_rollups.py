@@ -0,0 +1,95 @@
+import threading
+from datetime import date, datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.database import EmissionRollup
+from app.services.activity_service import activity_row, save_activities
+from app.services.archive_service import activity_archive
+from app.services.rollup_service import period_start, rebuild_rollups
+
+client = TestClient(app)
+
+def seed(email):
+    rows = []
+    for day, activity_type, quantity in [(1, "car_gasoline", 10.0), (2, "beef", 1.0), (9, "train", 50.0)]:
+        row = activity_row(email, activity_type, quantity, 0.0)
+        row["co2_emissions"] = round({"car_gasoline": 0.21, "beef": 27.0, "train": 0.04}[activity_type] * quantity, 3)
+        row["created_at"] = datetime(2024, 1, day, 8, 0, 0)
+        rows.append(row)
+    with SessionLocal() as session:
+        save_activities(session, rows)
+
+def test_period_start_buckets():
+    """Test day/week/month bucket boundaries"""
+    timestamp = datetime(2024, 1, 10, 23, 0, 0)
+    assert period_start("day", timestamp) == date(2024, 1, 10)
+    assert period_start("week", timestamp) == date(2024, 1, 8)
+    assert period_start("month", timestamp) == date(2024, 1, 1)
+
+def test_summary_is_maintained_on_write():
+    """Test that the summary endpoint reflects activities as they are written"""
+    email = "rollup@example.com"
+    seed(email)
+
+    data = client.get(f"/api/emissions/summary/{email}", params={"period": "month"}).json()
+    assert data["total_co2"] == 31.1
+    assert data["activity_count"] == 3
+    assert data["buckets"][0]["categories"] == {"transport": 4.1, "food": 27.0}
+
+    weeks = client.get(f"/api/emissions/summary/{email}", params={"period": "week"}).json()
+    assert [bucket["period_start"] for bucket in weeks["buckets"]] == ["2024-01-01", "2024-01-08"]
+
+    days = client.get(f"/api/emissions/summary/{email}", params={
+        "period": "day", "start": "2024-01-02", "end": "2024-01-09"
+    }).json()
+    assert days["total_co2"] == 27.0
+
+def test_rebuild_repairs_drift():
+    """Test that a rebuild recomputes rollups from raw activities"""
+    email = "drift@example.com"
+    seed(email)
+    with SessionLocal() as session:
+        session.execute(update(EmissionRollup).where(EmissionRollup.user_email == email).values(total_co2=0))
+        session.commit()
+
+        assert rebuild_rollups(session, user_email=email) == 1
+        totals = session.scalars(select(EmissionRollup.total_co2).where(
+            EmissionRollup.user_email == email, EmissionRollup.period == "month"
+        )).all()
+    assert round(sum(totals), 3) == 31.1
+
+    with SessionLocal() as session:
+        assert rebuild_rollups(session) >= 1
+    data = client.get(f"/api/emissions/summary/{email}").json()
+    assert data["total_co2"] == 31.1
+
+def test_rebuild_holds_off_concurrent_writes(monkeypatch):
+    """Test that an activity saved while a user's rollups are rebuilt is not lost"""
+    email = "rebuild-race@example.com"
+    seed(email)
+
+    def save_one():
+        with SessionLocal() as session:
+            save_activities(session, [activity_row(email, "bus", 1.0, 5.0)])
+
+    writer = threading.Thread(target=save_one)
+    iter_rows = activity_archive.iter_rows
+
+    def write_mid_rebuild(user_email, *args):
+        # Runs after the rebuild has read the activities and before it writes the rollups
+        writer.start()
+        writer.join(0.5)
+        return iter_rows(user_email, *args)
+
+    monkeypatch.setattr(activity_archive, "iter_rows", write_mid_rebuild)
+    with SessionLocal() as session:
+        rebuild_rollups(session, user_email=email)
+    writer.join()
+
+    data = client.get(f"/api/emissions/summary/{email}", params={"period": "month"}).json()
+    assert data["total_co2"] == 36.1
+    assert data["activity_count"] == 4
@@ -0,0 +1,52 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import scenario_service
+from app.services.scenario_service import ScenarioEngine, build_profiles
+
+client = TestClient(app)
+
+def profiles(users=2, km=1000.0):
+    return build_profiles(["car_gasoline", "beef"], np.array([[km, 10.0]] * users))
+
+def test_substitution_reduces_emissions():
+    """Test the expected reduction of switching half the car km to train"""
+    rules = [{"from_activity": "car_gasoline", "to_activity": "train", "adoption": 0.5, "adoption_sd": 0.0}]
+    result = ScenarioEngine().simulate(rules, samples=4000, factor_uncertainty=0.0, seed=7, profiles=profiles())
+
+    assert result["baseline_co2"] == {"mean": 960.0, "std": 0.0, "p5": 960.0, "p50": 960.0, "p95": 960.0}
+    # Half of 2000 km saves 0.21 - 0.04 kg per km
+    assert abs(result["reduction_co2"]["mean"] - 170.0) < 5
+    assert result["reduction_co2"]["p5"] == 0.0 and result["reduction_co2"]["p95"] == 340.0
+    assert result["rules"][0]["affected_users"] == 2
+
+def test_normal_approximation_for_large_populations(monkeypatch):
+    """Test that the aggregate draw agrees with per-user draws"""
+    rules = [
+        {"from_activity": "car_gasoline", "to_activity": "bus", "adoption": 0.3},
+        {"from_activity": "beef", "adoption": 0.2, "shift": 0.5}
+    ]
+    exact = ScenarioEngine().simulate(rules, samples=2000, seed=1, profiles=profiles(users=500))
+    monkeypatch.setattr(scenario_service, "EXACT_ADOPTION_DRAWS", 0)
+    approximate = ScenarioEngine().simulate(rules, samples=2000, seed=1, profiles=profiles(users=500))
+
+    for key in ("reduction_co2", "reduction_percent"):
+        assert abs(exact[key]["mean"] - approximate[key]["mean"]) < 0.02 * exact[key]["mean"]
+        assert abs(exact[key]["std"] - approximate[key]["std"]) < 0.1 * exact[key]["std"]
+
+def test_simulate_endpoint():
+    """Test the scenario endpoint and its rule validation"""
+    rule = {"from_activity": "car_gasoline", "to_activity": "train", "adoption": 0.3}
+    response = client.post("/api/emissions/scenarios/simulate", json={"rules": [rule], "samples": 500, "seed": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["samples"] == 500
+    assert data["reduction_co2"]["p5"] <= data["reduction_co2"]["p50"] <= data["reduction_co2"]["p95"]
+
+    unknown = dict(rule, to_activity="teleport")
+    response = client.post("/api/emissions/scenarios/simulate", json={"rules": [unknown]})
+    assert response.status_code == 422
+
+    response = client.post("/api/emissions/scenarios/simulate", json={"rules": [rule, dict(rule, adoption=0.8)]})
+    assert response.status_code == 422
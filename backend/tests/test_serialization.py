@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.models.schemas import ActivityResponse
+from app.services import serialization
+from app.services.serialization import encode_rows
+
+COLUMNS = tuple(ActivityResponse.model_fields)
+ROWS = [
+    (1, "a@example.com", "train", 12.5, 0.51, datetime(2024, 3, 1, 8, 30, 0, 123456)),
+    (2, "a@example.com", "beef", 1.0, 27.0, datetime(2024, 3, 1, 9, 0, tzinfo=timezone.utc)),
+    (3, "é@example.com", "bus", 3.0, 0.3, datetime(2024, 3, 1, 9, 0, tzinfo=timezone(timedelta(hours=2))))
+]
+
+def _pydantic_json(rows) -> bytes:
+    adapter = TypeAdapter(List[ActivityResponse])
+    return adapter.dump_json(adapter.validate_python([dict(zip(COLUMNS, row)) for row in rows]))
+
+def test_fast_path_matches_pydantic_output():
+    """Test that column tuples encode to the same JSON the response_model path produced"""
+    assert encode_rows(COLUMNS, ROWS) == _pydantic_json(ROWS)
+
+def test_json_fallback_matches_orjson(monkeypatch):
+    """Test the stdlib encoder used when orjson is not installed"""
+    expected = encode_rows(COLUMNS, ROWS)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert encode_rows(COLUMNS, ROWS) == expected
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from app.database import SessionLocal
+from app.models.database import User
+from app.services.activity_service import activity_row, save_activities
+from app.services.user_service import KnownUserCache, insert_users_if_missing, known_users
+
+def test_cache_evicts_least_recently_used():
+    """Test the LRU bound and hit/miss counters"""
+    cache = KnownUserCache(max_size=2)
+    cache.add_many(["a@example.com", "b@example.com"])
+    assert cache.contains("a@example.com")
+    cache.add_many(["c@example.com"])
+    assert not cache.contains("b@example.com")
+    assert cache.contains("c@example.com")
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+def test_cache_entries_expire():
+    """Test that entries older than the TTL are treated as misses"""
+    cache = KnownUserCache(ttl_seconds=0)
+    cache.add_many(["a@example.com"])
+    assert not cache.contains("a@example.com")
+    assert cache.stats()["size"] == 0
+
+def test_repeat_user_skips_user_table():
+    """Test that a known user is served from the cache on the next write"""
+    email = "cached@example.com"
+    with SessionLocal() as session:
+        save_activities(session, [activity_row(email, "bus", 1.0, 0.08)])
+    hits = known_users.hits
+    with SessionLocal() as session:
+        save_activities(session, [activity_row(email, "bus", 2.0, 0.16)])
+    assert known_users.hits == hits + 1
+
+def test_concurrent_first_time_inserts_do_not_conflict():
+    """Test that racing inserts for one new email create exactly one user"""
+    email = "race@example.com"
+
+    def insert_once(_):
+        with SessionLocal() as session:
+            created = insert_users_if_missing(session, [email])
+            session.commit()
+            return created
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        created = list(pool.map(insert_once, range(8)))
+
+    assert sum(created) == 1
+    with SessionLocal() as session:
+        assert session.scalar(select(func.count()).select_from(User).where(User.email == email)) == 1
@@ -0,0 +1,106 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.database import SessionLocal
+from app.models.database import Activity, User
+from app.services.activity_service import activity_row
+from app.services.live_service import live_updates
+from app.services.write_buffer import ActivityWriteBuffer
+
+def count_activities(email):
+    with SessionLocal() as session:
+        return session.scalar(select(func.count()).select_from(Activity).where(Activity.user_email == email))
+
+def test_buffer_flushes_and_drains_on_stop():
+    """Test that queued rows are bulk written and drained on shutdown"""
+    buffer = ActivityWriteBuffer(enabled=True, flush_rows=10, flush_interval_ms=50)
+
+    async def run():
+        await buffer.start()
+        for _ in range(25):
+            assert await buffer.enqueue(activity_row("buffered@example.com", "bus", 1.0, 0.08))
+        await buffer.stop()
+
+    asyncio.run(run())
+    stats = buffer.stats()
+    assert stats["queued"] == 25
+    assert stats["flushed"] == 25
+    assert stats["dropped"] == 0
+    assert stats["flushes"] >= 3
+    assert count_activities("buffered@example.com") == 25
+    with SessionLocal() as session:
+        assert session.scalar(select(User).where(User.email == "buffered@example.com")) is not None
+
+def test_buffer_hands_rows_back_when_full():
+    """Test backpressure: a full queue waits, then returns the row to the caller"""
+    buffer = ActivityWriteBuffer(enabled=True, max_size=1, flush_rows=100, enqueue_timeout_ms=20)
+
+    async def run():
+        release = asyncio.Event()
+        original_flush = buffer._flush
+
+        async def slow_flush(batch):
+            await release.wait()
+            await original_flush(batch)
+
+        buffer._flush = slow_flush
+        await buffer.start()
+        assert await buffer.enqueue(activity_row("full@example.com", "bus", 1.0, 0.08))
+        await asyncio.sleep(0.3)  # flusher holds the first row, waiting on release
+        assert await buffer.enqueue(activity_row("full@example.com", "bus", 1.0, 0.08))
+        assert not await buffer.enqueue(activity_row("full@example.com", "bus", 1.0, 0.08))
+        release.set()
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert buffer.overflowed == 1
+    assert buffer.dropped == 0
+    assert buffer.flushed == 2
+
+def test_failed_batch_is_retried_row_by_row():
+    """Test that one bad row in a batch only drops that row"""
+    buffer = ActivityWriteBuffer(enabled=True, flush_rows=10, flush_interval_ms=50)
+    bad = activity_row("retried@example.com", "bus", 1.0, 0.08)
+    bad["created_at"] = "not a timestamp"
+
+    async def run():
+        await buffer.start()
+        for row in (activity_row("retried@example.com", "bus", 1.0, 0.08), bad,
+                    activity_row("retried@example.com", "bus", 1.0, 0.08)):
+            assert await buffer.enqueue(row)
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert buffer.dropped == 1
+    assert buffer.flushed == 2
+    assert count_activities("retried@example.com") == 2
+
+def test_failing_notification_does_not_rewrite_the_batch(monkeypatch):
+    """Test that an error after the commit neither fails the flush nor inserts rows twice"""
+    def publish(rows):
+        raise RuntimeError("redis is down")
+
+    monkeypatch.setattr(live_updates, "publish", publish)
+    buffer = ActivityWriteBuffer(enabled=True, flush_rows=10, flush_interval_ms=50)
+
+    async def run():
+        await buffer.start()
+        for _ in range(3):
+            assert await buffer.enqueue(activity_row("notified@example.com", "bus", 1.0, 0.08))
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert buffer.dropped == 0
+    assert buffer.flushed == 3
+    assert count_activities("notified@example.com") == 3
+
+def test_disabled_buffer_falls_back():
+    """Test that enqueue reports False when write-behind is off"""
+    buffer = ActivityWriteBuffer(enabled=False)
+
+    async def run():
+        await buffer.start()
+        return await buffer.enqueue(activity_row("off@example.com", "bus", 1.0, 0.08))
+
+    assert asyncio.run(run()) is False